@@ -8,11 +8,16 @@
 import os
 import sys
 import json
+import argparse
 import pandas as pd
 import pymysql
 from datetime import datetime
 from dotenv import load_dotenv
 
+# 引入公共导入工具包（位于 src/common/importer）
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src', 'common'))
+from importer import readers, batch, metrics, db, reports # noqa: E402
+
 # 加载环境变量
 load_dotenv()
 
@@ -40,6 +45,24 @@ def connect_db():
         print(f"❌ 数据库连接失败: {e}")
         sys.exit(1)
 
+def connect_read_db():
+    """
+    连接只读副本（按环境变量 DB_READ_DSN/DB_READ_HOST 配置）
+
+    返回:
+        副本连接；未配置副本或连接失败时返回None，查找改用主库
+    """
+    params = db.read_connection_params()
+    if params is None:
+        return None
+    try:
+        connection = pymysql.connect(**{**DB_CONFIG, **params})
+        print(f"✅ 客户查找使用只读副本: {params['host']}")
+        return connection
+    except Exception as e:
+        print(f"⚠️  只读副本连接失败，客户查找改用主库: {e}")
+        return None
+
 def parse_date(date_value):
     """解析日期字段"""
     if pd.isna(date_value) or date_value == '' or date_value is None:
@@ -76,16 +99,19 @@ def parse_amount(amount_value):
     # 转换为字符串并去除首尾空格
     return str(amount_value).strip()
 
-def read_excel_data():
+def read_excel_data(file_path=EXCEL_FILE):
     """读取 Excel 文件"""
     try:
-        if not os.path.exists(EXCEL_FILE):
-            print(f"❌ 文件不存在: {EXCEL_FILE}")
+        if not os.path.exists(file_path):
+            print(f"❌ 文件不存在: {file_path}")
             sys.exit(1)
         
-        df = pd.read_excel(EXCEL_FILE)
+        if readers.data_extension(file_path) in readers.COLUMNAR_EXTENSIONS:
+            df = readers.read_columnar(file_path)
+        else:
+            df = readers.read_excel_sheets(file_path, key_column='企业名称')
         print(f"✅ 成功读取 Excel 文件，共 {len(df)} 行数据")
-        print(f"📋 表头: {list(df.columns)}")
+        print(f"📋 表头: {[col for col in df.columns if col not in readers.SOURCE_COLUMNS]}")
         return df
     except Exception as e:
         print(f"❌ 读取 Excel 文件失败: {e}")
@@ -97,6 +123,53 @@ def get_customer_by_name(cursor, company_name):
     cursor.execute(sql, (company_name,))
     return cursor.fetchone()
 
+def get_customers_by_names(cursor, company_names, batch_size=db.IN_BATCH_SIZE):
+    """根据企业名称批量查询客户，返回 {企业名称: 客户}"""
+    customers = {}
+    names = list(company_names)
+    for offset in range(0, len(names), batch_size):
+        chunk = names[offset:offset + batch_size]
+        sql = (
+            "SELECT id, companyName, actualResponsibles, administrativeLicense, updateTime "
+            f"FROM sys_customer WHERE companyName IN ({', '.join(['%s'] * len(chunk))})"
+        )
+        cursor.execute(sql, chunk)
+        for customer in cursor.fetchall():
+            customers.setdefault(customer['companyName'], customer)
+    return customers
+
+def confirm_customers_on_primary(cursor, customers, company_names, batch_size=db.IN_BATCH_SIZE):
+    """
+    副本查询结果的一致性校验（在写入前、主库事务中执行）
+
+    按主键比较副本与主库的 updateTime，不一致的客户改用主库数据；
+    副本中不存在的企业名称在主库上重新查找。结果直接修正 customers。
+
+    返回:
+        被主库数据修正的客户数量
+    """
+    ids = [customer['id'] for customer in customers.values()]
+    primary_times = {}
+    for offset in range(0, len(ids), batch_size):
+        chunk = ids[offset:offset + batch_size]
+        cursor.execute(
+            f"SELECT id, updateTime FROM sys_customer WHERE id IN ({', '.join(['%s'] * len(chunk))})",
+            chunk
+        )
+        primary_times.update((row['id'], row['updateTime']) for row in cursor.fetchall())
+
+    # 主库中已被修改或删除的客户
+    stale = {
+        name for name, customer in customers.items()
+        if customer['id'] not in primary_times or primary_times[customer['id']] != customer['updateTime']
+    }
+    recheck = stale | (set(company_names) - set(customers))
+    for name in stale:
+        customers.pop(name, None)
+    fresh = get_customers_by_names(cursor, recheck, batch_size)
+    customers.update(fresh)
+    return len(stale | set(fresh))
+
 def create_new_customer(cursor, company_name, actual_responsible, administrative_license):
     """创建新客户"""
     sql = """
@@ -169,16 +242,55 @@ def update_customer(cursor, customer_id, actual_responsible, administrative_lice
     
     cursor.execute(sql, (responsibles_json, licenses_json, customer_id))
 
-def import_data():
-    """导入数据主函数"""
+@metrics.track('admin_license')
+def import_data(file_path=EXCEL_FILE, connection=None, read_connection=None, preview=False):
+    """
+    导入数据主函数
+
+    参数:
+        file_path: Excel 文件路径
+        connection: 数据库连接，批量导入时由调用方传入以复用连接
+        read_connection: 只读副本连接，默认按环境变量创建，未配置时客户查找使用主库
+        preview: 只读预览，只查询客户并统计预计新建和更新的企业，不写入数据库
+    """
+    run_metrics = metrics.current()
+    run_metrics.stage('read')
+    
     # 读取 Excel 数据
-    df = read_excel_data()
+    df = read_excel_data(file_path)
+    run_metrics.rows_read = len(df)
     
-    # 连接数据库
-    connection = connect_db()
+    # 连接数据库（批量导入时复用调用方的连接，由调用方负责关闭）
+    owns_connection = connection is None
+    if owns_connection:
+        connection = connect_db()
+    owns_read_connection = read_connection is None
+    if owns_read_connection:
+        read_connection = connect_read_db()
     
     try:
-        cursor = connection.cursor()
+        cursor = run_metrics.wrap_cursor(connection.cursor())  # 统计数据库往返次数
+        
+        # 配置了只读副本时，一次性在副本上查询文件中的全部企业，并在写入前用主库校验
+        prefetched = None
+        if read_connection is not None:
+            run_metrics.stage('lookup')
+            company_names = {
+                str(name).strip() for name in df.get('企业名称', pd.Series(dtype=object)).dropna()
+                if str(name).strip()
+            }
+            read_cursor = run_metrics.wrap_cursor(read_connection.cursor())
+            try:
+                prefetched = get_customers_by_names(read_cursor, company_names)
+            finally:
+                read_cursor.close()
+            corrected = confirm_customers_on_primary(cursor, prefetched, company_names)
+            if corrected:
+                print(f"🔄 一致性校验: {corrected} 个客户以主库数据为准（副本延迟）")
+        # 本次导入中已写入过的企业需要读取本事务内的最新数据，只能查主库
+        touched_companies = set()
+        
+        run_metrics.stage('write')
         
         # 统计信息
         created_companies = []
@@ -203,11 +315,11 @@ def import_data():
                 
                 # 验证必填字段
                 if not company_name:
-                    error_records.append(f"第 {index + 2} 行: 企业名称为空")
+                    error_records.append(f"{readers.row_label(df, index)}: 企业名称为空")
                     continue
                 
                 if not license_type:
-                    error_records.append(f"第 {index + 2} 行 ({company_name}): 行政许可类型为空")
+                    error_records.append(f"{readers.row_label(df, index)} ({company_name}): 行政许可类型为空")
                     continue
                 
                 # 构建实际负责人对象
@@ -226,10 +338,25 @@ def import_data():
                     'remarks': remarks if remarks else None
                 }
                 
+                # 预览不写入：文件中较早的行已新建的企业，后续行计为更新
+                if preview:
+                    seen_before = company_name in touched_companies
+                
                 # 查询客户是否存在
-                customer = get_customer_by_name(cursor, company_name)
+                if prefetched is not None and company_name not in touched_companies:
+                    customer = prefetched.get(company_name)
+                else:
+                    customer = get_customer_by_name(cursor, company_name)
+                touched_companies.add(company_name)
                 
-                if customer:
+                if preview:
+                    if customer or seen_before:
+                        updated_companies.append(company_name)
+                        print(f"✏️  预计更新: {company_name} - {license_type}")
+                    else:
+                        created_companies.append(company_name)
+                        print(f"➕ 预计新建: {company_name} - {license_type}")
+                elif customer:
                     # 更新现有客户
                     update_customer(
                         cursor,
@@ -253,12 +380,31 @@ def import_data():
                     print(f"➕ 新建: {company_name} (ID: {new_id}) - {license_type}")
                 
             except Exception as e:
-                error_msg = f"第 {index + 2} 行 ({company_name if 'company_name' in locals() else '未知'}): {str(e)}"
+                error_msg = f"{readers.row_label(df, index)} ({company_name if 'company_name' in locals() else '未知'}): {str(e)}"
                 error_records.append(error_msg)
                 print(f"❌ {error_msg}")
         
+        if preview:
+            # 预览模式没有写入，结束只读查询开启的事务
+            connection.rollback()
+            print(f"\n🔍 预览完成: 预计新建 {len(created_companies)} 个企业，更新 {len(updated_companies)} 个企业，错误记录 {len(error_records)} 条\n")
+            run_metrics.rows_failed = len(error_records)
+            return {
+                'success': True,
+                'preview': True,
+                'total': len(df),
+                'projected': reports.projected_counts(
+                    inserts=len(created_companies),
+                    updates=len(updated_companies),
+                    validation_failures=len(error_records)
+                ),
+                'errors': error_records
+            }
+        
         # 提交事务
         connection.commit()
+        run_metrics.rows_written = len(created_companies) + len(updated_companies)
+        run_metrics.rows_failed = len(error_records)
         
         # 打印统计信息
         print("\n" + "="*60)
@@ -282,17 +428,47 @@ def import_data():
         
         print("\n✅ 数据导入成功！\n")
         
+        return {
+            'success': True,
+            'total': len(df),
+            'created_count': len(created_companies),
+            'updated_count': len(updated_companies),
+            'error_count': len(error_records),
+            'errors': error_records
+        }
+        
     except Exception as e:
         connection.rollback()
         print(f"\n❌ 导入失败，已回滚: {e}\n")
         raise
     finally:
         cursor.close()
-        connection.close()
+        if owns_connection:
+            connection.close()
+        if owns_read_connection and read_connection is not None:
+            read_connection.close()
 
 if __name__ == '__main__':
     print("\n" + "="*60)
     print("行政许可数据导入工具")
     print("="*60 + "\n")
     
-    import_data()
+    parser = argparse.ArgumentParser(description='导入行政许可数据')
+    parser.add_argument('--file', nargs='+', default=[EXCEL_FILE], help='Excel文件路径，可传入多个文件、目录或zip压缩包')
+    parser.add_argument('--preview', action='store_true', help='只读预览：统计预计新建、更新的企业和错误记录，不写入数据库')
+    args = parser.parse_args()
+    
+    if batch.is_batch_input(args.file):
+        # 多个文件共享同一个数据库连接，每个文件单独提交
+        connection = connect_db()
+        read_connection = connect_read_db()
+        try:
+            with batch.collect_input_files(args.file) as files:
+                summary = batch.run_batch(files, lambda path: import_data(path, connection=connection, read_connection=read_connection, preview=args.preview))
+        finally:
+            connection.close()
+            if read_connection is not None:
+                read_connection.close()
+        sys.exit(0 if summary['success'] else 1)
+    
+    import_data(args.file[0], preview=args.preview)
@@ -0,0 +1,6 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据导入脚本公共工具包
+供客户、薪资等模块的 Python 导入脚本共用
+"""
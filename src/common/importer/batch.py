@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量导入工具
+一次调用导入多个文件（文件列表、目录或zip压缩包），
+各文件共享同一个数据库引擎和参考数据快照
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import zipfile
+from contextlib import contextmanager
+from . import readers
+
+# 批量导入时识别的数据文件扩展名（含 gzip 压缩的数据文件）
+DATA_EXTENSIONS = readers.DATA_EXTENSIONS + tuple(ext + '.gz' for ext in readers.DATA_EXTENSIONS)
+
+def _is_multi_file_archive(path):
+    """只包含一个数据文件的zip按单个压缩文件流式读取，包含多个文件时才按批量处理"""
+    return path.lower().endswith('.zip') and readers.zip_data_member_count(path) > 1
+
+def is_batch_input(paths):
+    """判断命令行传入的路径是否需要按批量模式处理（多个文件、目录或多文件zip压缩包）"""
+    if len(paths) != 1:
+        return True
+    path = paths[0]
+    return os.path.isdir(path) or _is_multi_file_archive(path)
+
+def _is_data_file(name):
+    base = os.path.basename(name)
+    # 跳过隐藏文件及 Excel 打开时产生的 ~$ 锁文件
+    if not base or base.startswith('.') or base.startswith('~$'):
+        return False
+    return base.lower().endswith(DATA_EXTENSIONS + ('.zip',))
+
+def _expand_file(display_name, path, temp_dir):
+    """多文件zip解压为其中的数据文件，其余文件（含只有一个数据文件的zip）按单个文件导入"""
+    if _is_multi_file_archive(path):
+        # 每个压缩包解压到单独的子目录，多个压缩包中的同名文件互不覆盖
+        return _extract_archive(path, tempfile.mkdtemp(dir=temp_dir))
+    return [(display_name, path)]
+
+def _extract_archive(archive_path, target_dir):
+    """解压zip中的数据文件，只保留文件名以避免路径穿越"""
+    extracted = []
+    with zipfile.ZipFile(archive_path) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or '__MACOSX' in info.filename or not info.filename.lower().endswith(DATA_EXTENSIONS):
+                continue
+            display_name = f"{os.path.basename(archive_path)}/{info.filename}"
+            target = os.path.join(target_dir, f"{len(extracted):04d}_{os.path.basename(info.filename)}")
+            with archive.open(info) as src, open(target, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            extracted.append((display_name, target))
+    return extracted
+
+@contextmanager
+def collect_input_files(paths):
+    """
+    展开命令行传入的路径
+
+    参数:
+        paths: 文件、目录或zip压缩包路径列表
+
+    返回:
+        [(显示名称, 本地文件路径), ...]，zip中的文件解压到临时目录，退出上下文后自动清理
+    """
+    temp_dir = tempfile.mkdtemp(prefix='import_batch_')
+    try:
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                for name in sorted(os.listdir(path)):
+                    full_path = os.path.join(path, name)
+                    if os.path.isfile(full_path) and _is_data_file(name):
+                        # 目录中的zip同样展开，不作为单个文件传给导入函数
+                        files.extend(_expand_file(full_path, full_path, temp_dir))
+            else:
+                files.extend(_expand_file(path, path, temp_dir))
+        yield files
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+class ReferenceCache:
+    """
+    参考数据快照缓存
+
+    同一次批量导入中，员工姓名、已存在客户等参考数据只查询一次，
+    由各文件共享；写入新数据后由导入脚本负责同步更新快照。
+    """
+
+    def __init__(self):
+        self._snapshots = {}
+
+    def get(self, key, loader):
+        """获取快照，首次访问时调用 loader() 加载"""
+        if key not in self._snapshots:
+            self._snapshots[key] = loader()
+        return self._snapshots[key]
+
+    def invalidate(self, key):
+        """丢弃快照，下次访问时重新加载"""
+        self._snapshots.pop(key, None)
+
+def result_success(result):
+    """兼容返回结果字典或布尔值的导入函数"""
+    if isinstance(result, dict):
+        return bool(result.get('success', True))
+    return bool(result)
+
+def run_batch(files, import_one):
+    """
+    依次导入每个文件并汇总结果
+
+    参数:
+        files: collect_input_files 返回的文件列表
+        import_one: 接收本地文件路径、返回导入结果的函数
+
+    返回:
+        汇总结果字典，同时以 BATCH_RESULT_JSON 输出便于Node.js解析
+    """
+    file_results = []
+    for position, (display_name, local_path) in enumerate(files, 1):
+        print(f"========== 批量导入 ({position}/{len(files)}): {display_name} ==========")
+        try:
+            result = import_one(local_path)
+        except Exception as e:
+            print(f"文件 {display_name} 导入异常: {str(e)}")
+            result = {'success': False, 'error_message': str(e)}
+        file_results.append({
+            'file': display_name,
+            'success': result_success(result),
+            'result': result if isinstance(result, dict) else None
+        })
+
+    succeeded = sum(1 for item in file_results if item['success'])
+    summary = {
+        'success': bool(file_results) and succeeded == len(file_results),
+        'total_files': len(file_results),
+        'succeeded_files': succeeded,
+        'failed_files': len(file_results) - succeeded,
+        'files': file_results
+    }
+    print(f"批量导入完成: 共 {len(file_results)} 个文件，成功 {succeeded} 个，失败 {len(file_results) - succeeded} 个")
+    print(f"BATCH_RESULT_JSON: {json.dumps(summary, ensure_ascii=False, default=str)}")
+    return summary
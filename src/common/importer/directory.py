@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+导入验证使用的参考名录
+在职员工姓名一次查询后规范化为集合，带版本标记缓存在进程内（批量导入共享）和本地文件中；
+业务选项（按类别）和宗族名单每次运行一次查询，缓存在进程内。
+导入脚本对整列做一次 isin 判断，不逐个单元格查询数据库
+"""
+
+import os
+import json
+import time
+import tempfile
+import numpy as np # type: ignore
+import pandas as pd # type: ignore
+from sqlalchemy import text # type: ignore
+from . import validation
+
+# 名录缓存文件及有效期（秒），可通过环境变量覆盖
+CACHE_FILE = os.environ.get('IMPORT_DIRECTORY_CACHE_FILE') or os.path.join(tempfile.gettempdir(), 'import_directory_cache.json')
+CACHE_TTL = int(os.environ.get('IMPORT_DIRECTORY_CACHE_TTL', '300'))
+
+# 在职员工姓名；同时统计行数和最近更新时间作为名录版本
+EMPLOYEE_QUERY = text("""
+    SELECT name, COUNT(*), MAX(updatedAt)
+    FROM sys_employees
+    WHERE (isResigned IS NULL OR isResigned = 0)
+    AND name IS NOT NULL
+    AND name != ''
+    GROUP BY name
+""")
+
+# 业务选项的取值（按类别）；IN 列表由调用方的类别生成
+OPTIONS_QUERY = "SELECT category, option_value FROM business_options WHERE category IN ({placeholders})"
+
+# 宗族ID和名称
+CLAN_QUERY = text("SELECT id, clanName FROM sys_clan")
+
+def _database_key(engine):
+    url = engine.url
+    return f"{url.host}:{url.port}/{url.database}"
+
+def _load_cached(kind, database_key):
+    try:
+        with open(CACHE_FILE, encoding='utf-8') as f:
+            entry = json.load(f).get(f"{kind}@{database_key}")
+        if entry and time.time() - entry['checked_at'] < CACHE_TTL:
+            return entry
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+def _save_cached(kind, database_key, entry):
+    try:
+        cache = {}
+        if os.path.exists(CACHE_FILE):
+            with open(CACHE_FILE, encoding='utf-8') as f:
+                cache = json.load(f)
+        cache[f"{kind}@{database_key}"] = {**entry, 'checked_at': time.time()}
+        temp_path = f"{CACHE_FILE}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(temp_path, CACHE_FILE)
+    except (OSError, ValueError):
+        pass
+
+def normalize_names(values):
+    """规范化姓名：去除首尾空白（含全角空格），空值和空字符串去掉"""
+    names = validation.normalize_key(pd.Series(list(values), dtype=object))
+    return set(names.dropna())
+
+def query_employee_directory(engine):
+    """
+    查询在职员工名录（一次查询）
+
+    返回:
+        {'names': 规范化后的姓名集合, 'version': 名录版本}
+    """
+    with engine.connect() as conn:
+        rows = conn.execute(EMPLOYEE_QUERY).fetchall()
+    total = sum(int(count) for _, count, _ in rows)
+    latest = max((str(updated) for _, _, updated in rows if updated is not None), default='')
+    return {
+        'names': normalize_names(name for name, _, _ in rows),
+        'version': f"{total}@{latest}"
+    }
+
+def employee_directory(engine, log=print):
+    """
+    获取在职员工名录
+
+    本地缓存文件在有效期内时直接使用，否则查询数据库并写入缓存；
+    批量导入时由调用方放入 ReferenceCache，整个运行最多查询一次。
+
+    返回:
+        {'names': 姓名集合, 'version': 名录版本, 'source': 'database' 或 'cache'}；
+        查询失败时返回None，调用方跳过姓名校验
+    """
+    log = log or (lambda message: None)
+    database_key = _database_key(engine)
+    cached = _load_cached('employees', database_key)
+    if cached is not None:
+        log(f"员工名录: 使用本地缓存（版本 {cached['version']}，{len(cached['names'])} 人）")
+        return {'names': set(cached['names']), 'version': cached['version'], 'source': 'cache'}
+    try:
+        directory = query_employee_directory(engine)
+    except Exception as e:
+        log(f"查询员工名录失败，跳过会计姓名校验: {str(e)}")
+        return None
+    _save_cached('employees', database_key, {'names': sorted(directory['names']), 'version': directory['version']})
+    log(f"员工名录: 查询到 {len(directory['names'])} 个在职员工姓名（版本 {directory['version']}）")
+    return {**directory, 'source': 'database'}
+
+def unknown_names(series, names):
+    """
+    不在名录中的姓名
+
+    参数:
+        series: 姓名列（可为 category 列）
+        names: 规范化后的姓名集合
+
+    返回:
+        布尔掩码，空值为 False
+    """
+    keys = validation.normalize_key(series)
+    return keys.notna() & ~keys.isin(names)
+
+def _refresh(directory, engine, log):
+    """用数据库中的最新名录替换本地缓存得到的名录（原地更新，批量导入中共享的快照一并更新）"""
+    try:
+        fresh = query_employee_directory(engine)
+    except Exception as e:
+        log(f"刷新员工名录失败: {str(e)}")
+        return False
+    _save_cached('employees', _database_key(engine), {'names': sorted(fresh['names']), 'version': fresh['version']})
+    directory.update(fresh, source='database')
+    log(f"员工名录已刷新: {len(fresh['names'])} 人（版本 {fresh['version']}）")
+    return True
+
+def employee_name_errors(frame, labels, engine, cache=None, log=print):
+    """
+    校验姓名列是否为在职员工
+
+    名录来自本地缓存且发现未知姓名时，从数据库刷新一次名录后重新判断，
+    避免刚录入的员工因缓存未过期被误判；每个运行最多查询一次名录。
+
+    参数:
+        frame: 数据
+        labels: {列名: 错误信息中使用的字段名称}，frame 中没有的列跳过
+        engine: 查询名录的数据库引擎
+        cache: 批量导入共享的 ReferenceCache
+
+    返回:
+        ({列名: (错误掩码, 按行的错误信息Series)}, 名录版本)；无法获取名录时为 ({}, None)
+    """
+    log = log or (lambda message: None)
+    columns = [column for column in labels if column in frame.columns]
+    if not columns or frame.empty:
+        return {}, None
+    if cache is not None:
+        directory = cache.get('employee_directory', lambda: employee_directory(engine, log))
+    else:
+        directory = employee_directory(engine, log)
+    if not directory or not directory['names']:
+        return {}, None
+
+    masks = {column: unknown_names(frame[column], directory['names']) for column in columns}
+    if directory['source'] == 'cache' and any(mask.any() for mask in masks.values()):
+        if _refresh(directory, engine, log):
+            masks = {column: unknown_names(frame[column], directory['names']) for column in columns}
+
+    results = {}
+    for column, mask in masks.items():
+        names = frame[column][mask].astype(str)
+        results[column] = (mask, labels[column] + "'" + names + "'不在在职员工名单中")
+    return results, directory['version']
+
+def query_dictionaries(engine, categories, log=print):
+    """
+    查询业务选项和宗族名单（一个连接，两次查询）
+
+    参数:
+        categories: 需要的业务选项类别
+
+    返回:
+        {'options': {类别: 规范化后的取值集合}, 'clans': {规范化后的宗族名称: 宗族ID}, 'clan_ids': 宗族ID集合}；
+        某一部分查询失败时该部分为空，调用方跳过对应的校验
+    """
+    log = log or (lambda message: None)
+    categories = sorted(set(categories))
+    options = {category: set() for category in categories}
+    clans = {}
+    with engine.connect() as conn:
+        if categories:
+            placeholders = ', '.join(f':c{i}' for i in range(len(categories)))
+            try:
+                rows = conn.execute(
+                    text(OPTIONS_QUERY.format(placeholders=placeholders)),
+                    {f'c{i}': category for i, category in enumerate(categories)}
+                ).fetchall()
+                values = {}
+                for category, value in rows:
+                    values.setdefault(category, []).append(value)
+                for category, category_values in values.items():
+                    options[category] = normalize_names(category_values)
+            except Exception as e:
+                log(f"查询业务选项失败，跳过业务选项校验: {str(e)}")
+        try:
+            for clan_id, name in conn.execute(CLAN_QUERY).fetchall():
+                clans[name] = int(clan_id)
+        except Exception as e:
+            log(f"查询宗族名单失败，跳过宗族校验: {str(e)}")
+    names = validation.normalize_key(pd.Series(list(clans), dtype=object))
+    return {
+        'options': options,
+        'clans': {name: clan_id for name, clan_id in zip(names, clans.values()) if isinstance(name, str)},
+        'clan_ids': set(clans.values())
+    }
+
+def reference_dictionaries(engine, categories, cache=None, log=print):
+    """获取业务选项和宗族名单，批量导入时放入 ReferenceCache，整个运行只查询一次"""
+    log = log or (lambda message: None)
+    def load():
+        try:
+            dictionaries = query_dictionaries(engine, categories, log)
+        except Exception as e:
+            log(f"查询业务选项和宗族名单失败，跳过业务选项和宗族校验: {str(e)}")
+            return None
+        counts = ', '.join(f"{category} {len(values)}" for category, values in dictionaries['options'].items())
+        log(f"业务选项: {counts or '无'}；宗族 {len(dictionaries['clan_ids'])} 个")
+        # 没有取值的类别对应的枚举字段不会被校验，需要明确提示（批量导入时结果被缓存，整个运行只提示一次）
+        for category, values in dictionaries['options'].items():
+            if not values:
+                log(f"警告: 业务选项类别 '{category}' 没有任何取值，对应的枚举字段不做校验")
+        return dictionaries
+    if cache is None:
+        return load()
+    return cache.get('business_dictionaries:' + ','.join(sorted(set(categories))), load)
+
+def option_values(series, allowed, synonyms=None):
+    """
+    枚举列规范化：去除首尾空白，同义词替换为规范值
+
+    返回:
+        (不在 allowed 中的非空值掩码, 规范值Series)
+    """
+    keys = validation.normalize_key(series)
+    if synonyms:
+        mapped = keys.map(synonyms)
+        keys = mapped.where(mapped.notna(), keys)
+    return keys.notna() & ~keys.isin(allowed), keys
+
+def enum_errors(frame, fields, dictionaries, synonyms=None):
+    """
+    校验枚举列是否为业务选项中的取值
+
+    参数:
+        frame: 数据
+        fields: {列名: (业务选项类别, 错误信息中使用的字段名称)}，frame 中没有的列跳过；
+            类别为 None 时只接受同义词的规范值
+        dictionaries: reference_dictionaries() 的结果；为 None（查询失败）时只校验类别为 None 的列
+        synonyms: {列名: {同义词: 规范值}}；规范值本身也是允许的取值
+
+    返回:
+        {列名: (错误掩码, 按行的错误信息Series, 规范值Series)}；
+        业务选项中没有该类别且没有同义词的列不校验（取值不受限）
+    """
+    synonyms = synonyms or {}
+    if frame.empty:
+        return {}
+    options = dictionaries['options'] if dictionaries is not None else {}
+    results = {}
+    for column in (column for column in fields if column in frame.columns):
+        category, label = fields[column]
+        column_synonyms = synonyms.get(column) or {}
+        allowed = (options.get(category, set()) if category else set()) | set(column_synonyms.values())
+        if not allowed:
+            continue
+        mask, keys = option_values(frame[column], allowed, column_synonyms)
+        values = frame[column][mask].astype(str)
+        results[column] = (mask, label + "'" + values + "'不是有效的选项", keys)
+    return results
+
+def clan_errors(series, dictionaries, label='宗族'):
+    """
+    校验宗族列：取值可以是宗族ID或宗族名称，名称转换为ID
+
+    返回:
+        (错误掩码, 按行的错误信息Series, 宗族ID Series（Int64）)；没有宗族名单时为 None
+    """
+    if dictionaries is None or not dictionaries['clan_ids'] or series.empty:
+        return None
+    if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+        present = series.notna()
+        numbers = series.astype(float)
+        by_name = pd.Series(np.nan, index=series.index)
+    else:
+        keys = validation.normalize_key(series)
+        present = keys.notna()
+        numbers = pd.to_numeric(keys, errors='coerce')
+        by_name = keys.map(dictionaries['clans']).astype(float)
+    ids = numbers.where(numbers.isin(dictionaries['clan_ids'])).fillna(by_name)
+    mask = present & ids.isna()
+    shown = series[mask].astype(object).map(lambda value: str(int(value)) if isinstance(value, float) and value.is_integer() else str(value))
+    return mask, label + "'" + shown + "'不存在", ids.astype('Int64')
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+导入数据的紧凑列类型
+取值种类少的字符串列使用 category（每行只存一个整数编码），紧凑列一直保留到数据库写入；
+其余文本列保持原样，与读取到的原始数据共享同一份存储（原始数据要保留到生成失败报告），
+不再另外编码一份
+"""
+
+import pandas as pd # type: ignore
+
+# 不同取值数量不超过非空行数的该比例时使用 category；
+# category 的每个取值是一个 Python 字符串，取值种类多时反而比共享的原始列占用更多内存
+CATEGORY_RATIO = 0.1
+
+def _only_strings(series):
+    """非空值是否全部为字符串；含数值、日期等其他类型的列保持原样，不影响类型验证"""
+    if isinstance(series.dtype, pd.StringDtype):
+        return True
+    if series.dtype != object:
+        return False
+    values = series.dropna()
+    return all(isinstance(value, str) for value in values)
+
+def compact_strings(frame, columns, ratio=CATEGORY_RATIO):
+    """
+    把 frame 中取值种类少的字符串列原地转换为 category
+
+    参数:
+        frame: 待转换的DataFrame
+        columns: 候选列，不存在或含非字符串值的列跳过
+        ratio: 选择 category 的基数比例
+
+    返回:
+        {列名: 选择的类型名称}
+    """
+    chosen = {}
+    for column in columns:
+        if column not in frame.columns or isinstance(frame[column].dtype, pd.CategoricalDtype):
+            continue
+        series = frame[column]
+        if not _only_strings(series):
+            continue
+        present = int(series.notna().sum())
+        if present == 0:
+            continue
+        if series.nunique(dropna=True) <= present * ratio:
+            frame[column] = series.astype('category')
+            chosen[column] = str(frame[column].dtype)
+    return chosen
+
+def memory_mb(frame, deep=False):
+    """
+    DataFrame 占用的内存（MB）
+
+    默认只统计列缓冲区，object 列中的字符串对象只按指针计算，不遍历数据；
+    deep=True 时逐个统计对象列中的字符串，需要对全部数据做一次遍历，只在诊断时使用
+    """
+    return frame.memory_usage(deep=deep).sum() / 1024 / 1024
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+客户服务历程写入
+客户导入和客户更新共用：从同一份已验证的客户数据整体生成服务历程行，
+在客户数据写入的同一个事务中分批多行插入，客户数据回滚时服务历程一起回滚
+"""
+
+import pandas as pd # type: ignore
+from . import db, validation
+
+SERVICE_HISTORY_TABLE = 'sys_service_history'
+
+# 服务历程从客户数据中带入的字段
+SERVICE_HISTORY_FIELDS = [
+    'companyName', 'unifiedSocialCreditCode',
+    'consultantAccountant', 'bookkeepingAccountant',
+    'invoiceOfficer', 'enterpriseStatus', 'businessStatus'
+]
+
+# 服务历程关注的变更字段：至少有一个非空时才生成服务历程
+KEY_CHANGE_FIELDS = [
+    'consultantAccountant', 'bookkeepingAccountant',
+    'invoiceOfficer', 'enterpriseStatus', 'businessStatus'
+]
+
+def history_frame(data, current_time, require_change=False):
+    """
+    从客户数据生成服务历程行
+
+    参数:
+        data: 已验证的客户数据，列名与 sys_customer 字段一致，索引为原始行索引
+        current_time: 写入 createdAt/updatedAt 的时间
+        require_change: 只保留至少有一个 KEY_CHANGE_FIELDS 字段非空的行（客户更新使用）
+
+    返回:
+        服务历程DataFrame，索引与 data 一致
+    """
+    fields = [col for col in SERVICE_HISTORY_FIELDS if col in data.columns]
+    frame = data[fields].copy()
+    if require_change:
+        # 空字符串视为未变更，写入 NULL
+        changes = [col for col in KEY_CHANGE_FIELDS if col in frame.columns]
+        for col in changes:
+            frame[col] = frame[col].where(~validation.is_blank(frame[col]))
+        if changes:
+            frame = frame[frame[changes].notna().any(axis=1)].copy()
+        else:
+            frame = frame.iloc[0:0].copy()
+    frame['createdAt'] = current_time
+    frame['updatedAt'] = current_time
+    return frame
+
+def write_history(conn, frame, load_data=False):
+    """
+    在调用方的事务中写入服务历程
+
+    开启 LOAD DATA 时先尝试 LOAD DATA LOCAL INFILE，不可用时分批多行插入；
+    出错时直接抛出，由调用方回滚整个事务
+
+    返回:
+        写入行数
+    """
+    if frame.empty:
+        return 0
+    if load_data:
+        loaded = db.load_data_local(conn, SERVICE_HISTORY_TABLE, frame)
+        if loaded is not None:
+            return loaded
+    return db.insert_rows(conn, SERVICE_HISTORY_TABLE, frame)
+
+def batch_writer(frame):
+    """
+    生成 db.insert_bisecting 的 on_batch 回调：客户数据的每一批插入后，
+    在同一事务中写入这一批客户对应的服务历程
+    """
+    def write_batch(conn, indexes):
+        write_history(conn, frame.loc[frame.index.intersection(pd.Index(indexes))])
+    return write_batch
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+证照号码按列校验
+统一社会信用代码（GB 32100）、旧版15位税号（行政区划码 + GB 11714 组织机构代码）和
+18位居民身份证号码（GB 11643，ISO 7064 MOD 11-2 校验码）的长度、字符集和校验位
+用 NumPy 对整列一次计算：等长号码拼接成字符矩阵，查表得到字符数值后与权重矩阵相乘求校验位，
+只为不合格的行生成错误信息
+"""
+
+from datetime import date
+import numpy as np # type: ignore
+import pandas as pd # type: ignore
+from . import validation
+
+# 统一社会信用代码字符集（不使用 I、O、S、V、Z），字符在其中的位置即字符数值
+USCC_CHARSET = '0123456789ABCDEFGHJKLMNPQRTUWXY'
+USCC_LENGTH = 18
+# 第 i 位的权重为 3^i mod 31
+USCC_WEIGHTS = np.array([pow(3, i, 31) for i in range(USCC_LENGTH - 1)], dtype=np.int64)
+
+# 组织机构代码（GB 11714）：8位本体代码 + 1位校验码，本体代码为数字或大写字母
+ORG_CODE_WEIGHTS = np.array([3, 7, 9, 10, 5, 8, 4, 2], dtype=np.int64)
+ORG_CODE_CHECK = '0123456789X'
+TAX_NUMBER_LENGTHS = (15, 18)
+
+# 居民身份证号码：6位地址码 + 8位出生日期 + 3位顺序码 + 1位校验码（ISO 7064 MOD 11-2）
+RESIDENT_ID_LENGTH = 18
+RESIDENT_ID_WEIGHTS = np.array([pow(2, 17 - i, 11) for i in range(RESIDENT_ID_LENGTH - 1)], dtype=np.int64)
+# 加权和 mod 11 -> 校验码
+RESIDENT_ID_CHECK = '10X98765432'
+RESIDENT_ID_MIN_BIRTH = pd.Timestamp('1900-01-01')
+
+def _lookup_table(charset):
+    """ASCII 码 -> 字符数值，不在字符集中的字符为 -1"""
+    table = np.full(128, -1, dtype=np.int64)
+    for value, char in enumerate(charset):
+        table[ord(char)] = value
+    return table
+
+_USCC_VALUES = _lookup_table(USCC_CHARSET)
+# 组织机构代码本体中字母 A-Z 对应 10-35
+_ORG_CODE_VALUES = _lookup_table('0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ')
+
+def code_text(series):
+    """
+    号码列统一为去除空白、大写的字符串，空值为 NA
+
+    Excel 中按数字存储的号码（如15位税号）读出为浮点数，转为不带小数点的整数字符串
+    """
+    if not isinstance(series.dtype, (pd.CategoricalDtype, pd.StringDtype)):
+        series = series.map(
+            lambda value: str(int(value)) if isinstance(value, float) and value.is_integer() else value
+        )
+    return validation.normalize_key(series, upper=True)
+
+def char_matrix(codes, width):
+    """
+    等长的 ASCII 号码 -> (行数, width) 的字符码矩阵
+
+    调用方需保证 codes 中每个值都是长度为 width 的 ASCII 字符串
+    """
+    if len(codes) == 0:
+        return np.empty((0, width), dtype=np.uint8)
+    return np.frombuffer(''.join(codes).encode('ascii'), dtype=np.uint8).reshape(-1, width)
+
+def _ascii_of_length(codes, width):
+    """长度为 width 且只含数字和大写字母的号码"""
+    return codes.notna() & (codes.str.len() == width) & codes.str.fullmatch(r'[0-9A-Z]+').fillna(False).astype(bool)
+
+def _uscc_reasons(codes, label):
+    """
+    校验长度为18、只含数字和大写字母的统一社会信用代码
+
+    返回:
+        {行索引: 错误信息}
+    """
+    if codes.empty:
+        return {}
+    matrix = char_matrix(codes.tolist(), USCC_LENGTH)
+    values = _USCC_VALUES[matrix]
+    reasons = {}
+
+    # 字符集：不使用 I、O、S、V、Z
+    bad_char = (values < 0).any(axis=1)
+    if bad_char.any():
+        first_bad = (values[bad_char] < 0).argmax(axis=1)
+        for index, position, code in zip(codes.index[bad_char], first_bad, codes[bad_char]):
+            reasons[index] = f"{label}第{position + 1}位'{code[position]}'不是有效字符（不使用I、O、S、V、Z）"
+
+    # 第3-8位为登记管理机关行政区划码，只能是数字
+    region_bad = ~bad_char & (values[:, 2:8] > 9).any(axis=1)
+    for index in codes.index[region_bad]:
+        reasons[index] = f"{label}第3-8位（登记管理机关行政区划码）应为数字"
+
+    # 校验位：31 - (加权和 mod 31)，结果为31时取0
+    checked = ~bad_char & ~region_bad
+    expected = (31 - (values[:, :-1] * USCC_WEIGHTS).sum(axis=1) % 31) % 31
+    wrong_check = checked & (expected != values[:, -1])
+    for index, code, value in zip(codes.index[wrong_check], codes[wrong_check], expected[wrong_check]):
+        reasons[index] = f"{label}校验位错误：最后一位应为'{USCC_CHARSET[value]}'，实际为'{code[-1]}'"
+    return reasons
+
+def _org_code_reasons(codes, label):
+    """
+    校验15位税号的后9位组织机构代码（GB 11714），调用方保证号码长度为15且只含数字和大写字母
+
+    返回:
+        {行索引: 错误信息}
+    """
+    if codes.empty:
+        return {}
+    matrix = char_matrix(codes.tolist(), 15)
+    reasons = {}
+
+    # 前6位为行政区划码
+    region_bad = ((matrix[:, :6] < ord('0')) | (matrix[:, :6] > ord('9'))).any(axis=1)
+    for index in codes.index[region_bad]:
+        reasons[index] = f"{label}前6位（行政区划码）应为数字"
+
+    # 校验码：11 - (加权和 mod 11)，10 为 X，11 为 0
+    body = _ORG_CODE_VALUES[matrix[:, 6:14]]
+    expected = (11 - (body * ORG_CODE_WEIGHTS).sum(axis=1) % 11) % 11
+    actual = np.array([ORG_CODE_CHECK.find(chr(char)) for char in matrix[:, 14]], dtype=np.int64)
+    wrong_check = ~region_bad & (expected != actual)
+    for index, code, value in zip(codes.index[wrong_check], codes[wrong_check], expected[wrong_check]):
+        reasons[index] = f"{label}校验位错误：最后一位应为'{ORG_CODE_CHECK[value]}'，实际为'{code[-1]}'"
+    return reasons
+
+def _to_errors(index, reasons):
+    """{行索引: 错误信息} -> (错误掩码, 错误信息)，可直接传给 RowErrors.add"""
+    messages = pd.Series(reasons, dtype=object)
+    return index.isin(messages.index), messages
+
+def uscc_errors(series, label='统一社会信用代码'):
+    """
+    统一社会信用代码校验（GB 32100）：18位，数字或大写英文字母（不使用I、O、S、V、Z），
+    第3-8位为数字，最后一位为校验位
+
+    空值不校验（是否必填由调用方检查）；首尾空白和小写字母按规范化后的值校验
+
+    返回:
+        (错误掩码, 按行的错误信息Series)
+    """
+    codes = code_text(series)
+    present = codes.notna()
+    candidates = _ascii_of_length(codes, USCC_LENGTH)
+    reasons = _uscc_reasons(codes[candidates], label)
+
+    lengths = codes.str.len()
+    wrong_length = present & (lengths != USCC_LENGTH)
+    for index, length in lengths[wrong_length].items():
+        reasons[index] = f"{label}应为18位，实际为{int(length)}位"
+    bad_chars = present & ~wrong_length & ~candidates
+    for index in codes.index[bad_chars.to_numpy()]:
+        reasons[index] = f"{label}只能包含数字和大写英文字母"
+    return _to_errors(series.index, reasons)
+
+def tax_number_errors(series, label='税号'):
+    """
+    税号校验：18位按统一社会信用代码校验；15位旧版税号为6位行政区划码 + 9位组织机构代码，
+    校验组织机构代码的校验位
+
+    返回:
+        (错误掩码, 按行的错误信息Series)
+    """
+    codes = code_text(series)
+    present = codes.notna()
+    reasons = _uscc_reasons(codes[_ascii_of_length(codes, USCC_LENGTH)], label)
+    reasons.update(_org_code_reasons(codes[_ascii_of_length(codes, 15)], label))
+
+    lengths = codes.str.len()
+    wrong_length = present & ~lengths.isin(TAX_NUMBER_LENGTHS)
+    for index, length in lengths[wrong_length].items():
+        reasons[index] = f"{label}应为15位或18位，实际为{int(length)}位"
+    bad_chars = present & ~wrong_length & ~codes.str.fullmatch(r'[0-9A-Z]+').fillna(False).astype(bool)
+    for index in codes.index[bad_chars.to_numpy()]:
+        reasons[index] = f"{label}只能包含数字和大写英文字母"
+    return _to_errors(series.index, reasons)
+
+def resident_id_errors(frame, labels):
+    """
+    18位居民身份证号码校验：长度、字符集（前17位为数字，最后一位为数字或X）、
+    出生日期段（1900年以后、不晚于今天的有效日期）和校验码
+
+    多个身份证号列合并为一列后一次计算，空值不校验
+
+    参数:
+        frame: 数据
+        labels: {列名: 错误信息中使用的字段名称}，frame 中没有的列跳过
+
+    返回:
+        {列名: (错误掩码, 按行的错误信息Series)}
+    """
+    columns = [column for column in labels if column in frame.columns]
+    if not columns or frame.empty:
+        return {}
+    rows = len(frame)
+    # 各列首尾相接：合并后第 p 个值属于第 p // rows 列的第 p % rows 行
+    ids = pd.concat([code_text(frame[column]) for column in columns], ignore_index=True)
+    present = ids.notna()
+    lengths = ids.str.len()
+    well_formed = present & (lengths == RESIDENT_ID_LENGTH) & ids.str.fullmatch(r'[0-9]{17}[0-9X]').fillna(False).astype(bool)
+    reasons = {}
+
+    for position, length in lengths[present & (lengths != RESIDENT_ID_LENGTH)].items():
+        reasons[position] = f"应为18位，实际为{int(length)}位"
+    for position in ids.index[(present & (lengths == RESIDENT_ID_LENGTH) & ~well_formed).to_numpy()]:
+        reasons[position] = "只能包含数字，最后一位可为X"
+
+    candidates = ids[well_formed]
+    if not candidates.empty:
+        # 出生日期段
+        births = candidates.str.slice(6, 14)
+        parsed = pd.to_datetime(births, format='%Y%m%d', errors='coerce')
+        bad_birth = parsed.isna() | (parsed < RESIDENT_ID_MIN_BIRTH) | (parsed > pd.Timestamp(date.today()))
+        for position, birth in births[bad_birth].items():
+            reasons[position] = f"出生日期'{birth}'无效"
+
+        # 校验码：前17位加权和 mod 11 查表
+        matrix = char_matrix(candidates.tolist(), RESIDENT_ID_LENGTH)
+        digits = matrix[:, :-1].astype(np.int64) - ord('0')
+        expected = np.frombuffer(RESIDENT_ID_CHECK.encode('ascii'), dtype=np.uint8)[
+            (digits * RESIDENT_ID_WEIGHTS).sum(axis=1) % 11
+        ]
+        wrong_check = ~bad_birth.to_numpy() & (expected != matrix[:, -1])
+        for position, code, value in zip(candidates.index[wrong_check], candidates[wrong_check], expected[wrong_check]):
+            reasons[position] = f"校验码错误：最后一位应为'{chr(value)}'，实际为'{code[-1]}'"
+
+    # 按列拆回各行
+    column_reasons = [{} for _ in columns]
+    for position, reason in reasons.items():
+        number, row = divmod(position, rows)
+        column_reasons[number][frame.index[row]] = f"{labels[columns[number]]}{reason}"
+    return {
+        column: _to_errors(frame.index, column_reasons[number])
+        for number, column in enumerate(columns)
+    }
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+导入相关索引预检
+检查导入过程中的查找和覆盖删除所依赖的索引是否存在，结果在进程内和本地文件中缓存；
+缺少索引时输出可添加索引的DDL，并供导入脚本选择代价更低的查询方式
+"""
+
+import os
+import json
+import time
+import tempfile
+from datetime import date
+from sqlalchemy import text # type: ignore
+
+# 导入依赖的索引：(表名, 索引列)，索引列需为某个索引的前缀列
+REQUIRED_INDEXES = [
+    ('sys_customer', ('companyName',)),
+    ('sys_customer', ('unifiedSocialCreditCode',)),
+    ('sys_employees', ('name',)),
+    ('sys_attendance_deduction', ('name', 'yearMonth')),
+    ('sys_subsidy_summary', ('name', 'yearMonth')),
+    ('sys_social_insurance', ('name', 'yearMonth')),
+    ('sys_deposit', ('name', 'deductionDate')),
+    ('sys_friend_circle_payment', ('name', 'yearMonth')),
+]
+
+# 预检结果缓存文件及有效期（秒），可通过环境变量覆盖
+CACHE_FILE = os.environ.get('IMPORT_INDEX_CACHE_FILE') or os.path.join(tempfile.gettempdir(), 'import_index_preflight.json')
+CACHE_TTL = int(os.environ.get('IMPORT_INDEX_CACHE_TTL', '3600'))
+
+# 进程内缓存：数据库标识 -> {索引标识: 是否存在}
+_results = {}
+
+def _index_key(table, columns):
+    return f"{table}({','.join(columns)})"
+
+def _database_key(engine):
+    url = engine.url
+    return f"{url.host}:{url.port}/{url.database}"
+
+def index_ddl(table, columns):
+    """生成添加索引的DDL"""
+    name = f"idx_{table}_{'_'.join(columns)}"
+    return f"ALTER TABLE `{table}` ADD INDEX `{name}` ({', '.join(f'`{column}`' for column in columns)});"
+
+def _load_cached(database_key):
+    try:
+        with open(CACHE_FILE, encoding='utf-8') as f:
+            entry = json.load(f).get(database_key)
+        if entry and time.time() - entry['checked_at'] < CACHE_TTL:
+            return entry['indexes']
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+def _save_cached(database_key, indexes):
+    try:
+        cache = {}
+        if os.path.exists(CACHE_FILE):
+            with open(CACHE_FILE, encoding='utf-8') as f:
+                cache = json.load(f)
+        cache[database_key] = {'checked_at': time.time(), 'indexes': indexes}
+        temp_path = f"{CACHE_FILE}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(temp_path, CACHE_FILE)
+    except (OSError, ValueError):
+        pass
+
+def _query_index_columns(engine):
+    """从 information_schema 读取相关表的索引列：{表名: [[索引列...], ...]}"""
+    tables = sorted({table for table, _ in REQUIRED_INDEXES})
+    placeholders = ', '.join(f':table_{i}' for i in range(len(tables)))
+    query = text(f"""
+        SELECT TABLE_NAME, INDEX_NAME, COLUMN_NAME
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({placeholders})
+        ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX
+    """)
+    params = {f'table_{i}': table for i, table in enumerate(tables)}
+    indexes = {}
+    with engine.connect() as conn:
+        for table, index_name, column in conn.execute(query, params):
+            indexes.setdefault(table, {}).setdefault(index_name, []).append(column)
+    return {table: list(by_name.values()) for table, by_name in indexes.items()}
+
+def _covered(index_columns, columns):
+    """索引列以所需列为前缀时，等值查找和范围条件才能使用该索引"""
+    return any(
+        [column.lower() for column in existing[:len(columns)]] == [column.lower() for column in columns]
+        for existing in index_columns
+    )
+
+def preflight(engine, log=print):
+    """
+    检查导入依赖的索引
+
+    返回:
+        {索引标识: 是否存在}；非MySQL数据库或检查失败时返回空字典
+    """
+    if engine is None or engine.dialect.name != 'mysql':
+        return {}
+    database_key = _database_key(engine)
+    if database_key in _results:
+        return _results[database_key]
+
+    log = log or (lambda message: None)
+    indexes = _load_cached(database_key)
+    if indexes is None:
+        try:
+            index_columns = _query_index_columns(engine)
+        except Exception as e:
+            log(f"索引预检失败: {str(e)}")
+            _results[database_key] = {}
+            return {}
+        indexes = {
+            _index_key(table, columns): _covered(index_columns.get(table, []), columns)
+            for table, columns in REQUIRED_INDEXES
+        }
+        _save_cached(database_key, indexes)
+        missing = [(table, columns) for table, columns in REQUIRED_INDEXES if not indexes[_index_key(table, columns)]]
+        if missing:
+            log(f"索引预检: 缺少 {len(missing)} 个导入依赖的索引，相关查找和覆盖删除将逐行扫描全表，可执行以下DDL添加:")
+            for table, columns in missing:
+                log(f"  {index_ddl(table, columns)}")
+        else:
+            log("索引预检: 导入依赖的索引均已存在")
+
+    _results[database_key] = indexes
+    return indexes
+
+def has_index(engine, table, columns):
+    """
+    判断表上是否有以 columns 为前缀的索引
+
+    未做过预检或无法判断时返回True，导入脚本保持原有的逐行查询方式
+    """
+    indexes = preflight(engine, log=None)
+    return indexes.get(_index_key(table, tuple(columns)), True)
+
+def month_bounds(year_month):
+    """
+    获取年月（YYYY-MM）对应的日期范围 [当月1日, 下月1日)
+
+    用于把 DATE_FORMAT(col, '%Y-%m') = :year_month 改写为可以使用索引的范围条件
+    """
+    year, month = int(year_month[:4]), int(year_month[5:7])
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+def _month_name_batches(date_column, name_months, batch_size):
+    """按年月分组姓名，生成 (WHERE 条件, 参数)，每个年月的姓名按 batch_size 分批"""
+    names_by_month = {}
+    for name, year_month in name_months:
+        if name and year_month:
+            names_by_month.setdefault(year_month, set()).add(name)
+
+    for year_month, names in names_by_month.items():
+        start, end = month_bounds(year_month)
+        names = sorted(names)
+        for offset in range(0, len(names), batch_size):
+            chunk = names[offset:offset + batch_size]
+            placeholders = ', '.join(f':name_{i}' for i in range(len(chunk)))
+            params = {f'name_{i}': name for i, name in enumerate(chunk)}
+            params.update({'month_start': start, 'month_end': end})
+            condition = f"{date_column} >= :month_start AND {date_column} < :month_end AND name IN ({placeholders})"
+            yield condition, params
+
+def bulk_delete_months(conn, table, date_column, name_months, batch_size=500):
+    """
+    按年月批量删除指定姓名的现有记录（覆盖模式在没有 (name, 日期列) 索引时使用）
+
+    每个年月只执行一次删除，避免逐行删除时每行都扫描全表。
+
+    参数:
+        conn: 数据库连接（与后续插入处于同一事务）
+        table: 表名
+        date_column: 日期列名
+        name_months: [(姓名, 'YYYY-MM'), ...]
+
+    返回:
+        删除的记录数
+    """
+    deleted = 0
+    for condition, params in _month_name_batches(date_column, name_months, batch_size):
+        result = conn.execute(text(f"DELETE FROM {table} WHERE {condition}"), params)
+        deleted += result.rowcount
+    return deleted
+
+def delete_name_months(conn, table, date_column, name_months):
+    """
+    按 (姓名, 年月) 逐对删除现有记录（覆盖模式在有 (name, 日期列) 索引时使用）
+
+    每对使用姓名等值和日期范围条件，可以使用索引；全部删除语句一次 executemany 发送。
+
+    参数与返回值同 bulk_delete_months
+    """
+    params = []
+    for name, year_month in dict.fromkeys(name_months):
+        if name and year_month:
+            start, end = month_bounds(year_month)
+            params.append({'name': name, 'month_start': start, 'month_end': end})
+    if not params:
+        return 0
+    result = conn.execute(text(f"""
+        DELETE FROM {table}
+        WHERE name = :name
+        AND {date_column} >= :month_start AND {date_column} < :month_end
+    """), params)
+    return max(result.rowcount, 0)
+
+def count_existing_months(conn, table, date_column, name_months, batch_size=500):
+    """
+    统计覆盖模式将会删除的现有记录数（预览模式使用，只读）
+
+    参数与 bulk_delete_months 相同
+    """
+    existing = 0
+    for condition, params in _month_name_batches(date_column, name_months, batch_size):
+        existing += conn.execute(text(f"SELECT COUNT(*) FROM {table} WHERE {condition}"), params).scalar() or 0
+    return existing
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+导入指标统计
+每次导入结束后把读取/写入/失败行数、各阶段耗时、本次导入的峰值内存和数据库往返次数
+累加到本地的 Prometheus textfile 格式指标文件中，供 node_exporter 采集
+"""
+
+import os
+import re
+import time
+import tempfile
+import functools
+from collections import OrderedDict
+from . import batch, sqlprofile
+from .reports import REPORT_DIR
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，不加文件锁
+    fcntl = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# 指标文件路径，可通过环境变量覆盖（通常指向 node_exporter 的 textfile 目录）
+METRICS_FILE = os.environ.get('IMPORT_METRICS_FILE') or os.path.join(tempfile.gettempdir(), 'import_metrics.prom')
+
+# 直方图分桶
+DURATION_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+RSS_BUCKETS = tuple(mb * 1024 * 1024 for mb in (64, 128, 256, 512, 1024, 2048, 4096))
+ROUND_TRIP_BUCKETS = (1, 10, 100, 1000, 10000, 100000)
+
+# 指标定义：名称 -> (类型, 说明)
+METRIC_FAMILIES = OrderedDict([
+    ('importer_runs_total', ('counter', '导入执行次数')),
+    ('importer_rows_read_total', ('counter', '读取的数据行数')),
+    ('importer_rows_written_total', ('counter', '写入数据库的行数')),
+    ('importer_rows_failed_total', ('counter', '导入失败的行数')),
+    ('importer_db_round_trips_total', ('counter', '数据库往返次数')),
+    ('importer_stage_duration_seconds', ('histogram', '各阶段耗时（秒），stage="total" 为整次导入')),
+    ('importer_peak_rss_bytes', ('histogram', '单次导入期间进程的峰值常驻内存（字节）')),
+    ('importer_process_peak_rss_bytes', ('gauge', '导入进程整个生命周期的峰值常驻内存（字节），无法按次统计的平台上使用')),
+    ('importer_db_round_trips_per_run', ('histogram', '单次导入的数据库往返次数')),
+    ('importer_last_run_timestamp_seconds', ('gauge', '最近一次导入结束的时间戳')),
+])
+
+_SAMPLE_PATTERN = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{.*\})?\s+(\S+)$')
+
+def _labels(**labels):
+    """生成标签字符串，标签顺序固定以便与已有样本合并"""
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}'
+
+def _family_of(name):
+    for suffix in ('_bucket', '_sum', '_count'):
+        if name.endswith(suffix) and name[:-len(suffix)] in METRIC_FAMILIES:
+            return name[:-len(suffix)]
+    return name
+
+def _format_value(value):
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else _format_value(bound)
+
+def _process_peak_rss_bytes():
+    """
+    当前进程及已结束子进程（并行解析工作表的进程池）整个生命周期的峰值常驻内存
+
+    ru_maxrss 无法重置，批量导入时后面的文件会得到之前文件的峰值，只用作进程级指标
+    """
+    if resource is None:
+        return None
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    )
+    # Linux 下 ru_maxrss 单位为KB，macOS 下为字节
+    return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+def _reset_peak_rss():
+    """
+    重置当前进程的峰值常驻内存（Linux 的 VmHWM，向 /proc/self/clear_refs 写入 5）
+
+    返回:
+        是否重置成功；其他平台或没有权限时返回False
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def _current_peak_rss_bytes():
+    """上次重置以来当前进程的峰值常驻内存（VmHWM）；无法读取时返回None"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+class _CountingCursor:
+    """为 pymysql 等 DB-API 游标统计 execute 调用次数的代理"""
+
+    def __init__(self, cursor, run_metrics):
+        self._cursor = cursor
+        self._metrics = run_metrics
+
+    def execute(self, query, args=None):
+        self._metrics.db_round_trips += 1
+        return self._profiled(self._cursor.execute, query, args, False)
+
+    def executemany(self, query, args):
+        self._metrics.db_round_trips += 1
+        return self._profiled(self._cursor.executemany, query, args, True)
+
+    def _profiled(self, execute, query, args, executemany):
+        recorder = self._metrics.statements
+        if recorder is None:
+            return execute(query, args)
+        token = recorder.before_execute(self._cursor, query, args, executemany)
+        try:
+            return execute(query, args)
+        finally:
+            recorder.after_execute(token)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class ImportMetrics:
+    """
+    单次导入的指标记录
+
+    stage(name) 开始一个新阶段并结束上一个阶段，不需要改动原有代码的缩进；
+    rows_read/rows_written/rows_failed 由导入脚本在得到结果后赋值。
+    success 默认根据导入函数的返回值判断。
+    """
+
+    def __init__(self, importer):
+        self.importer = importer
+        self.rows_read = 0
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.db_round_trips = 0
+        self.success = None  # 不通过返回值判断成败的脚本可直接赋值
+        self.peak_rss = None  # 本次导入期间的峰值常驻内存，finish() 时确定；无法按次统计时为None
+        self._peak_rss_tracked = False
+        self._nested_peak_rss = 0
+        self.stage_durations = OrderedDict()
+        self._started = time.perf_counter()
+        self._stage = None
+        self._stage_started = None
+        self._engines = []
+        # SQL诊断模式下记录每条语句及其执行计划
+        self.statements = sqlprofile.StatementRecorder(importer) if sqlprofile.enabled() else None
+
+    def stage(self, name):
+        """开始记录新阶段（read/validate/lookup/write 等）"""
+        self._end_stage()
+        self._stage = name
+        self._stage_started = time.perf_counter()
+
+    def _end_stage(self):
+        if self._stage is not None:
+            elapsed = time.perf_counter() - self._stage_started
+            self.stage_durations[self._stage] = self.stage_durations.get(self._stage, 0.0) + elapsed
+            self._stage = None
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.db_round_trips += 1
+
+    def attach_engine(self, engine):
+        """统计 SQLAlchemy 引擎上执行的语句数量（每次游标执行计为一次往返）"""
+        if engine is None or engine in self._engines:
+            return
+        from sqlalchemy import event # type: ignore
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+        if self.statements is not None:
+            self.statements.attach_engine(engine)
+        self._engines.append(engine)
+
+    def wrap_cursor(self, cursor):
+        """包装 DB-API 游标以统计往返次数"""
+        return _CountingCursor(cursor, self)
+
+    def _detach_engines(self):
+        from sqlalchemy import event # type: ignore
+        for engine in self._engines:
+            event.remove(engine, 'before_cursor_execute', self._on_execute)
+            if self.statements is not None:
+                self.statements.detach_engine(engine)
+        self._engines = []
+
+    def start_peak_rss(self, parent=None):
+        """
+        开始统计本次导入的峰值常驻内存
+
+        重置进程的 VmHWM；嵌套在另一次导入中时，先把重置前的峰值记入外层导入
+        （并行解析工作表的子进程不计入）
+        """
+        if parent is not None:
+            parent.note_peak_rss()
+        self._peak_rss_tracked = _reset_peak_rss()
+
+    def note_peak_rss(self):
+        """记下当前的峰值常驻内存，VmHWM 被内层导入重置后仍计入本次导入"""
+        if self._peak_rss_tracked:
+            self._nested_peak_rss = max(self._nested_peak_rss, _current_peak_rss_bytes() or 0)
+
+    def finish(self, success, log=print):
+        """结束记录并把本次导入的指标累加到指标文件"""
+        self._end_stage()
+        if self._peak_rss_tracked:
+            peak = _current_peak_rss_bytes()
+            self.peak_rss = max(peak, self._nested_peak_rss) if peak is not None else None
+        if self._engines:
+            self._detach_engines()
+        self.stage_durations['total'] = time.perf_counter() - self._started
+        if self.statements is not None:
+            try:
+                self.statements.report(REPORT_DIR, log=log)
+            except Exception as e:
+                if log:
+                    log(f"生成SQL诊断报告失败: {str(e)}")
+        try:
+            update_metrics_file(self, success)
+        except Exception as e:
+            # 指标写入失败不影响导入结果
+            if log:
+                log(f"写入导入指标失败: {str(e)}")
+
+def _read_samples(path):
+    samples = OrderedDict()
+    if not os.path.exists(path):
+        return samples
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            match = _SAMPLE_PATTERN.match(line.strip())
+            if match:
+                samples[(match.group(1), match.group(2) or '')] = float(match.group(3))
+    return samples
+
+def _write_samples(path, samples):
+    families = OrderedDict((name, []) for name in METRIC_FAMILIES)
+    for (name, labels), value in samples.items():
+        families.setdefault(_family_of(name), []).append(f"{name}{labels} {_format_value(value)}")
+
+    lines = []
+    for family, family_lines in families.items():
+        if not family_lines:
+            continue
+        if family in METRIC_FAMILIES:
+            metric_type, help_text = METRIC_FAMILIES[family]
+            lines.append(f"# HELP {family} {help_text}")
+            lines.append(f"# TYPE {family} {metric_type}")
+        lines.extend(family_lines)
+
+    # 先写临时文件再替换，避免采集方读到写了一半的文件
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(temp_path, path)
+
+def _add(samples, name, labels, value):
+    key = (name, labels)
+    samples[key] = samples.get(key, 0) + value
+
+def _observe(samples, name, buckets, value, **labels):
+    for bound in tuple(buckets) + (float('inf'),):
+        _add(samples, f"{name}_bucket", _labels(**labels, le=_format_bound(bound)), 1 if value <= bound else 0)
+    _add(samples, f"{name}_sum", _labels(**labels), value)
+    _add(samples, f"{name}_count", _labels(**labels), 1)
+
+def update_metrics_file(run_metrics, success, path=None):
+    """把一次导入的指标累加到指标文件，多个导入进程同时结束时通过文件锁串行更新"""
+    path = path or METRICS_FILE
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(f"{path}.lock", 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        samples = _read_samples(path)
+        importer = run_metrics.importer
+
+        _add(samples, 'importer_runs_total', _labels(importer=importer, status='success' if success else 'failure'), 1)
+        _add(samples, 'importer_rows_read_total', _labels(importer=importer), run_metrics.rows_read)
+        _add(samples, 'importer_rows_written_total', _labels(importer=importer), run_metrics.rows_written)
+        _add(samples, 'importer_rows_failed_total', _labels(importer=importer), run_metrics.rows_failed)
+        _add(samples, 'importer_db_round_trips_total', _labels(importer=importer), run_metrics.db_round_trips)
+
+        for stage, seconds in run_metrics.stage_durations.items():
+            _observe(samples, 'importer_stage_duration_seconds', DURATION_BUCKETS, seconds, importer=importer, stage=stage)
+        if run_metrics.peak_rss is not None:
+            _observe(samples, 'importer_peak_rss_bytes', RSS_BUCKETS, run_metrics.peak_rss, importer=importer)
+        else:
+            # 无法按次统计时只记录进程生命周期的峰值（取各进程中的最大值），不按文件计入直方图
+            process_peak = _process_peak_rss_bytes()
+            if process_peak is not None:
+                key = ('importer_process_peak_rss_bytes', _labels(importer=importer))
+                samples[key] = max(samples.get(key, 0), process_peak)
+        _observe(samples, 'importer_db_round_trips_per_run', ROUND_TRIP_BUCKETS, run_metrics.db_round_trips, importer=importer)
+
+        samples[('importer_last_run_timestamp_seconds', _labels(importer=importer))] = int(time.time())
+        _write_samples(path, samples)
+
+# 当前正在执行的导入（批量导入时逐个文件切换）
+_active = []
+
+def current():
+    """获取当前导入的指标记录；不在 track 包装的函数中调用时返回不会写入文件的记录"""
+    return _active[-1] if _active else ImportMetrics('untracked')
+
+def track(importer, log=print):
+    """
+    导入函数装饰器：为每次调用创建指标记录，函数返回或抛出异常后写入指标文件
+
+    参数:
+        importer: 导入脚本标识，作为指标的 importer 标签
+        log: 输出函数，标准输出需保持纯JSON的脚本传入None
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            run_metrics = ImportMetrics(importer)
+            run_metrics.start_peak_rss(_active[-1] if _active else None)
+            _active.append(run_metrics)
+            success = False
+            try:
+                result = func(*args, **kwargs)
+                success = batch.result_success(result)
+                return result
+            finally:
+                _active.pop()
+                if run_metrics.success is not None:
+                    success = run_metrics.success
+                run_metrics.finish(success, log=log)
+        return wrapper
+    return decorator
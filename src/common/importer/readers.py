@@ -0,0 +1,542 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+导入文件读取工具
+支持多工作表 Excel 文件的并行解析，并为每行数据标记来源工作表和行号；
+支持 gzip/zip 压缩的 CSV 和 Excel 文件，在内存中流式解压，不落盘；
+支持 Parquet 和 Arrow IPC 列式文件，按原始类型直接读取（需要 pyarrow）；
+支持 xlsx 工作表按固定行数分块流式读取，内存占用与工作表大小无关
+"""
+
+import os
+import gzip
+import zipfile
+import operator
+from array import array
+from functools import partial
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd # type: ignore
+
+# 来源标记列：记录每行数据所属的工作表及其在工作表中的行号，用于错误报告
+SHEET_COLUMN = '__sheet__'
+ROW_COLUMN = '__row__'
+SOURCE_COLUMNS = [SHEET_COLUMN, ROW_COLUMN]
+
+# 流式读取 xlsx 时每个数据块的行数，可通过环境变量覆盖
+CHUNK_ROWS = int(os.environ.get('IMPORT_CHUNK_ROWS', '10000'))
+
+# 多工作表 xlsx 不超过该大小（字节）时使用进程池并行解析，更大的文件逐块流式读取
+PARALLEL_MAX_BYTES = int(os.environ.get('IMPORT_PARALLEL_MAX_BYTES', str(20 * 1024 * 1024)))
+
+# 列式文件扩展名：Parquet 与 Arrow IPC（.arrow/.feather 为文件格式，.arrows 为流格式）
+COLUMNAR_EXTENSIONS = ('.parquet', '.arrow', '.feather', '.ipc', '.arrows')
+
+# 数据文件扩展名
+DATA_EXTENSIONS = ('.csv', '.xlsx', '.xls') + COLUMNAR_EXTENSIONS
+
+# 文件头魔数：用于识别没有内层扩展名的压缩文件（如 upload.gz）
+_XLSX_MAGIC = b'PK\x03\x04'
+_XLS_MAGIC = b'\xd0\xcf\x11\xe0'
+
+def _sniff_extension(header):
+    """根据文件头判断数据格式，无法识别时按CSV处理"""
+    if header.startswith(_XLSX_MAGIC):
+        return '.xlsx'
+    if header.startswith(_XLS_MAGIC):
+        return '.xls'
+    return '.csv'
+
+def _zip_data_member(archive):
+    """获取zip压缩包中唯一的数据文件，跳过目录和 __MACOSX 等附带文件"""
+    members = [
+        info for info in archive.infolist()
+        if not info.is_dir()
+        and '__MACOSX' not in info.filename
+        and not os.path.basename(info.filename).startswith(('.', '~$'))
+    ]
+    data_members = [info for info in members if info.filename.lower().endswith(DATA_EXTENSIONS)]
+    candidates = data_members or members
+    if len(candidates) != 1:
+        raise ValueError(f"压缩包中应只包含一个数据文件，实际找到 {len(candidates)} 个")
+    return candidates[0]
+
+def compression_of(path):
+    """返回文件的压缩格式：'gzip'、'zip' 或 None"""
+    name = str(path).lower()
+    if name.endswith('.gz'):
+        return 'gzip'
+    if name.endswith('.zip'):
+        return 'zip'
+    return None
+
+def zip_data_member_count(path):
+    """统计zip压缩包中的数据文件数量"""
+    with zipfile.ZipFile(path) as archive:
+        return sum(
+            1 for info in archive.infolist()
+            if not info.is_dir()
+            and '__MACOSX' not in info.filename
+            and info.filename.lower().endswith(DATA_EXTENSIONS)
+        )
+
+def data_extension(path):
+    """
+    获取数据文件的实际格式扩展名
+
+    压缩文件返回内层文件的扩展名，例如 'bank.csv.gz' 返回 '.csv'，
+    只含一个 report.xlsx 的 'report.zip' 返回 '.xlsx'
+    """
+    compression = compression_of(path)
+    if compression == 'gzip':
+        inner_ext = os.path.splitext(str(path)[:-3])[1].lower()
+        if inner_ext in DATA_EXTENSIONS:
+            return inner_ext
+        with gzip.open(path, 'rb') as stream:
+            return _sniff_extension(stream.read(8))
+    if compression == 'zip':
+        with zipfile.ZipFile(path) as archive:
+            member = _zip_data_member(archive)
+            inner_ext = os.path.splitext(member.filename)[1].lower()
+            if inner_ext in DATA_EXTENSIONS:
+                return inner_ext
+            with archive.open(member) as stream:
+                return _sniff_extension(stream.read(8))
+    return os.path.splitext(str(path))[1].lower()
+
+def open_csv(path):
+    """
+    获取可直接交给 pandas.read_csv 的数据源
+
+    gzip 文件返回流式解压的文件对象，zip 文件返回压缩包内数据文件的流，
+    解压在读取过程中进行，不会把解压后的文件写入磁盘。
+    每次调用都返回新的数据源，便于按不同编码重试读取。
+    """
+    compression = compression_of(path)
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'zip':
+        archive = zipfile.ZipFile(path)
+        return archive.open(_zip_data_member(archive))
+    return path
+
+def load_seekable_source(source):
+    """
+    获取可随机访问的数据源
+
+    Excel 和列式文件的解析需要可随机访问的文件，压缩文件在内存中解压为字节内容
+    """
+    if isinstance(source, (bytes, bytearray)) or hasattr(source, 'read'):
+        return source
+    compression = compression_of(source)
+    if compression == 'gzip':
+        with gzip.open(source, 'rb') as stream:
+            return stream.read()
+    if compression == 'zip':
+        with zipfile.ZipFile(source) as archive:
+            return archive.read(_zip_data_member(archive))
+    return source
+
+def decompress_bytes(content, filename):
+    """
+    解压内存中的上传内容（用于从标准输入读取文件的脚本）
+
+    返回:
+        (解压后的字节内容, 内层文件名)
+    """
+    compression = compression_of(filename)
+    if compression == 'gzip':
+        content = gzip.decompress(content)
+        inner_name = filename[:-3]
+    elif compression == 'zip':
+        with zipfile.ZipFile(BytesIO(content)) as archive:
+            member = _zip_data_member(archive)
+            content = archive.read(member)
+            inner_name = member.filename
+    else:
+        return content, filename
+    if os.path.splitext(inner_name)[1].lower() not in DATA_EXTENSIONS:
+        inner_name += _sniff_extension(content[:8])
+    return content, inner_name
+
+def _open_source(source):
+    """字节内容需要包装为文件对象后才能交给 pandas 读取"""
+    if isinstance(source, (bytes, bytearray)):
+        return BytesIO(source)
+    return source
+
+def column_filter(columns, key_column=None):
+    """
+    生成 pandas 的 usecols 参数：只解析 columns 中的列，文件中缺少的列忽略
+
+    使用 partial 而不是 lambda，可以传给并行解析工作表的子进程
+    """
+    needed = set(columns)
+    if key_column:
+        needed.add(key_column)
+    return partial(operator.contains, frozenset(needed))
+
+def list_sheet_names(source, engine=None):
+    """获取工作簿中的全部工作表名称"""
+    with pd.ExcelFile(_open_source(source), engine=engine) as workbook:
+        return list(workbook.sheet_names)
+
+def _read_sheet(source, sheet_name, engine, key_column, read_kwargs):
+    """
+    读取单个工作表（在子进程中执行）
+
+    返回:
+        带来源标记列的DataFrame；工作表为空或缺少关键列时返回None
+    """
+    df = pd.read_excel(_open_source(source), sheet_name=sheet_name, engine=engine, **read_kwargs)
+    if df.empty or len(df.columns) == 0:
+        return None
+    if key_column and key_column not in df.columns:
+        return None
+    df[SHEET_COLUMN] = sheet_name
+    df[ROW_COLUMN] = range(2, len(df) + 2)  # Excel行号从1开始，且有标题行
+    return df
+
+def read_excel_sheets(source, key_column=None, engine='openpyxl', max_workers=None, log=print, columns=None, **read_kwargs):
+    """
+    读取工作簿中的所有工作表并合并为一个DataFrame
+
+    多个工作表时使用进程池并行解析，耗时约等于最大工作表的解析时间。
+    多工作表的工作簿中缺少关键列 key_column 的工作表（如说明页）会被跳过；
+    只有一个工作表时始终读取，保持原有的缺列错误提示。
+
+    参数:
+        source: 文件路径（可为 .gz/.zip 压缩文件）或文件字节内容
+        key_column: 判断工作表是否为数据表的关键列名
+        engine: pandas 读取引擎
+        max_workers: 进程池大小，默认取工作表数量与CPU核数的较小值
+        log: 进度输出函数，标准输出需保持纯JSON的脚本传入None
+        columns: 只解析这些标题的列，默认解析全部列
+        read_kwargs: 透传给 pandas.read_excel 的参数
+
+    返回:
+        合并后的DataFrame，索引为连续整数，包含 SHEET_COLUMN 和 ROW_COLUMN 来源标记列
+    """
+    log = log or (lambda message: None)
+    if columns is not None:
+        read_kwargs['usecols'] = column_filter(columns, key_column)
+    source = load_seekable_source(source)
+    sheet_names = list_sheet_names(source, engine=engine)
+
+    if len(sheet_names) <= 1:
+        df = pd.read_excel(_open_source(source), sheet_name=0, engine=engine, **read_kwargs)
+        df[SHEET_COLUMN] = sheet_names[0] if sheet_names else ''
+        df[ROW_COLUMN] = range(2, len(df) + 2)
+        return df
+
+    workers = max_workers or min(len(sheet_names), os.cpu_count() or 1)
+    log(f"检测到 {len(sheet_names)} 个工作表，使用 {workers} 个进程并行解析")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_read_sheet, source, name, engine, key_column, read_kwargs)
+            for name in sheet_names
+        ]
+        # 按工作表顺序收集结果，保证行顺序与工作簿一致
+        frames = []
+        for name, future in zip(sheet_names, futures):
+            frame = future.result()
+            if frame is None:
+                log(f"跳过工作表 '{name}': 无数据或缺少关键列 '{key_column}'")
+                continue
+            log(f"工作表 '{name}' 解析完成，包含 {len(frame)} 行数据")
+            frames.append(frame)
+
+    if not frames:
+        return pd.DataFrame(columns=SOURCE_COLUMNS)
+
+    return pd.concat(frames, ignore_index=True, sort=False)
+
+def row_location(df, index):
+    """
+    获取某行数据在原始文件中的位置
+
+    返回:
+        {'row': 行号} 或 {'sheet': 工作表名, 'row': 行号}
+    """
+    if ROW_COLUMN in df.columns and index in df.index:
+        return {
+            'sheet': df.at[index, SHEET_COLUMN],
+            'row': int(df.at[index, ROW_COLUMN])
+        }
+    return {'row': index + 2}  # 文件行号从1开始，且有标题行
+
+def row_label(df, index):
+    """获取用于日志输出的行位置描述，例如 '工作表 3月 第 5 行'"""
+    location = row_location(df, index)
+    if location.get('sheet'):
+        return f"工作表 {location['sheet']} 第 {location['row']} 行"
+    return f"第 {location['row']} 行"
+
+def _header_names(header_row):
+    """
+    生成列名，与 pandas.read_excel 一致：空标题为 'Unnamed: 列序号'，重复标题依次加 '.1'、'.2' 后缀
+    """
+    width = max((i + 1 for i, value in enumerate(header_row) if value is not None), default=0)
+    names = []
+    seen = {}
+    for i, value in enumerate(header_row[:width]):
+        name = f"Unnamed: {i}" if value is None else value
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+def _sheet_chunks(worksheet, sheet_name, key_column, chunk_rows, columns=None):
+    """
+    按 chunk_rows 行一块读取单个工作表
+
+    只保留单元格的值（values_only），不创建单元格对象；空行跳过，
+    ROW_COLUMN 记录每行在工作表中的实际行号。每块单独构造DataFrame，由 pandas 推断列类型。
+    指定 columns 时只保留这些标题的列，其余列的值不进入数据块。
+    工作表为空或缺少关键列时不产生任何数据块。
+    """
+    rows = worksheet.iter_rows(min_row=1, values_only=True)
+    header = None
+    for header_number, values in enumerate(rows, start=1):
+        if any(value is not None for value in values):
+            header = _header_names(values)
+            break
+    if not header or (key_column and key_column not in header):
+        return
+
+    width = len(header)
+    keep = None
+    if columns is not None:
+        keep = [i for i, name in enumerate(header) if name in columns]
+        header = [header[i] for i in keep]
+    buffer = []
+    row_numbers = []
+    for row_number, values in enumerate(rows, start=header_number + 1):
+        values = values[:width]
+        if all(value is None for value in values):
+            continue
+        if len(values) < width:
+            values = values + (None,) * (width - len(values))
+        if keep is not None:
+            values = tuple(values[i] for i in keep)
+        buffer.append(values)
+        row_numbers.append(row_number)
+        if len(buffer) >= chunk_rows:
+            yield _chunk_frame(buffer, header, sheet_name, row_numbers)
+            buffer, row_numbers = [], []
+    if buffer:
+        yield _chunk_frame(buffer, header, sheet_name, row_numbers)
+
+def _chunk_frame(rows, header, sheet_name, row_numbers):
+    chunk = pd.DataFrame.from_records(rows, columns=header)
+    chunk[SHEET_COLUMN] = sheet_name
+    chunk[ROW_COLUMN] = row_numbers
+    return chunk
+
+def iter_excel_chunks(source, key_column=None, chunk_rows=None, log=print, columns=None):
+    """
+    流式读取 xlsx 工作簿，逐块产出数据
+
+    使用 openpyxl 只读模式的 iter_rows(values_only=True) 逐行读取，
+    同一时刻只在内存中保留一个数据块的原始值，不构建整张工作表的单元格对象。
+    多工作表的工作簿中缺少关键列 key_column 的工作表会被跳过（与 read_excel_sheets 一致）。
+
+    参数:
+        source: 文件路径（可为 .gz/.zip 压缩文件）或文件字节内容
+        key_column: 判断工作表是否为数据表的关键列名
+        chunk_rows: 每块行数，默认 CHUNK_ROWS
+        log: 进度输出函数，标准输出需保持纯JSON的脚本传入None
+        columns: 只保留这些标题的列（关键列始终保留），默认保留全部列
+
+    产出:
+        DataFrame 数据块，包含 SHEET_COLUMN 和 ROW_COLUMN 来源标记列
+    """
+    from openpyxl import load_workbook # type: ignore
+
+    log = log or (lambda message: None)
+    chunk_rows = chunk_rows or CHUNK_ROWS
+    if columns is not None:
+        columns = set(columns) | ({key_column} if key_column else set())
+    workbook = load_workbook(_open_source(load_seekable_source(source)), read_only=True, data_only=True, keep_links=False)
+    try:
+        worksheets = workbook.worksheets
+        # 只有一个工作表时始终读取，保持原有的缺列错误提示
+        sheet_key = key_column if len(worksheets) > 1 else None
+        for worksheet in worksheets:
+            row_count = 0
+            for chunk in _sheet_chunks(worksheet, worksheet.title, sheet_key, chunk_rows, columns):
+                row_count += len(chunk)
+                yield chunk
+            if row_count:
+                log(f"工作表 '{worksheet.title}' 读取完成，包含 {row_count} 行数据")
+            elif len(worksheets) > 1:
+                log(f"跳过工作表 '{worksheet.title}': 无数据或缺少关键列 '{key_column}'")
+    finally:
+        workbook.close()
+
+def read_excel_chunked(source, key_column=None, chunk_rows=None, log=print, columns=None):
+    """
+    分块流式读取 xlsx 工作簿并合并为一个DataFrame
+
+    与 read_excel_sheets 返回相同结构的结果。读取时不构建整张工作表的原始值列表
+    （pandas.read_excel 会先把所有单元格值读成 Python 对象列表），
+    但合并时全部数据块与合并结果同时在内存中，峰值约为结果DataFrame的两倍。
+    需要逐块处理以控制内存时直接使用 iter_excel_chunks。
+    只支持 xlsx 格式（xls 仍使用 read_excel_sheets）。
+
+    返回:
+        合并后的DataFrame，索引为连续整数，包含 SHEET_COLUMN 和 ROW_COLUMN 来源标记列
+    """
+    chunks = list(iter_excel_chunks(source, key_column=key_column, chunk_rows=chunk_rows, log=log, columns=columns))
+    if not chunks:
+        return pd.DataFrame(columns=SOURCE_COLUMNS)
+    return pd.concat(chunks, ignore_index=True, sort=False)
+
+def _source_size(source):
+    if isinstance(source, (bytes, bytearray)):
+        return len(source)
+    if isinstance(source, str):
+        return os.path.getsize(source)
+    return None
+
+def iter_xlsx(source, key_column=None, log=print, columns=None):
+    """
+    逐块读取 xlsx 工作簿
+
+    默认按 CHUNK_ROWS 行逐块流式读取所有工作表（iter_excel_chunks）；
+    多个工作表且文件不超过 PARALLEL_MAX_BYTES 时使用进程池并行解析（read_excel_sheets），
+    结果作为一个数据块产出。
+
+    产出:
+        DataFrame 数据块，包含 SHEET_COLUMN 和 ROW_COLUMN 来源标记列
+    """
+    source = load_seekable_source(source)
+    size = _source_size(source)
+    if size is not None and size <= PARALLEL_MAX_BYTES and len(list_sheet_names(source, engine='openpyxl')) > 1:
+        yield read_excel_sheets(source, key_column=key_column, log=log, columns=columns)
+        return
+    yield from iter_excel_chunks(source, key_column=key_column, log=log, columns=columns)
+
+def read_xlsx(source, key_column=None, log=print, columns=None):
+    """
+    读取 xlsx 工作簿并合并为一个DataFrame（读取方式见 iter_xlsx）
+
+    返回:
+        合并后的DataFrame，索引为连续整数，包含 SHEET_COLUMN 和 ROW_COLUMN 来源标记列
+    """
+    chunks = list(iter_xlsx(source, key_column=key_column, log=log, columns=columns))
+    if len(chunks) == 1:
+        return chunks[0].reset_index(drop=True)
+    if not chunks:
+        return pd.DataFrame(columns=SOURCE_COLUMNS)
+    return pd.concat(chunks, ignore_index=True, sort=False)
+
+def indexed_chunks(chunks):
+    """
+    为逐块读取的数据重新编号索引
+
+    各数据块的索引从0开始，重新编号为在整个文件中连续的整数，
+    使失败记录中的 'index' 在所有数据块间唯一
+    """
+    offset = 0
+    for chunk in chunks:
+        chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+        offset += len(chunk)
+        yield chunk
+
+class RowLocations:
+    """
+    逐块处理时保留已处理行在原始文件中的位置
+
+    每行只保存工作表编号和行号（6字节），用于在处理后续数据块时
+    描述之前数据块中的行（如文件内重复记录的首次出现位置）。
+    索引需为 indexed_chunks 产生的连续编号。
+    """
+
+    def __init__(self):
+        self._sheets = []
+        self._sheet_ids = {}
+        self._sheet_of = array('H')
+        self._rows = array('I')
+
+    def extend(self, df):
+        """记录一个数据块中各行的位置"""
+        if ROW_COLUMN in df.columns:
+            sheets = df[SHEET_COLUMN].astype(object)
+            for sheet in sheets.unique():
+                if sheet not in self._sheet_ids:
+                    self._sheet_ids[sheet] = len(self._sheets)
+                    self._sheets.append(sheet)
+            self._sheet_of.extend(sheets.map(self._sheet_ids).astype('uint16').tolist())
+            self._rows.extend(df[ROW_COLUMN].astype('int64').tolist())
+        else:
+            self._sheet_of.extend([0] * len(df))
+            self._rows.extend((index + 2 for index in df.index))
+            if not self._sheets:
+                self._sheets.append(None)
+
+    def label(self, index):
+        """获取用于日志输出的行位置描述，格式与 row_label 一致"""
+        sheet = self._sheets[self._sheet_of[index]]
+        row = self._rows[index]
+        if sheet:
+            return f"工作表 {sheet} 第 {row} 行"
+        return f"第 {row} 行"
+
+def _require_pyarrow():
+    """列式格式依赖 pyarrow，未安装时给出明确提示"""
+    try:
+        import pyarrow # type: ignore
+        return pyarrow
+    except ImportError:
+        raise ImportError("读取 Parquet/Arrow 文件需要安装 pyarrow，请执行: pip install pyarrow")
+
+def read_columnar(source, extension=None, columns=None):
+    """
+    读取 Parquet 或 Arrow IPC 文件
+
+    列类型（数值、日期等）按文件中的定义保留，不经过字符串转换；
+    返回的DataFrame与 CSV/Excel 读取结果走同一套列映射和验证流程。
+
+    参数:
+        source: 文件路径（可为 .gz/.zip 压缩文件）或文件字节内容
+        extension: 文件格式扩展名，source 为字节内容时必须提供
+        columns: 只读取指定的列（文件中缺少的列忽略），默认读取全部列
+
+    返回:
+        DataFrame，ROW_COLUMN 为从1开始的记录序号
+    """
+    pa = _require_pyarrow()
+    extension = extension or data_extension(source)
+    source = load_seekable_source(source)
+
+    def open_arrow_source():
+        if isinstance(source, (bytes, bytearray)):
+            return pa.BufferReader(source)
+        return pa.memory_map(source, 'r')
+
+    if extension == '.parquet':
+        import pyarrow.parquet as pq # type: ignore
+        if columns is not None:
+            # 只读取文件中存在的列，缺少的列由导入脚本按缺列处理
+            names = pq.read_schema(open_arrow_source()).names
+            columns = [name for name in names if name in set(columns)]
+        table = pq.read_table(open_arrow_source(), columns=columns)
+    else:
+        import pyarrow.ipc as ipc # type: ignore
+        try:
+            table = ipc.open_file(open_arrow_source()).read_all()
+        except pa.ArrowInvalid:
+            # 不是 IPC 文件格式时按流格式读取
+            table = ipc.open_stream(open_arrow_source()).read_all()
+        if columns is not None:
+            table = table.select([name for name in columns if name in table.column_names])
+
+    df = table.to_pandas()
+    df[SHEET_COLUMN] = ''
+    df[ROW_COLUMN] = range(1, len(df) + 1)
+    return df
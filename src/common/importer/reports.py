@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+导入失败报告
+将失败记录以流式方式写入 xlsx 或 CSV 报告文件，
+导入结果JSON中只保留失败数量、前若干条示例和报告路径
+
+报告只包含行位置、各导入脚本指定的键字段和失败原因，不复制原始行的其它列
+（客户数据中含税务密码、身份证号等敏感信息）；报告目录与文件仅属主可读写，
+超过保留天数的旧报告在生成新报告时清理
+"""
+
+import os
+import csv
+import glob
+import time
+import tempfile
+from datetime import datetime
+import numpy as np # type: ignore
+import pandas as pd # type: ignore
+from . import readers
+
+# 导入结果JSON中保留的失败记录示例数量
+SAMPLE_LIMIT = 20
+
+# 报告目录与格式，可通过环境变量覆盖
+REPORT_DIR = os.environ.get('IMPORT_REPORT_DIR') or os.path.join(tempfile.gettempdir(), 'import_reports')
+REPORT_FORMAT = os.environ.get('IMPORT_REPORT_FORMAT', 'xlsx').lower()
+# 报告保留天数，可通过环境变量 IMPORT_REPORT_MAX_AGE_DAYS 覆盖
+REPORT_MAX_AGE_DAYS = float(os.environ.get('IMPORT_REPORT_MAX_AGE_DAYS') or 7)
+
+def _ensure_report_dir(report_dir):
+    """创建报告目录并限制为仅属主可访问（0700）"""
+    os.makedirs(report_dir, mode=0o700, exist_ok=True)
+    try:
+        os.chmod(report_dir, 0o700)
+    except OSError:
+        # 通过环境变量指定的目录可能不属于当前用户，保持原权限
+        pass
+
+def cleanup_reports(report_dir=None, max_age_days=None):
+    """
+    删除超过保留天数的失败报告
+
+    返回:
+        删除的文件数量
+    """
+    report_dir = report_dir or REPORT_DIR
+    max_age_days = REPORT_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    cutoff = time.time() - max_age_days * 86400
+    removed = 0
+    for path in glob.glob(os.path.join(report_dir, '*_failures_*')):
+        try:
+            if os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            # 并发导入可能已删除同一文件
+            continue
+    return removed
+
+def _cell_value(value):
+    """转换为报告单元格可写入的值"""
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple, set, dict)):
+        return str(value)
+    if isinstance(value, np.generic):
+        value = value.item()
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    if isinstance(value, (str, int, float, bool, datetime)):
+        return value
+    return str(value)
+
+class FailureReportWriter:
+    """
+    失败报告写入器
+
+    xlsx 使用 openpyxl 的只写模式，CSV 使用标准库 csv，
+    每行写入后即可释放，内存占用与失败记录数量无关。
+    """
+
+    def __init__(self, importer_name, columns, report_format=None, report_dir=None):
+        self.columns = list(columns)
+        self.format = (report_format or REPORT_FORMAT)
+        if self.format not in ('xlsx', 'csv'):
+            self.format = 'xlsx'
+        report_dir = report_dir or REPORT_DIR
+        _ensure_report_dir(report_dir)
+        cleanup_reports(report_dir)
+        timestamp = datetime.now().strftime('%Y%m%d%H%M%S%f')
+        self.path = os.path.join(report_dir, f"{importer_name}_failures_{timestamp}.{self.format}")
+        self.count = 0
+        # 报告文件以 0600 权限独占创建
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+
+        header = ['来源工作表', '行号'] + self.columns + ['错误列', '失败原因']
+        if self.format == 'xlsx':
+            from openpyxl import Workbook # type: ignore
+            self._workbook = Workbook(write_only=True)
+            self._sheet = self._workbook.create_sheet('失败记录')
+            self._sheet.append(header)
+            self._file = os.fdopen(fd, 'wb')
+        else:
+            # 使用带BOM的UTF-8，Excel可直接打开中文内容
+            self._file = os.fdopen(fd, 'w', newline='', encoding='utf-8-sig')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(header)
+
+    def write(self, location, values, field, reason):
+        """写入一条失败记录：原始行位置、键字段值、错误列和失败原因"""
+        row = [location.get('sheet'), location.get('row')] + list(values) + [field, reason]
+        row = [_cell_value(value) for value in row]
+        if self.format == 'xlsx':
+            self._sheet.append(row)
+        else:
+            self._writer.writerow(['' if value is None else value for value in row])
+        self.count += 1
+
+    def close(self):
+        """保存报告并返回报告路径"""
+        try:
+            if self.format == 'xlsx':
+                self._workbook.save(self._file)
+        finally:
+            self._file.close()
+        return self.path
+
+    def abort(self):
+        """放弃写入：关闭并删除未完成的报告文件"""
+        try:
+            self._file.close()
+        finally:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+def _record_reason(record):
+    return record.get('reason') or record.get('error') or ''
+
+class FailureCollector:
+    """
+    逐块收集失败记录并写入报告文件
+
+    分块导入时每个数据块处理完即写入报告，内存中只保留前 limit 条示例记录和计数，
+    不随失败行数增长。
+    """
+
+    def __init__(self, importer_name, key_columns=(), log=print, record_fields=None, limit=SAMPLE_LIMIT):
+        """
+        参数:
+            importer_name: 导入脚本标识，用于报告文件名
+            key_columns: 写入报告的键字段（如企业名称、姓名），其它列不写入报告
+            log: 输出函数，标准输出需保持纯JSON的脚本传入None
+            record_fields: {报告列: 记录字段}，失败行不在数据块中时从记录本身取键字段值
+            limit: 保留的示例记录数
+        """
+        self.importer_name = importer_name
+        self.key_columns = list(key_columns)
+        self.log = log or (lambda message: None)
+        self.record_fields = record_fields or {}
+        self.limit = limit
+        self.count = 0
+        self.samples = []
+        self._columns = None
+        self._writer = None
+        self._failed = False
+
+    def add(self, df, failed_records):
+        """
+        写入一个数据块的失败记录
+
+        参数:
+            df: 该数据块的原始DataFrame，用于取回失败行的键字段；为None时从记录中取
+            failed_records: 失败记录列表，记录中的 'index' 对应 df 的索引
+        """
+        if not failed_records:
+            return
+        self.count += len(failed_records)
+        room = self.limit - len(self.samples)
+        if room > 0:
+            self.samples.extend(failed_records[:room])
+        if self._failed:
+            return
+
+        try:
+            if self._writer is None:
+                if df is not None:
+                    self._columns = [col for col in self.key_columns if col in df.columns]
+                else:
+                    self._columns = [col for col in self.key_columns if col in self.record_fields]
+                self._writer = FailureReportWriter(self.importer_name, self._columns)
+            columns = self._columns
+            # 失败行的键字段按索引数组一次取出，不逐行 df.loc
+            rows = {}
+            if df is not None:
+                present = [col for col in columns if col in df.columns]
+                indexes = pd.Index(list(dict.fromkeys(
+                    record['index'] for record in failed_records if record.get('index') is not None
+                )))
+                indexes = indexes[indexes.isin(df.index)]
+                if len(present) == len(columns):
+                    rows = dict(zip(indexes, df.loc[indexes, columns].itertuples(index=False, name=None)))
+            for record in failed_records:
+                index = record.get('index')
+                if index is not None and index in rows:
+                    values = list(rows[index])
+                    location = readers.row_location(df, index)
+                else:
+                    values = [record.get(self.record_fields[col]) if col in self.record_fields else None
+                              for col in columns]
+                    location = {'sheet': record.get('sheet'), 'row': record.get('row')}
+                self._writer.write(location, values, record.get('field', ''), _record_reason(record))
+        except Exception as e:
+            self.log(f"生成失败报告出错: {str(e)}")
+            self._abandon()
+
+    def _abandon(self):
+        self._failed = True
+        if self._writer is not None:
+            try:
+                self._writer.abort()
+            except Exception:
+                pass
+            self._writer = None
+
+    def close(self):
+        """
+        保存报告
+
+        返回:
+            报告文件路径；没有失败记录或写入失败时返回None
+        """
+        if self._writer is None:
+            return None
+        writer, self._writer = self._writer, None
+        try:
+            path = writer.close()
+        except Exception as e:
+            self.log(f"生成失败报告出错: {str(e)}")
+            self._failed = True
+            return None
+        self.log(f"失败报告已生成: {path}（{writer.count} 条记录）")
+        return path
+
+    def summary(self, report_path):
+        """生成导入结果中与失败记录相关的字段，格式与 summarize_failures 一致"""
+        return {
+            'failed_count': self.count,
+            'failed_records': self.samples,
+            'failed_records_truncated': self.count > len(self.samples),
+            'failed_report_path': report_path
+        }
+
+def write_failure_report(importer_name, df, failed_records, key_columns=(), log=print):
+    """
+    将失败记录写入报告文件
+
+    参数:
+        importer_name: 导入脚本标识，用于报告文件名
+        df: 读取到的原始DataFrame，用于取回失败行的键字段
+        failed_records: 失败记录列表，记录中的 'index' 对应 df 的索引
+        key_columns: 写入报告的键字段（如企业名称、姓名），其它列不写入报告
+        log: 输出函数，标准输出需保持纯JSON的脚本传入None
+
+    返回:
+        报告文件路径；没有失败记录或写入失败时返回None
+    """
+    collector = FailureCollector(importer_name, key_columns, log=log)
+    collector.add(df, failed_records)
+    return collector.close()
+
+def summarize_failures(failed_records, report_path, limit=SAMPLE_LIMIT):
+    """
+    生成导入结果中与失败记录相关的字段
+
+    返回:
+        {'failed_count', 'failed_records'(前 limit 条示例), 'failed_records_truncated', 'failed_report_path'}
+    """
+    return {
+        'failed_count': len(failed_records),
+        'failed_records': failed_records[:limit],
+        'failed_records_truncated': len(failed_records) > limit,
+        'failed_report_path': report_path
+    }
+
+def projected_counts(inserts=0, updates=0, overwrites=0, duplicates=0, validation_failures=0):
+    """预览模式下预计的变更数量"""
+    return {
+        'inserts': inserts,
+        'updates': updates,
+        'overwrites': overwrites,
+        'duplicates': duplicates,
+        'validation_failures': validation_failures
+    }
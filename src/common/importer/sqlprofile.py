@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+导入SQL语句诊断
+开启后记录导入过程中执行的每条语句的次数和总耗时，对每种语句执行一次 EXPLAIN，
+标记全表扫描和无法使用索引的查询条件（如对列使用 DATE_FORMAT 等函数）
+"""
+
+import os
+import re
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+# 通过环境变量 IMPORT_SQL_PROFILE=1 开启诊断模式
+ENV_FLAG = 'IMPORT_SQL_PROFILE'
+
+# 报告中列出的语句数量（按总耗时排序）
+TOP_STATEMENTS = 10
+
+# IN 列表中的占位符合并为一个，使不同长度的批量查询归为同一种语句
+_IN_LIST_PATTERN = re.compile(
+    r'\bIN\s*\(\s*(?:%\(\w+\)s|%s|\?|:\w+)(?:\s*,\s*(?:%\(\w+\)s|%s|\?|:\w+))*\s*\)',
+    re.IGNORECASE
+)
+_VALUES_LIST_PATTERN = re.compile(r'\bVALUES\s*(\([^()]*\))(?:\s*,\s*\([^()]*\))+', re.IGNORECASE)
+_WHERE_PATTERN = re.compile(r'\bWHERE\b(.*?)(?:\bGROUP\s+BY\b|\bORDER\s+BY\b|\bLIMIT\b|\bFOR\s+UPDATE\b|$)', re.IGNORECASE | re.DOTALL)
+
+# 查询条件中包裹列的函数会使索引失效，例如 DATE_FORMAT(yearMonth, '%Y-%m') = :year_month
+_WRAPPED_COLUMN_PATTERN = re.compile(
+    r'\b(DATE_FORMAT|DATE|YEAR|MONTH|DAY|LEFT|RIGHT|SUBSTRING|SUBSTR|LOWER|UPPER|TRIM|CONCAT|IFNULL|COALESCE|CAST|CONVERT)'
+    r'\s*\(\s*`?([A-Za-z_][\w.]*)`?\s*[,)]\s*[^=<>!]*?(=|<>|!=|<=|>=|<|>|\bLIKE\b|\bIN\b)',
+    re.IGNORECASE
+)
+_LEADING_WILDCARD_PATTERN = re.compile(r"\bLIKE\s+'%", re.IGNORECASE)
+
+# 可以 EXPLAIN 的语句
+_EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE')
+
+def enabled():
+    """是否开启了SQL诊断模式"""
+    return os.environ.get(ENV_FLAG, '').lower() in ('1', 'true', 'yes', 'on')
+
+def normalize_statement(statement):
+    """合并空白和批量占位符，得到用于归类的语句文本"""
+    text = ' '.join(str(statement).split())
+    text = _IN_LIST_PATTERN.sub('IN (...)', text)
+    return _VALUES_LIST_PATTERN.sub(r'VALUES \1, ...', text)
+
+def static_issues(statement):
+    """不执行语句，仅根据语句文本发现无法使用索引的查询条件"""
+    issues = []
+    where = _WHERE_PATTERN.search(statement)
+    if not where:
+        return issues
+    condition = where.group(1)
+    for match in _WRAPPED_COLUMN_PATTERN.finditer(condition):
+        issues.append(
+            f"查询条件对列 {match.group(2)} 使用了函数 {match.group(1).upper()}()，无法使用该列上的索引，"
+            f"建议改写为对列本身的范围条件"
+        )
+    if _LEADING_WILDCARD_PATTERN.search(condition):
+        issues.append("LIKE 条件以通配符 % 开头，无法使用索引")
+    return issues
+
+def explain_issues(plan):
+    """根据 EXPLAIN 结果标记全表扫描等问题"""
+    issues = []
+    for row in plan:
+        table = row.get('table')
+        access_type = str(row.get('type') or '').upper()
+        extra = str(row.get('Extra') or '')
+        if access_type == 'ALL':
+            issues.append(f"表 {table} 全表扫描（预计扫描 {row.get('rows')} 行）")
+        elif access_type == 'INDEX':
+            issues.append(f"表 {table} 全索引扫描（预计扫描 {row.get('rows')} 行）")
+        if row.get('possible_keys') and not row.get('key'):
+            issues.append(f"表 {table} 存在可用索引 {row.get('possible_keys')} 但未被使用")
+        if 'Using filesort' in extra or 'Using temporary' in extra:
+            issues.append(f"表 {table}: {extra}")
+    return issues
+
+def _first_parameters(parameters, executemany):
+    if executemany and isinstance(parameters, (list, tuple)) and parameters:
+        return parameters[0]
+    return parameters
+
+def _explain(cursor, statement, parameters):
+    """在执行语句的同一个游标上执行 EXPLAIN，返回每行为字典的执行计划"""
+    cursor.execute('EXPLAIN ' + statement, parameters)
+    rows = cursor.fetchall()
+    columns = [column[0] for column in (cursor.description or [])]
+    return [row if isinstance(row, dict) else dict(zip(columns, row)) for row in rows]
+
+class _StatementStats:
+    def __init__(self, statement):
+        self.statement = statement
+        self.count = 0
+        self.total_seconds = 0.0
+        self.plan = None
+        self.explain_error = None
+        self.issues = static_issues(statement)
+
+    def to_dict(self):
+        return {
+            'statement': self.statement,
+            'count': self.count,
+            'total_seconds': round(self.total_seconds, 6),
+            'avg_ms': round(self.total_seconds * 1000 / self.count, 3) if self.count else 0,
+            'explain': self.plan,
+            'explain_error': self.explain_error,
+            'issues': self.issues
+        }
+
+class StatementRecorder:
+    """
+    语句记录器
+
+    SQLAlchemy 引擎通过 attach_engine 挂载事件；pymysql 等 DB-API 游标
+    由 metrics 的计数游标在执行前后调用 before_execute/after_execute。
+    每种语句第一次出现时在同一个游标上执行 EXPLAIN（仅 MySQL）。
+    """
+
+    def __init__(self, importer):
+        self.importer = importer
+        self.statements = OrderedDict()
+
+    def before_execute(self, cursor, statement, parameters, executemany=False, explain=True):
+        """记录语句，首次出现时执行 EXPLAIN；返回计时起点"""
+        key = normalize_statement(statement)
+        stats = self.statements.get(key)
+        if stats is None:
+            stats = self.statements[key] = _StatementStats(key)
+            if explain and key.upper().startswith(_EXPLAINABLE):
+                try:
+                    stats.plan = _explain(cursor, statement, _first_parameters(parameters, executemany))
+                    stats.issues.extend(explain_issues(stats.plan))
+                except Exception as e:
+                    stats.explain_error = str(e)
+        stats.count += 1
+        return key, time.perf_counter()
+
+    def after_execute(self, token):
+        key, started = token
+        self.statements[key].total_seconds += time.perf_counter() - started
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        explain = conn.engine.dialect.name == 'mysql'
+        conn.info.setdefault('sqlprofile_tokens', []).append(
+            self.before_execute(cursor, statement, parameters, executemany, explain=explain)
+        )
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        tokens = conn.info.get('sqlprofile_tokens')
+        if tokens:
+            self.after_execute(tokens.pop())
+
+    def attach_engine(self, engine):
+        from sqlalchemy import event # type: ignore
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def detach_engine(self, engine):
+        from sqlalchemy import event # type: ignore
+        event.remove(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.remove(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def report(self, report_dir, log=print):
+        """
+        输出诊断摘要并把完整结果写入JSON报告
+
+        返回:
+            报告文件路径；没有记录到语句时返回None
+        """
+        if not self.statements:
+            return None
+        log = log or (lambda message: None)
+        ordered = sorted(self.statements.values(), key=lambda stats: stats.total_seconds, reverse=True)
+        flagged = [stats for stats in ordered if stats.issues]
+
+        os.makedirs(report_dir, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d%H%M%S%f')
+        path = os.path.join(report_dir, f"{self.importer}_sql_profile_{timestamp}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'importer': self.importer,
+                'total_statements': sum(stats.count for stats in ordered),
+                'distinct_statements': len(ordered),
+                'flagged_statements': len(flagged),
+                'statements': [stats.to_dict() for stats in ordered]
+            }, f, ensure_ascii=False, indent=2, default=str)
+
+        log(f"SQL诊断: 共执行 {sum(stats.count for stats in ordered)} 条语句，{len(ordered)} 种，其中 {len(flagged)} 种存在索引问题")
+        for stats in ordered[:TOP_STATEMENTS]:
+            log(f"  [{stats.count} 次, {stats.total_seconds * 1000:.1f} ms] {stats.statement[:200]}")
+        for stats in flagged:
+            for issue in stats.issues:
+                log(f"  ⚠ {issue}: {stats.statement[:200]}")
+        log(f"SQL诊断报告已生成: {path}")
+        return path
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按列验证工具
+每条规则对整列计算一个布尔错误掩码，只为失败的行拼接错误信息，
+再用一个合并后的掩码拆分有效行和无效行，避免逐行 iterrows 调用校验函数
+"""
+
+from datetime import datetime
+import numpy as np # type: ignore
+import pandas as pd # type: ignore
+from . import readers
+
+def _by_category(series, predicate):
+    """category 列只对每个取值计算一次 predicate，再按编码展开到各行；缺失值为 False"""
+    matches = np.array([bool(predicate(value)) for value in series.cat.categories] + [False])
+    codes = series.cat.codes.to_numpy()
+    return pd.Series(matches[codes], index=series.index)  # 编码 -1（缺失值）取末尾的 False
+
+def is_str(series):
+    """元素是否为 str 的布尔掩码"""
+    if isinstance(series.dtype, pd.StringDtype):
+        return series.notna()
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return _by_category(series, lambda value: isinstance(value, str))
+    return series.map(lambda value: isinstance(value, str)).astype(bool)
+
+def is_instance(series, types):
+    """元素是否为 types 中任一类型的布尔掩码；数值列和日期列按列类型整体判断"""
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return pd.Series(pd.Timestamp in types or datetime in types, index=series.index)
+    if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+        return pd.Series(float in types or int in types, index=series.index)
+    if isinstance(series.dtype, pd.StringDtype):
+        return pd.Series(str in types, index=series.index)
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return _by_category(series, lambda value: isinstance(value, types))
+    return series.map(lambda value: isinstance(value, types)).astype(bool)
+
+def is_blank(series):
+    """空值或空字符串（原逻辑中 pd.isna(x) or not x）"""
+    blank = series.isna()
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return blank | _by_category(series, lambda value: isinstance(value, str) and len(value) == 0)
+    strings = is_str(series)
+    if strings.any():
+        blank |= strings & (series.where(strings, 'x').astype(str).str.len() == 0)
+    return blank
+
+def to_datetime(series):
+    """
+    整列转换为日期，无法解析的值为 NaT
+
+    每个值单独推断格式（与逐个调用 pd.to_datetime 的结果一致），
+    旧版 pandas 不支持 format='mixed' 时按默认方式解析
+    """
+    try:
+        return pd.to_datetime(series, errors='coerce', format='mixed')
+    except (TypeError, ValueError):
+        return pd.to_datetime(series, errors='coerce')
+
+def normalize_key(series, upper=False):
+    """
+    规范化用于查重的键：去除首尾空白（含全角空格），可选转为大写；
+    空值和空字符串为 NA
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # 只规范化每个取值一次，再按编码展开到各行
+        categories = normalize_key(pd.Series(series.cat.categories, dtype=object), upper=upper)
+        values = np.append(categories.to_numpy(dtype=object), np.nan)
+        return pd.Series(values[series.cat.codes.to_numpy()], index=series.index)
+    keys = series.where(is_str(series), series.astype(str)).where(series.notna())
+    keys = keys.str.strip().str.strip('\u3000')
+    if upper:
+        keys = keys.str.upper()
+    return keys.where(keys.str.len() > 0)
+
+def duplicate_of(keys):
+    """
+    文件内重复检测
+
+    参数:
+        keys: 规范化后的键，NA 不参与比较
+
+    返回:
+        以重复行（第二次及以后出现）为索引、值为该键第一次出现的行索引的 Series
+    """
+    present = keys.notna()
+    duplicated = keys.duplicated(keep='first') & present
+    first = keys[present & ~duplicated]
+    first_index = pd.Series(first.index, index=first.to_numpy())
+    return keys[duplicated].map(first_index)
+
+class RowErrors:
+    """
+    按列收集的验证错误
+
+    add() 登记一条规则的错误掩码、错误列和错误信息，invalid 为全部规则合并后的掩码，
+    records() 只为失败的行生成失败记录
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self._rules = []
+
+    def add(self, mask, field, message):
+        """
+        登记一条规则
+
+        参数:
+            mask: 与 index 对齐的布尔掩码，True 表示该行违反规则
+            field: 错误列
+            message: 错误信息字符串，或与 index 对齐、按行生成的错误信息 Series（只取失败行）
+        """
+        mask = pd.Series(np.asarray(mask, dtype=bool), index=self.index)
+        if mask.any():
+            self._rules.append((mask, field, message))
+
+    @property
+    def invalid(self):
+        """至少违反一条规则的行"""
+        combined = np.zeros(len(self.index), dtype=bool)
+        for mask, _, _ in self._rules:
+            combined |= mask.to_numpy()
+        return pd.Series(combined, index=self.index)
+
+    def count(self):
+        return int(self.invalid.sum())
+
+    def _row_errors(self):
+        """{行索引: ([错误信息...], [错误列...])}，按规则登记顺序"""
+        errors = {}
+        for mask, field, message in self._rules:
+            failing = mask[mask].index
+            if isinstance(message, pd.Series):
+                messages = message.reindex(failing).astype(str).tolist()
+            else:
+                messages = [message] * len(failing)
+            for index, text in zip(failing, messages):
+                entry = errors.setdefault(index, ([], []))
+                entry[0].append(text)
+                entry[1].append(field)
+        return errors
+
+    def records(self, df, data=None, columns=(), reason_prefix='数据验证失败: '):
+        """
+        生成失败记录列表（按原始行顺序）
+
+        参数:
+            df: 原始DataFrame，用于取回行所在的工作表和行号
+            data: 取 columns 字段值的DataFrame，默认为 df
+            columns: 需要带入失败记录的字段
+        """
+        data = df if data is None else data
+        errors = self._row_errors()
+        records = []
+        for index in self.index[self.invalid.to_numpy()]:
+            messages, fields = errors[index]
+            record = {'index': index, **readers.row_location(df, index)}
+            for column in columns:
+                value = data.at[index, column] if column in data.columns else None
+                record[column] = '' if value is None or (not isinstance(value, str) and pd.isna(value)) else value
+            record.update({
+                'errors': messages,
+                'field': ', '.join(dict.fromkeys(fields)),
+                'reason': reason_prefix + '; '.join(messages)
+            })
+            records.append(record)
+        return records
@@ -73,7 +73,7 @@ export class BusinessOptionsController {
     name: 'category', 
     required: false, 
     description: '业务类别',
-    enum: ['change_business', 'administrative_license', 'other_business_basic', 'other_business_outsourcing', 'other_business_special'],
+    enum: ['change_business', 'administrative_license', 'other_business_basic', 'other_business_outsourcing', 'other_business_special', 'enterprise_type', 'customer_level', 'tax_bureau', 'location'],
   })
   @ApiQuery({ 
     name: 'isDefault', 
@@ -125,7 +125,7 @@ export class BusinessOptionsController {
   @ApiParam({ 
     name: 'category', 
     description: '业务类别',
-    enum: ['change_business', 'administrative_license', 'other_business_basic', 'other_business_outsourcing', 'other_business_special'],
+    enum: ['change_business', 'administrative_license', 'other_business_basic', 'other_business_outsourcing', 'other_business_special', 'enterprise_type', 'customer_level', 'tax_bureau', 'location'],
   })
   @ApiResponse({ 
     status: 200, 
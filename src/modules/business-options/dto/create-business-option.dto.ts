@@ -10,6 +10,10 @@ export const BUSINESS_OPTION_CATEGORIES = [
   'other_business_basic',         // 其他业务（基础）
   'other_business_outsourcing',   // 其他业务
   'other_business_special',       // 其他业务（特殊）
+  'enterprise_type',              // 企业类型（客户导入校验）
+  'customer_level',               // 客户分级（客户导入校验）
+  'tax_bureau',                   // 所属分局（客户导入校验）
+  'location',                     // 归属地（客户导入校验）
 ] as const;
 
 export type BusinessOptionCategory = typeof BUSINESS_OPTION_CATEGORIES[number];
@@ -19,7 +19,11 @@ export class BusinessOption {
       'administrative_license', 
       'other_business_basic',
       'other_business_outsourcing',
-      'other_business_special'
+      'other_business_special',
+      'enterprise_type',
+      'customer_level',
+      'tax_bureau',
+      'location'
     ]
   })
   @Column({ 
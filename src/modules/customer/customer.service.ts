@@ -1817,6 +1817,7 @@ export class CustomerService {
       unifiedSocialCreditCode: string;
       reason: string;
     }>;
+    failedReportPath?: string;
   }> {
     try {
       this.logger.log(`开始执行导入操作，用户ID: ${userId}`);
@@ -1960,6 +1961,7 @@ export class CustomerService {
           imported_count,
           failed_count,
           failed_records,
+          failed_report_path,
           error_message,
         } = importResult;
 
@@ -2003,6 +2005,7 @@ export class CustomerService {
             failed_records && failed_records.length > 0
               ? failed_records
               : undefined,
+          failedReportPath: failed_report_path || undefined,
         };
       }
 
@@ -2834,6 +2837,7 @@ export class CustomerService {
       unifiedSocialCreditCode: string;
       reason: string;
     }>;
+    failedReportPath?: string;
   }> {
     try {
       this.logger.log(`开始执行批量更新操作，用户ID: ${userId}`);
@@ -2913,6 +2917,7 @@ export class CustomerService {
           updated_count,
           failed_count,
           failed_records,
+          failed_report_path,
           error_message,
         } = updateResult;
 
@@ -2958,6 +2963,7 @@ export class CustomerService {
             failed_records && failed_records.length > 0
               ? failed_records
               : undefined,
+          failedReportPath: failed_report_path || undefined,
         };
       }
 
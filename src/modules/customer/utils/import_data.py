@@ -2,15 +2,18 @@
 # -*- coding: utf-8 -*-
 
 import pandas as pd # type: ignore
-from sqlalchemy import create_engine, text # type: ignore
-import numpy as np # type: ignore
+from sqlalchemy import text # type: ignore
 import os
 from datetime import datetime
 import argparse
 import sys
 import traceback
 import json
-import urllib.parse
+import itertools
+
+# 引入公共导入工具包（位于 src/common/importer）
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../common')))
+from importer import readers, db, batch, reports, metrics, validation, dtypes, history, identifiers, directory # noqa: E402
 
 # 设置调试模式
 DEBUG = True
@@ -20,68 +23,671 @@ def debug_print(message):
     if DEBUG:
         print(f"DEBUG: {message}")
 
-def import_excel_data(file_path):
+# 查重的候选键：(db_data 列名, 快照中的键, 按 IN 列表查询已存在值的SQL)
+CUSTOMER_KEY_QUERIES = (
+    ('unifiedSocialCreditCode', 'codes', "SELECT unifiedSocialCreditCode FROM sys_customer WHERE unifiedSocialCreditCode IN ({placeholders})"),
+    ('companyName', 'names', "SELECT companyName FROM sys_customer WHERE companyName IN ({placeholders})"),
+)
+
+def customer_keys(values, column):
+    """
+    规范化查重键，与文件内查重一致：去除首尾空白（含全角空格），统一社会信用代码不区分大小写
+
+    返回:
+        规范化后的键 Series，空值为 NA
+    """
+    return validation.normalize_key(pd.Series(values, dtype=object), upper=column == 'unifiedSocialCreditCode')
+
+def new_customer_key_snapshot():
+    """
+    已存在客户键的快照
+
+    codes/names 为已确认存在的统一社会信用代码和企业名称（customer_keys 规范化后的值），
+    checked 记录已经向数据库查询过的键，批量导入时后续文件只查询新出现的键
+    """
+    return {'codes': set(), 'names': set(), 'checked': {'codes': set(), 'names': set()}}
+
+def upload_keys(db_data, column):
+    """文件中某列出现的非空键（规范化后）"""
+    if column not in db_data.columns:
+        return set()
+    return set(customer_keys(db_data[column], column).dropna().tolist())
+
+def load_existing_customer_keys(engine, existing_keys, db_data):
+    """
+    查询本文件中出现的统一社会信用代码和企业名称是否已存在
+
+    只把文件中的键分批放入 IN 列表查询（每批最多 db.IN_BATCH_SIZE 个），
+    查询量与文件大小成正比，不再随客户表的大小增长；结果合并到 existing_keys 快照。
+    查询前后的键都按 customer_keys 规范化，与文件内查重使用相同的比较规则
+
+    返回:
+        本次查询的键数量
+    """
+    queried = 0
+    try:
+        for column, key, query in CUSTOMER_KEY_QUERIES:
+            candidates = upload_keys(db_data, column) - existing_keys['checked'][key]
+            found = [row[0] for row in db.fetch_in_batches(engine, query, candidates)]
+            existing_keys[key].update(customer_keys(found, column).dropna().tolist())
+            existing_keys['checked'][key].update(candidates)
+            queried += len(candidates)
+    except Exception as e:
+        debug_print(f"查询数据库失败: {str(e)}")
+        print(f"查询数据库失败: {str(e)}")
+    return queried
+
+def confirm_missing_keys_on_primary(engine, existing_keys, db_data):
+    """
+    参考数据来自只读副本时的一致性校验
+
+    副本可能存在复制延迟，写入前在主库上确认本文件中副本认为不存在的
+    统一社会信用代码和企业名称，主库中已存在的补充到快照中，按重复处理
+
+    返回:
+        在主库中补充发现的数量
+    """
+    found = 0
+    for column, key, query in CUSTOMER_KEY_QUERIES:
+        candidates = upload_keys(db_data, column) - existing_keys[key]
+        confirmed = set(customer_keys(
+            [row[0] for row in db.fetch_in_batches(engine, query, candidates)], column
+        ).dropna().tolist())
+        existing_keys[key].update(confirmed)
+        found += len(confirmed)
+    return found
+
+def duplicate_record(location, index, company_name, code, code_duplicate, name_duplicate):
+    """生成与数据库中已有客户重复的失败记录，location 为行在原始文件中的位置"""
+    duplicate_fields = []
+    duplicate_reasons = []
+    if code_duplicate:
+        duplicate_fields.append('unifiedSocialCreditCode')
+        duplicate_reasons.append('统一社会信用代码重复')
+    if name_duplicate:
+        duplicate_fields.append('companyName')
+        duplicate_reasons.append('企业名称重复')
+    return {
+        'index': index,
+        **location,  # 来源工作表及行号
+        'companyName': company_name if company_name is not None else '',
+        'unifiedSocialCreditCode': code if code else '',
+        'field': ', '.join(duplicate_fields),
+        'reason': '，'.join(duplicate_reasons)
+    }
+
+# 根据实体定义创建完整的映射关系（文件列名 -> 数据库字段），读取文件时只解析这些列
+COLUMN_MAPPING = {
+    '企业名称': 'companyName',
+    '归属地': 'location',
+    '顾问会计': 'consultantAccountant',
+    '记账会计': 'bookkeepingAccountant',
+    '开票员': 'invoiceOfficer',
+    '企业类型': 'enterpriseType',
+    '统一社会信用代码': 'unifiedSocialCreditCode',
+    '税号': 'taxNumber',
+    '注册地址': 'registeredAddress',
+    '实际经营地址': 'businessAddress',
+    '所属分局': 'taxBureau',
+    '实际负责人(备注)': 'actualResponsibleRemark',
+    '宗族ID': 'clanId',
+    '老板画像': 'bossProfile',
+    '企业画像': 'enterpriseProfile',
+    '行业大类': 'industryCategory',
+    '行业细分': 'industrySubcategory',
+    '是否有税收优惠': 'hasTaxBenefits',
+    '工商公示密码': 'businessPublicationPassword',
+    '成立日期': 'establishmentDate',
+    '营业执照期限': 'licenseExpiryDate',
+    '注册资金': 'registeredCapital',
+    '认缴到期日期': 'capitalContributionDeadline',
+    '认缴到期日期2': 'capitalContributionDeadline2',
+    '对公开户行': 'publicBank',
+    '开户行账号': 'bankAccountNumber',
+    '基本存款账户编号': 'basicDepositAccountNumber',
+    '一般户开户行': 'generalAccountBank',
+    '一般户账号': 'generalAccountNumber',
+    '一般户开户时间': 'generalAccountOpeningDate',
+    '对公开户时间': 'publicBankOpeningDate',
+    '网银托管档案号': 'onlineBankingArchiveNumber',
+    '报税登录方式': 'taxReportLoginMethod',
+    '法人姓名': 'legalRepresentativeName',
+    '法人电话': 'legalRepresentativePhone',
+    '法人电话2': 'legalRepresentativePhone2',
+    '法人身份证号': 'legalRepresentativeId',
+    '法人税务密码': 'legalRepresentativeTaxPassword',
+    '办税员': 'taxOfficerName',
+    '办税员电话': 'taxOfficerPhone',
+    '办税员身份证号': 'taxOfficerId',
+    '办税员税务密码': 'taxOfficerTaxPassword',
+    '开票软件': 'invoicingSoftware',
+    '开票注意事项': 'invoicingNotes',
+    '开票员姓名': 'invoiceOfficerName',
+    '开票员电话': 'invoiceOfficerPhone',
+    '开票员身份证号': 'invoiceOfficerId',
+    '开票员税务密码': 'invoiceOfficerTaxPassword',
+    '财务负责人': 'financialContactName',
+    '财务负责人电话': 'financialContactPhone',
+    '财务负责人身份证号': 'financialContactId',
+    '财务负责人税务密码': 'financialContactTaxPassword',
+    '税种': 'taxCategories',
+    '社保险种': 'socialInsuranceTypes',
+    '参保人员': 'insuredPersonnel',
+    '三方协议扣款账户': 'tripartiteAgreementAccount',
+    '实名密码': 'realNamePassword',
+    '网报密码': 'netReportPassword',
+    '个税申报人员': 'personalIncomeTaxStaff',
+    '纸质资料档案编号': 'paperArchiveNumber',
+    '网银托管存放编号': 'onlineBankingStorageNumber',
+    '档案存放备注': 'archiveStorageRemarks',
+    '章存放编号': 'sealStorageNumber',
+    '企业状态': 'enterpriseStatus',
+    '客户分级': 'customerLevel',
+    '业务状态': 'businessStatus',
+    '客户群': 'customerGroup',
+    '客户群备注': 'customerGroupRemark',
+    '维护代理端': 'maintenanceAgent',
+    '维护代理端备注': 'maintenanceAgentRemark',
+    '记账软件': 'accountingSoftware',
+    '记账软件备注': 'accountingSoftwareRemark',
+    '备注信息': 'remarks'
+}
+
+# 逐行参与查重和失败记录的键字段，保持 Python 对象，不转换为紧凑类型
+KEY_FIELDS = ('companyName', 'unifiedSocialCreditCode')
+
+# 失败报告中写入的键字段，原始行的其它列不写入报告
+REPORT_KEY_COLUMNS = ('企业名称', '统一社会信用代码')
+# 失败行已不在数据块中时（暂存表读回的重复记录），报告键字段 -> 失败记录中的字段
+REPORT_RECORD_FIELDS = {'企业名称': 'companyName', '统一社会信用代码': 'unifiedSocialCreditCode'}
+
+# 暂存表模式：会话级临时表名及每批写入临时表的行数
+STAGING_TABLE = 'tmp_customer_import'
+STAGING_BATCH_SIZE = 1000
+
+# 身份证号字段 -> 错误信息中的字段名称
+ID_NUMBER_FIELDS = {
+    'legalRepresentativeId': '法人身份证号',
+    'taxOfficerId': '办税员身份证号',
+    'invoiceOfficerId': '开票员身份证号',
+    'financialContactId': '财务负责人身份证号'
+}
+
+# 需为在职员工的姓名字段 -> 错误信息中的字段名称
+EMPLOYEE_NAME_FIELDS = {
+    'consultantAccountant': '顾问会计',
+    'bookkeepingAccountant': '记账会计',
+    'invoiceOfficer': '开票员'
+}
+
+# 枚举字段 -> (业务选项类别, 错误信息中的字段名称)；类别为 None 时只接受 ENUM_SYNONYMS 中的状态代码，始终校验。
+# 企业类型、客户分级、所属分局、归属地的取值在业务选项中按类别维护，类别还没有取值时不校验
+ENUM_FIELDS = {
+    'enterpriseType': ('enterprise_type', '企业类型'),
+    'customerLevel': ('customer_level', '客户分级'),
+    'enterpriseStatus': (None, '企业状态'),
+    'businessStatus': (None, '业务状态'),
+    'taxBureau': ('tax_bureau', '所属分局'),
+    'location': ('location', '归属地')
+}
+
+# 企业状态、业务状态的中文名称 -> 存储的状态代码（与 customer.entity.ts 中的定义一致）
+ENUM_SYNONYMS = {
+    'enterpriseStatus': {
+        '工商正常': 'normal', '正常': 'normal',
+        '工商异常': 'abnormal', '异常': 'abnormal',
+        '已注销': 'cancelled',
+        '已吊销': 'revoked'
+    },
+    'businessStatus': {
+        '正常': 'normal',
+        '已注销': 'logged_out',
+        '注销中': 'logging_out',
+        '已流失': 'lost',
+        '等待转出': 'waiting_transfer',
+        '欠费不报': 'arrears_no_report',
+        '只年检': 'annual_inspection_only',
+        '仅办照不代理': 'license_only_no_agency',
+        '仅单项业务办理': 'single_service_only'
+    }
+}
+
+# 日期字段列表
+DATE_FIELDS = [
+    'establishmentDate', 'licenseExpiryDate', 
+    'capitalContributionDeadline', 'capitalContributionDeadline2',
+    'generalAccountOpeningDate', 'publicBankOpeningDate'
+]
+
+def stage_frame(df, data):
+    """
+    待写入临时表的行：附加 importRow（行索引）及 importSheet/importLine（在原始文件中的位置），
+    数据块处理完后仍可从临时表读回重复行的位置
+    """
+    if readers.ROW_COLUMN in df.columns:
+        sheets = df.loc[data.index, readers.SHEET_COLUMN]
+        lines = df.loc[data.index, readers.ROW_COLUMN]
+    else:
+        sheets = None
+        lines = data.index + 2  # 文件行号从1开始，且有标题行
+    return data.assign(importRow=data.index, importSheet=sheets, importLine=lines)
+
+def import_via_staging(engine, chunks, current_time):
+    """
+    通过会话级临时表导入客户（仅MySQL）
+
+    1. 逐块产出的待导入行依次写入临时表，importRow 记录行索引，importSheet/importLine 记录其在原始文件中的位置
+    2. 在临时表上标记统一社会信用代码、企业名称已存在于 sys_customer 的行
+    3. INSERT ... SELECT 配合 NOT EXISTS 反连接写入 sys_customer 和 sys_service_history
+    4. 读回被标记的行作为重复记录
+
+    全部语句在同一个事务中执行：InnoDB 默认的可重复读隔离级别下，标记和插入语句
+    读取 sys_customer 时对相应的键加共享锁，查重和写入之间不会被其他导入插入相同的键。
+
+    参数:
+        chunks: 产出 (原始数据块, 待导入的行) 的可迭代对象
+
+    返回:
+        (导入数量, 重复记录列表)
+    """
+    code_exists = (
+        "s.unifiedSocialCreditCode IS NOT NULL AND s.unifiedSocialCreditCode != '' AND EXISTS "
+        "(SELECT 1 FROM sys_customer c WHERE c.unifiedSocialCreditCode = s.unifiedSocialCreditCode)"
+    )
+    name_exists = "EXISTS (SELECT 1 FROM sys_customer c WHERE c.companyName = s.companyName)"
+    load_data = db.load_data_enabled(engine)
+
+    with engine.begin() as conn:
+        columns = None
+        staged_count = 0
+        try:
+            for df, data in chunks:
+                if data.empty:
+                    continue
+                if columns is None:
+                    columns = list(data.columns)
+                    column_list = ', '.join(f'`{column}`' for column in columns)
+                    # 临时表只对当前连接可见，创建和删除临时表不会隐式提交事务；
+                    # 附加列和主键在同一条 CREATE TEMPORARY TABLE 中定义（ALTER TABLE 会隐式提交）
+                    conn.execute(text(f"DROP TEMPORARY TABLE IF EXISTS {STAGING_TABLE}"))
+                    conn.execute(text(f"""
+                        CREATE TEMPORARY TABLE {STAGING_TABLE} (
+                            importRow BIGINT NOT NULL,
+                            importSheet VARCHAR(255) NULL,
+                            importLine INT NULL,
+                            codeExists TINYINT NOT NULL DEFAULT 0,
+                            nameExists TINYINT NOT NULL DEFAULT 0,
+                            PRIMARY KEY (importRow)
+                        ) SELECT {column_list} FROM sys_customer LIMIT 0
+                    """))
+                staged = stage_frame(df, data)
+                # 开启 LOAD DATA 时用 LOAD DATA LOCAL INFILE 写入临时表，不可用时分批插入
+                loaded = None
+                if load_data:
+                    loaded = db.load_data_local(conn, STAGING_TABLE, staged)
+                if loaded is None:
+                    db.insert_rows(conn, STAGING_TABLE, staged, batch_size=STAGING_BATCH_SIZE)
+                staged_count += len(staged)
+                del staged
+            if columns is None:
+                return 0, []
+            debug_print(f"已写入临时表 {staged_count} 条记录")
+            
+            # 标记已存在的键
+            conn.execute(text(f"UPDATE {STAGING_TABLE} s SET s.codeExists = ({code_exists}), s.nameExists = ({name_exists})"))
+            
+            # 反连接写入未重复的客户
+            new_rows = f"s.codeExists = 0 AND s.nameExists = 0 AND NOT ({code_exists}) AND NOT ({name_exists})"
+            imported_count = conn.execute(text(f"""
+                INSERT INTO sys_customer ({column_list})
+                SELECT {', '.join(f's.`{column}`' for column in columns)} FROM {STAGING_TABLE} s
+                WHERE {new_rows}
+            """)).rowcount
+            print(f"通过临时表导入 {imported_count} 条客户记录")
+            
+            # 为新导入的客户创建服务历程记录；与客户在同一事务中，失败时整体回滚
+            history_columns = [column for column in history.SERVICE_HISTORY_FIELDS if column in columns]
+            if history_columns:
+                history_list = ', '.join(f'`{column}`' for column in history_columns)
+                history_count = conn.execute(text(f"""
+                    INSERT INTO sys_service_history ({history_list}, createdAt, updatedAt)
+                    SELECT {', '.join(f's.`{column}`' for column in history_columns)}, :now, :now
+                    FROM {STAGING_TABLE} s
+                    WHERE s.codeExists = 0 AND s.nameExists = 0
+                """), {'now': current_time}).rowcount
+                print(f"成功创建 {history_count} 条服务历程记录!")
+            
+            # 读回重复的键
+            rejected = conn.execute(text(f"""
+                SELECT importRow, importSheet, importLine, companyName, unifiedSocialCreditCode, codeExists, nameExists
+                FROM {STAGING_TABLE}
+                WHERE codeExists = 1 OR nameExists = 1
+                ORDER BY importRow
+            """)).fetchall()
+        finally:
+            if columns is not None:
+                conn.execute(text(f"DROP TEMPORARY TABLE IF EXISTS {STAGING_TABLE}"))
+
+    duplicate_records = [
+        duplicate_record(
+            {'sheet': row[1], 'row': row[2]} if row[1] else {'row': row[2]},
+            row[0], row[3], row[4], row[5], row[6]
+        )
+        for row in rejected
+    ]
+    return imported_count, duplicate_records
+
+def map_and_validate(df, read_engine, cache, current_time, verbose=False):
+    """
+    将一个数据块映射到数据库字段并按列验证
+
+    参数:
+        df: 读取到的数据块
+        read_engine: 参考数据（员工名录、业务选项、宗族）查询使用的引擎
+        cache: 批量导入共享的参考数据快照（batch.ReferenceCache），各数据块共用
+        current_time: 写入 createTime/updateTime 的时间
+        verbose: 输出列映射等调试信息（只对第一个数据块输出）
+
+    返回:
+        (db_data, 验证失败记录列表, 有效行掩码 keep)
+    """
+    log = debug_print if verbose else (lambda message: None)
+    
+    # 创建一个新的DataFrame用于导入数据库
+    db_data = pd.DataFrame()
+    
+    # 遍历映射关系，将Excel数据映射到数据库字段
+    for excel_col, db_col in COLUMN_MAPPING.items():
+        if excel_col in df.columns:
+            db_data[db_col] = df[excel_col]
+            log(f"映射列: {excel_col} -> {db_col}")
+        else:
+            log(f"警告: Excel中未找到列 '{excel_col}'")
+            # 全部为空的 category 列每行只占一个字节，写入时为 NULL
+            db_data[db_col] = pd.Series(index=df.index, dtype='category')
+    
+    # 按实测基数把取值种类少的字符串列（归属地、企业类型、所属分局、会计等）转换为 category，
+    # 一直保留到数据库写入；其余列与 df 共享存储，不另外复制
+    compact_columns = [
+        col for col in db_data.columns
+        if col not in KEY_FIELDS and col not in DATE_FIELDS
+    ]
+    chosen = dtypes.compact_strings(db_data, compact_columns)
+    log(f"category 列: {', '.join(chosen) or '无'}")
+    # 只统计列缓冲区，不为一行日志遍历全部对象列
+    log(f"解析后数据内存: {dtypes.memory_mb(df):.1f}MB")
+    
+    # 添加默认值
+    db_data['createTime'] = current_time
+    db_data['updateTime'] = current_time
+    
+    # 字段类型验证规则：字段 -> 允许的值类型（非空字符串字段另行检查长度）
+    date_types = (str, pd.Timestamp, datetime)
+    field_types = {
+        'unifiedSocialCreditCode': (str,),  # 必须是非空字符串
+        'companyName': (str,),  # 必须是非空字符串
+        'establishmentDate': date_types,  # 可以为空或日期
+        'licenseExpiryDate': date_types,  # 可以为空或日期
+        'registeredCapital': (int, float, str),  # 可以为空或数值
+        'capitalContributionDeadline': date_types,  # 可以为空或日期
+        'capitalContributionDeadline2': date_types,  # 可以为空或日期
+        'generalAccountOpeningDate': date_types,  # 可以为空或日期
+        'publicBankOpeningDate': date_types  # 可以为空或日期
+    }
+    non_empty_fields = ('unifiedSocialCreditCode', 'companyName')
+    
+    # 按列验证：每条规则计算一个错误掩码，只为失败的行拼接错误信息
+    errors = validation.RowErrors(db_data.index)
+    
+    # 检查企业名称是否为空（必填字段）
+    errors.add(validation.is_blank(db_data['companyName']), 'companyName', "企业名称不能为空")
+    
+    # 格式验证；日期字段中的字符串需要能解析为日期，已解析的日期列保留到后面直接使用
+    parsed_dates = {}
+    for field, types in field_types.items():
+        column = db_data[field]
+        present = column.notna()
+        if not present.any():
+            continue
+        if field in DATE_FIELDS:
+            strings = present & validation.is_str(column)
+            parsed = validation.to_datetime(column)
+            parsed_dates[field] = parsed
+            bad_dates = strings & parsed.isna()
+            errors.add(bad_dates, field, f"{field}格式错误：'" + column[bad_dates].astype(str) + "'不是有效的日期格式")
+            checked = present & ~strings
+        else:
+            checked = present
+        wrong_type = checked & ~validation.is_instance(column, types)
+        if field in non_empty_fields:
+            wrong_type |= checked & validation.is_blank(column)
+        errors.add(wrong_type, field, f"{field}格式错误：'" + column[wrong_type].astype(str) + "'不符合要求")
+    
+    # 统一社会信用代码（GB 32100）和税号（18位或旧版15位）的长度、字符集和校验位，整列一次计算；
+    # 信用代码不是字符串的行已在上面记录格式错误，不重复校验
+    codes = db_data['unifiedSocialCreditCode']
+    wrong_code, code_reasons = identifiers.uscc_errors(codes.where(validation.is_str(codes)))
+    errors.add(wrong_code, 'unifiedSocialCreditCode', code_reasons)
+    wrong_tax_number, tax_number_reasons = identifiers.tax_number_errors(db_data['taxNumber'])
+    errors.add(wrong_tax_number, 'taxNumber', tax_number_reasons)
+    
+    # 四个身份证号列合并后一次校验长度、字符集、出生日期和校验码，按列登记错误
+    for field, (wrong_id, id_reasons) in identifiers.resident_id_errors(db_data, ID_NUMBER_FIELDS).items():
+        errors.add(wrong_id, field, id_reasons)
+    
+    # 顾问会计、记账会计、开票员需为在职员工：名录规范化后缓存（批量导入共享，每次运行最多查询一次），每列一次 isin
+    name_errors, directory_version = directory.employee_name_errors(
+        db_data, EMPLOYEE_NAME_FIELDS, read_engine, cache=cache, log=debug_print
+    )
+    for field, (unknown, name_reasons) in name_errors.items():
+        errors.add(unknown, field, name_reasons)
+    if directory_version:
+        log(f"会计姓名已按员工名录（版本 {directory_version}）校验")
+    
+    # 枚举字段按业务选项、宗族按宗族名单校验：字典每次运行查询一次（批量导入共享），每列一次 isin；
+    # 同义词（如状态的中文名称）和宗族名称转换为存储的规范值
+    dictionaries = directory.reference_dictionaries(
+        read_engine, [category for category, _ in ENUM_FIELDS.values() if category], cache=cache, log=debug_print
+    )
+    for field, (invalid_option, option_reasons, canonical) in directory.enum_errors(
+        db_data, ENUM_FIELDS, dictionaries, synonyms=ENUM_SYNONYMS
+    ).items():
+        errors.add(invalid_option, field, option_reasons)
+        if isinstance(db_data[field].dtype, pd.CategoricalDtype):
+            canonical = canonical.astype('category')
+        db_data[field] = canonical
+    clans = directory.clan_errors(db_data['clanId'], dictionaries, label='宗族ID')
+    if clans is not None:
+        unknown_clan, clan_reasons, clan_ids = clans
+        errors.add(unknown_clan, 'clanId', clan_reasons)
+        db_data['clanId'] = clan_ids
+    
+    # 收集错误记录；有效行只用掩码 keep 标记，db_data 保持为数据块的唯一一份数据，
+    # 到写入前才按掩码取出一次待导入的行，NaN 在绑定参数时由 db.sql_value 转为 NULL
+    # （db_data 与 df 共享列存储，待导入的行只复制一次，插入参数按批次生成）
+    validation_errors = errors.records(df, db_data, columns=('companyName', 'unifiedSocialCreditCode'))
+    keep = ~errors.invalid
+    
+    # 处理日期字段：整列替换为验证时解析的结果（无效行随后不会写入）
+    for field in DATE_FIELDS:
+        if field in db_data and db_data[field].dtype != 'datetime64[ns]':
+            parsed = parsed_dates.get(field)
+            db_data[field] = parsed if parsed is not None else validation.to_datetime(db_data[field])
+    
+    return db_data, validation_errors, keep
+
+def file_duplicate_errors(df, db_data, keep, first_seen, locations):
+    """
+    文件内重复：统一社会信用代码或企业名称（去除空白后，信用代码不区分大小写）
+    相同的行只导入第一次出现的行，之后的行记为重复并注明第一次出现的位置；无效行不参与比较
+
+    参数:
+        first_seen: {字段: {规范化的键: 第一次出现的行索引}}，跨数据块保留，只包含键
+        locations: 已处理行的位置（readers.RowLocations），用于描述之前数据块中的行
+
+    返回:
+        (重复记录列表, 重复行掩码)
+    """
+    repeated = validation.RowErrors(db_data.index)
+    if keep.any():
+        for field, label, upper in (
+            ('unifiedSocialCreditCode', '统一社会信用代码', True),
+            ('companyName', '企业名称', False),
+        ):
+            keys = validation.normalize_key(db_data[field], upper=upper).where(keep)
+            seen = first_seen[field]
+            # 与之前数据块中的行重复
+            earlier = keys.map(seen) if seen else pd.Series(float('nan'), index=keys.index)
+            in_earlier = earlier.notna()
+            repeated.add(
+                in_earlier, field,
+                earlier[in_earlier].map(lambda first: f"{label}与{locations.label(int(first))}重复")
+            )
+            # 与本数据块中之前的行重复
+            keys = keys.where(~in_earlier)
+            first_rows = validation.duplicate_of(keys)
+            repeated.add(
+                db_data.index.isin(first_rows.index), field,
+                first_rows.map(lambda first: f"{label}与{readers.row_label(df, first)}重复")
+            )
+            # 记录本数据块中第一次出现的键
+            new_keys = keys.dropna().drop_duplicates()
+            seen.update(zip(new_keys.tolist(), new_keys.index.tolist()))
+    records = repeated.records(df, db_data, columns=('companyName', 'unifiedSocialCreditCode'), reason_prefix='文件内重复: ')
+    return records, repeated.invalid
+
+def database_duplicates(df, db_data, keep, engine, read_engine, existing_keys):
+    """
+    查询数据块中有效行的统一社会信用代码和企业名称是否已存在于数据库（批量导入时共享快照）
+
+    返回:
+        (重复记录列表, 重复行的索引)
+    """
+    # 查重只需要键字段：按掩码取出有效行的两列
+    key_data = db_data.loc[keep, list(KEY_FIELDS)]
+    if key_data.empty:
+        return [], key_data.index
+    queried = load_existing_customer_keys(read_engine, existing_keys, key_data)
+    debug_print(f"向数据库查询了 {queried} 个文件中出现的统一社会信用代码和企业名称")
+    
+    # 快照来自只读副本时，在主库上确认副本中不存在的键，避免复制延迟导致重复写入
+    if db.is_replica(read_engine, engine):
+        lagging = confirm_missing_keys_on_primary(engine, existing_keys, key_data)
+        if lagging:
+            print(f"一致性校验: 主库中另有 {lagging} 个统一社会信用代码或企业名称已存在（副本延迟），按重复处理")
+    existing_codes = existing_keys['codes']
+    existing_company_names = existing_keys['names']
+    debug_print(f"已确认存在于数据库的统一社会信用代码 {len(existing_codes)} 个")
+    debug_print(f"已确认存在于数据库的企业名称 {len(existing_company_names)} 个")
+    
+    # 筛选出重复的记录和非重复的记录：按规范化后的键用哈希集合按列判断，只为重复行生成记录
+    codes = key_data['unifiedSocialCreditCode']
+    company_names = key_data['companyName']
+    code_keys = customer_keys(codes, 'unifiedSocialCreditCode')
+    name_keys = customer_keys(company_names, 'companyName')
+    code_duplicate = code_keys.notna() & code_keys.isin(existing_codes)
+    name_duplicate = name_keys.notna() & name_keys.isin(existing_company_names)
+    is_duplicate = code_duplicate | name_duplicate
+    duplicate_index = key_data.index[is_duplicate.to_numpy()]
+    records = [
+        duplicate_record(
+            readers.row_location(df, index), index, company_names.at[index], db.sql_value(codes.at[index]),
+            code_duplicate.at[index], name_duplicate.at[index]
+        )
+        for index in duplicate_index
+    ]
+    return records, duplicate_index
+
+def write_chunk(engine, df, filtered_data, current_time, existing_keys):
+    """
+    写入一个数据块中待导入的行及其服务历程
+
+    开启 LOAD DATA 时整块用 LOAD DATA LOCAL INFILE 导入；不可用或有数据错误时
+    分批多行插入，批次失败时二分定位失败的行，其余行照常提交
+
+    返回:
+        (导入数量, 写入失败记录列表)
+    """
+    # 服务历程从同一份待导入数据整体生成，与客户数据在同一事务中写入
+    service_history_data = history.history_frame(filtered_data, current_time)
+    
+    loaded = None
+    if db.load_data_enabled(engine):
+        try:
+            with engine.begin() as conn:
+                loaded = db.load_data_local(conn, 'sys_customer', filtered_data)
+                if loaded is not None:
+                    history.write_history(conn, service_history_data, load_data=True)
+        except Exception as load_error:
+            print(f"LOAD DATA 导入失败，已回滚，改用分批插入: {db.error_message(load_error)}")
+            loaded = None
+    if loaded is not None:
+        inserted_index, insert_failures = list(filtered_data.index), []
+    else:
+        inserted_index, insert_failures = db.insert_bisecting(
+            engine, 'sys_customer', filtered_data,
+            on_batch=history.batch_writer(service_history_data)
+        )
+    
+    # 写入失败的行逐条记录数据库错误
+    failed_records = []
+    for index, db_error in insert_failures:
+        print(f"{readers.row_label(df, index)}写入失败: {db_error}")
+        failed_records.append({
+            'index': index,
+            **readers.row_location(df, index),  # 来源工作表及行号
+            'companyName': filtered_data.at[index, 'companyName'],
+            'unifiedSocialCreditCode': db.sql_value(filtered_data.at[index, 'unifiedSocialCreditCode']) or '',
+            'field': db.error_column(db_error),
+            'reason': f"数据库写入失败: {db_error}"
+        })
+    
+    # 同步更新参考数据快照，避免同批次后续文件重复导入
+    inserted_keys = filtered_data.loc[inserted_index, list(KEY_FIELDS)]
+    existing_keys['codes'].update(upload_keys(inserted_keys, 'unifiedSocialCreditCode'))
+    existing_keys['names'].update(upload_keys(inserted_keys, 'companyName'))
+    return len(inserted_index), failed_records
+
+@metrics.track('customer_import')
+def import_excel_data(file_path, engine=None, cache=None, read_engine=None, preview=False, staging=False):
+    """
+    导入客户数据文件
+
+    参数:
+        file_path: Excel/CSV文件路径
+        engine: 数据库引擎，批量导入时由调用方传入以复用连接
+        cache: 批量导入共享的参考数据快照（batch.ReferenceCache）
+        read_engine: 参考数据查询使用的只读副本引擎，默认按环境变量 DB_READ_DSN/DB_READ_HOST 创建，未配置时使用主库
+        preview: 只读预览，执行读取、验证和查重后返回预计的变更数量，不写入数据库
+        staging: 暂存表模式，验证通过的行写入临时表后在数据库中查重并批量插入（仅MySQL，预览模式不使用）
+    """
     try:
         debug_print("开始导入Excel数据函数")
         debug_print(f"Python版本: {sys.version}")
         debug_print(f"当前工作目录: {os.getcwd()}")
         debug_print(f"命令行参数: {sys.argv}")
+        run_metrics = metrics.current()
         
-        # 配置数据库连接
-        # 从环境变量获取数据库连接信息
-        DB_HOST = os.environ.get('DB_HOST', '')
-        DB_PORT = os.environ.get('DB_PORT', '')
-        DB_NAME = os.environ.get('DB_DATABASE', '')
-        DB_USER = os.environ.get('DB_USERNAME', '')
-        # 对密码进行 URL 编码，防止特殊字符（如 @）导致连接失败
-        DB_PASS = urllib.parse.quote_plus(os.environ.get('DB_PASSWORD', ''))
-
-        # 输出数据库连接信息（不包含密码）
-        debug_print(f"数据库连接信息: Host={DB_HOST}, Port={DB_PORT}, Name={DB_NAME}, User={DB_USER}")
-
-        # 检查环境变量
-        for key, value in os.environ.items():
-            if key.startswith('DB_'):
-                debug_print(f"环境变量 {key}={'*****' if 'PASSWORD' in key else value}")
-
-        # 验证数据库配置
-        if not DB_NAME or not DB_USER or not DB_PASS:
-            error_msg = "错误: 缺少数据库连接信息，请检查环境变量配置"
-            print(error_msg)
-            error_info = {
-                "success": False,
-                "error_type": "database_connection",
-                "error_message": error_msg,
-                "failed_records": []
-            }
-            print(f"ERROR_INFO_JSON: {json.dumps(error_info)}")
-            return False
-
-        try:
-            # 创建数据库连接
-            connection_string = f'mysql+pymysql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
-            print(f"尝试连接数据库...")
-            debug_print(f"连接字符串(不含密码): mysql+pymysql://{DB_USER}:***@{DB_HOST}:{DB_PORT}/{DB_NAME}")
-            engine = create_engine(connection_string)
-            
-            # 测试连接
-            with engine.connect() as conn:
-                print(f"数据库连接成功")
-        except Exception as e:
-            error_msg = f"数据库连接失败: {str(e)}"
-            print(error_msg)
-            print(f"连接字符串(不含密码): mysql+pymysql://{DB_USER}:***@{DB_HOST}:{DB_PORT}/{DB_NAME}")
-            traceback.print_exc()
-            error_info = {
-                "success": False,
-                "error_type": "database_connection",
-                "error_message": error_msg,
-                "failed_records": []
-            }
-            print(f"ERROR_INFO_JSON: {json.dumps(error_info)}")
-            return False
+        # 配置数据库连接（批量导入时复用调用方传入的引擎）
+        if engine is None:
+            engine = db.create_engine_from_env()
+            if engine is None:
+                return False
+        if read_engine is None:
+            read_engine = db.create_read_engine_from_env(engine)
+        if preview:
+            # 预览模式只读：查询逐条自动提交，不开启写事务、不持有锁
+            engine, read_engine = db.preview_engines(engine, read_engine)
+        if staging and (preview or engine.dialect.name != 'mysql'):
+            if not preview:
+                print("暂存表模式仅支持MySQL，改用常规导入")
+            staging = False
+        run_metrics.attach_engine(engine)
+        if db.is_replica(read_engine, engine):
+            run_metrics.attach_engine(read_engine)
 
         # 读取Excel文件
+        run_metrics.stage('read')
         print(f"开始读取文件: {file_path}")
         debug_print(f"尝试读取文件: {file_path}")
         debug_print(f"文件是否存在: {os.path.exists(file_path)}")
@@ -102,18 +708,19 @@ def import_excel_data(file_path):
 
         try:
             # 根据文件扩展名选择不同的读取方式
-            file_ext = os.path.splitext(file_path)[1].lower()
+            file_ext = readers.data_extension(file_path)  # 压缩文件取内层文件的格式
             print(f"文件扩展名: {file_ext}")
             
             if file_ext == '.csv':
                 # 读取CSV文件
                 print(f"检测到CSV文件，使用pandas.read_csv读取")
                 try:
-                    df = pd.read_csv(file_path, encoding='utf-8')
+                    df = pd.read_csv(readers.open_csv(file_path), encoding='utf-8', usecols=readers.column_filter(COLUMN_MAPPING))
                     # 尝试不同的编码方式（如果UTF-8失败）
                     if df.empty or len(df.columns) == 0:
                         print("UTF-8编码读取失败，尝试使用GBK编码读取CSV文件")
-                        df = pd.read_csv(file_path, encoding='gbk')
+                        df = pd.read_csv(readers.open_csv(file_path), encoding='gbk', usecols=readers.column_filter(COLUMN_MAPPING))
+                    chunks = [df]
                 except Exception as e:
                     error_msg = f"CSV文件读取失败: {str(e)}"
                     print(error_msg)
@@ -133,11 +740,22 @@ def import_excel_data(file_path):
                     }
                     print(f"ERROR_INFO_JSON: {json.dumps(error_info)}")
                     raise Exception(f"CSV文件读取失败: {str(e)}")
+            elif file_ext in readers.COLUMNAR_EXTENSIONS:
+                # 读取Parquet/Arrow列式文件，保留原始列类型
+                print(f"检测到列式文件，使用pyarrow读取")
+                chunks = [readers.read_columnar(file_path, extension=file_ext, columns=list(COLUMN_MAPPING))]
             else:
                 # 读取Excel文件
-                print(f"检测到Excel文件，使用pandas.read_excel读取")
+                print(f"检测到Excel文件，读取全部工作表")
                 try:
-                    df = pd.read_excel(file_path, engine='openpyxl')
+                    if file_ext == '.xlsx':
+                        # 逐块流式读取（较小的多工作表文件并行解析）；先取出第一个数据块，
+                        # 使文件格式错误在这里按读取错误报告
+                        stream = readers.iter_xlsx(file_path, key_column='企业名称', columns=COLUMN_MAPPING)
+                        first_chunk = next(stream, None)
+                        chunks = itertools.chain([] if first_chunk is None else [first_chunk], stream)
+                    else:
+                        chunks = [readers.read_excel_sheets(file_path, key_column='企业名称', columns=COLUMN_MAPPING)]
                 except Exception as e:
                     error_msg = f"Excel文件读取失败: {str(e)}"
                     print(error_msg)
@@ -157,349 +775,133 @@ def import_excel_data(file_path):
                     print(f"ERROR_INFO_JSON: {json.dumps(error_info)}")
                     raise Exception(f"Excel文件读取失败: {str(e)}")
             
-            print(f"成功读取文件，包含 {len(df)} 行数据")
-            
-            # 显示前几行数据以检查
-            print("数据预览:")
-            print(df.head())
-            
-            # 获取列名
-            debug_print("Excel列名: " + ", ".join(df.columns.tolist()))
-            
-            # 创建一个新的DataFrame用于导入数据库
-            db_data = pd.DataFrame()
+            chunks = readers.indexed_chunks(chunks)
             
-            # 根据实体定义创建完整的映射关系
-            column_mapping = {
-                '企业名称': 'companyName',
-                '归属地': 'location',
-                '顾问会计': 'consultantAccountant',
-                '记账会计': 'bookkeepingAccountant',
-                '开票员': 'invoiceOfficer',
-                '企业类型': 'enterpriseType',
-                '统一社会信用代码': 'unifiedSocialCreditCode',
-                '税号': 'taxNumber',
-                '注册地址': 'registeredAddress',
-                '实际经营地址': 'businessAddress',
-                '所属分局': 'taxBureau',
-                '实际负责人(备注)': 'actualResponsibleRemark',
-                '宗族ID': 'clanId',
-                '老板画像': 'bossProfile',
-                '企业画像': 'enterpriseProfile',
-                '行业大类': 'industryCategory',
-                '行业细分': 'industrySubcategory',
-                '是否有税收优惠': 'hasTaxBenefits',
-                '工商公示密码': 'businessPublicationPassword',
-                '成立日期': 'establishmentDate',
-                '营业执照期限': 'licenseExpiryDate',
-                '注册资金': 'registeredCapital',
-                '认缴到期日期': 'capitalContributionDeadline',
-                '认缴到期日期2': 'capitalContributionDeadline2',
-                '对公开户行': 'publicBank',
-                '开户行账号': 'bankAccountNumber',
-                '基本存款账户编号': 'basicDepositAccountNumber',
-                '一般户开户行': 'generalAccountBank',
-                '一般户账号': 'generalAccountNumber',
-                '一般户开户时间': 'generalAccountOpeningDate',
-                '对公开户时间': 'publicBankOpeningDate',
-                '网银托管档案号': 'onlineBankingArchiveNumber',
-                '报税登录方式': 'taxReportLoginMethod',
-                '法人姓名': 'legalRepresentativeName',
-                '法人电话': 'legalRepresentativePhone',
-                '法人电话2': 'legalRepresentativePhone2',
-                '法人身份证号': 'legalRepresentativeId',
-                '法人税务密码': 'legalRepresentativeTaxPassword',
-                '办税员': 'taxOfficerName',
-                '办税员电话': 'taxOfficerPhone',
-                '办税员身份证号': 'taxOfficerId',
-                '办税员税务密码': 'taxOfficerTaxPassword',
-                '开票软件': 'invoicingSoftware',
-                '开票注意事项': 'invoicingNotes',
-                '开票员姓名': 'invoiceOfficerName',
-                '开票员电话': 'invoiceOfficerPhone',
-                '开票员身份证号': 'invoiceOfficerId',
-                '开票员税务密码': 'invoiceOfficerTaxPassword',
-                '财务负责人': 'financialContactName',
-                '财务负责人电话': 'financialContactPhone',
-                '财务负责人身份证号': 'financialContactId',
-                '财务负责人税务密码': 'financialContactTaxPassword',
-                '税种': 'taxCategories',
-                '社保险种': 'socialInsuranceTypes',
-                '参保人员': 'insuredPersonnel',
-                '三方协议扣款账户': 'tripartiteAgreementAccount',
-                '实名密码': 'realNamePassword',
-                '网报密码': 'netReportPassword',
-                '个税申报人员': 'personalIncomeTaxStaff',
-                '纸质资料档案编号': 'paperArchiveNumber',
-                '网银托管存放编号': 'onlineBankingStorageNumber',
-                '档案存放备注': 'archiveStorageRemarks',
-                '章存放编号': 'sealStorageNumber',
-                '企业状态': 'enterpriseStatus',
-                '客户分级': 'customerLevel',
-                '业务状态': 'businessStatus',
-                '客户群': 'customerGroup',
-                '客户群备注': 'customerGroupRemark',
-                '维护代理端': 'maintenanceAgent',
-                '维护代理端备注': 'maintenanceAgentRemark',
-                '记账软件': 'accountingSoftware',
-                '记账软件备注': 'accountingSoftwareRemark',
-                '备注信息': 'remarks'
-            }
-            
-            # 遍历映射关系，将Excel数据映射到数据库字段
-            for excel_col, db_col in column_mapping.items():
-                if excel_col in df.columns:
-                    db_data[db_col] = df[excel_col]
-                    debug_print(f"映射列: {excel_col} -> {db_col}")
-                else:
-                    debug_print(f"警告: Excel中未找到列 '{excel_col}'")
-                    db_data[db_col] = None
-            
-            # 添加默认值
+            # 逐块处理：每个数据块依次映射、验证、查重和写入，处理完即释放。
+            # 跨数据块只保留查重用的键（first_seen、数据库键快照）、每行的位置（每行6字节）
+            # 以及失败记录的数量和示例，失败记录逐块写入报告文件
             current_time = datetime.now()
-            db_data['createTime'] = current_time
-            db_data['updateTime'] = current_time
-            
-            # 检查和收集数据验证错误
-            validation_errors = []
-            valid_records = []
+            if cache is None:
+                cache = batch.ReferenceCache()
+            # 暂存表模式在写入时由数据库查重
+            existing_keys = None if staging else cache.get('customer_keys', new_customer_key_snapshot)
+            first_seen = {field: {} for field in KEY_FIELDS}
+            locations = readers.RowLocations()
+            failures = reports.FailureCollector('customer_import', REPORT_KEY_COLUMNS, record_fields=REPORT_RECORD_FIELDS)
+            counts = {'validation': 0, 'duplicates': 0, 'inserts': 0}
             
-            # 定义日期字段列表
-            date_fields = [
-                'establishmentDate', 'licenseExpiryDate', 
-                'capitalContributionDeadline', 'capitalContributionDeadline2',
-                'generalAccountOpeningDate', 'publicBankOpeningDate'
-            ]
-            
-            # 字段类型验证规则
-            field_validators = {
-                'unifiedSocialCreditCode': lambda x: isinstance(x, str) and len(x) > 0,  # 必须是非空字符串
-                'companyName': lambda x: isinstance(x, str) and len(x) > 0,  # 必须是非空字符串
-                'establishmentDate': lambda x: pd.isna(x) or isinstance(x, (str, pd.Timestamp, datetime)),  # 可以为空或日期
-                'licenseExpiryDate': lambda x: pd.isna(x) or isinstance(x, (str, pd.Timestamp, datetime)),  # 可以为空或日期
-                'registeredCapital': lambda x: pd.isna(x) or isinstance(x, (int, float, str)),  # 可以为空或数值
-                'capitalContributionDeadline': lambda x: pd.isna(x) or isinstance(x, (str, pd.Timestamp, datetime)),  # 可以为空或日期
-                'capitalContributionDeadline2': lambda x: pd.isna(x) or isinstance(x, (str, pd.Timestamp, datetime)),  # 可以为空或日期
-                'generalAccountOpeningDate': lambda x: pd.isna(x) or isinstance(x, (str, pd.Timestamp, datetime)),  # 可以为空或日期
-                'publicBankOpeningDate': lambda x: pd.isna(x) or isinstance(x, (str, pd.Timestamp, datetime))  # 可以为空或日期
-            }
-            
-            # 检查每条记录
-            for index, row in db_data.iterrows():
-                row_errors = []
-                
-                # 检查企业名称是否为空（必填字段）
-                if pd.isna(row.get('companyName')) or not row.get('companyName'):
-                    row_errors.append("企业名称不能为空")
-                
-                # 格式验证
-                for field, validator in field_validators.items():
-                    if field in row and not pd.isna(row[field]):
-                        try:
-                            # 日期字段特殊处理
-                            if field in date_fields and isinstance(row[field], str):
-                                try:
-                                    # 尝试转换为日期，但不保存结果
-                                    test_date = pd.to_datetime(row[field])
-                                    if pd.isna(test_date):
-                                        row_errors.append(f"{field}格式错误：'{row[field]}'不是有效的日期格式")
-                                except:
-                                    row_errors.append(f"{field}格式错误：'{row[field]}'不是有效的日期格式")
-                            # 其他字段正常验证
-                            elif not validator(row[field]):
-                                row_errors.append(f"{field}格式错误：'{row[field]}'不符合要求")
-                        except Exception as e:
-                            row_errors.append(f"{field}验证出错：{str(e)}")
-                
-                # 收集此行的所有错误
-                if row_errors:
-                    validation_errors.append({
-                        'index': index,
-                        'row': index + 2,  # Excel行号从1开始，且有标题行
-                        'companyName': row.get('companyName', '未知企业'),
-                        'unifiedSocialCreditCode': row.get('unifiedSocialCreditCode', ''),
-                        'errors': row_errors,
-                        'reason': '数据验证失败: ' + '; '.join(row_errors)
-                    })
-                else:
-                    # 只添加没有错误的记录
-                    valid_records.append(row)
-            
-            # 将有效记录转换为DataFrame
-            if valid_records:
-                db_data = pd.DataFrame(valid_records)
-            else:
-                db_data = pd.DataFrame()
-            
-            # 处理日期字段 - 只对有效记录进行处理
-            if not db_data.empty:
-                # 处理日期字段
-                for field in date_fields:
-                    if field in db_data:
-                        # 确保日期格式正确
-                        if db_data[field].dtype != 'datetime64[ns]':
-                            try:
-                                db_data[field] = pd.to_datetime(db_data[field], errors='coerce')
-                            except:
-                                debug_print(f"警告: 无法将 {field} 转换为日期格式，设置为NULL")
-            
-            # 替换NaN为None(NULL)
-            if not db_data.empty:
-                db_data = db_data.replace({np.nan: None})
-            
-            # 查询数据库中已存在的统一社会信用代码和企业名称
-            existing_codes = []
-            existing_company_names = []
-            try:
-                with engine.connect() as conn:
-                    # 查询统一社会信用代码
-                    result = conn.execute(text("SELECT unifiedSocialCreditCode FROM sys_customer WHERE unifiedSocialCreditCode IS NOT NULL AND unifiedSocialCreditCode != ''"))
-                    existing_codes = [row[0] for row in result if row[0]]
+            def prepared_chunks():
+                """逐块验证和查重，产出 (原始数据块, 待导入的行)"""
+                for number, df in enumerate(chunks):
+                    run_metrics.stage('validate')
+                    run_metrics.rows_read += len(df)
+                    locations.extend(df)
+                    if number == 0:
+                        # 显示前几行数据以检查
+                        print("数据预览:")
+                        print(df.head())
+                        debug_print("Excel列名: " + ", ".join(df.columns.tolist()))
                     
-                    # 查询企业名称
-                    result = conn.execute(text("SELECT companyName FROM sys_customer WHERE companyName IS NOT NULL AND companyName != ''"))
-                    existing_company_names = [row[0] for row in result if row[0]]
-            except Exception as e:
-                debug_print(f"查询数据库失败: {str(e)}")
-                print(f"查询数据库失败: {str(e)}")
-            
-            debug_print(f"数据库中已存在 {len(existing_codes)} 个统一社会信用代码记录")
-            debug_print(f"数据库中已存在 {len(existing_company_names)} 个企业名称记录")
-            
-            # 筛选出重复的记录和非重复的记录
-            duplicate_records = []
-            non_duplicate_records = []
-            
-            if not db_data.empty:
-                for index, row in db_data.iterrows():
-                    code = row.get('unifiedSocialCreditCode')
-                    company_name = row.get('companyName', '')
-                    is_duplicate = False
-                    duplicate_reason = ''
+                    db_data, validation_errors, keep = map_and_validate(df, read_engine, cache, current_time, verbose=number == 0)
+                    duplicate_records, repeated = file_duplicate_errors(df, db_data, keep, first_seen, locations)
+                    if duplicate_records:
+                        print(f"发现 {len(duplicate_records)} 条文件内重复记录，只导入第一次出现的行")
+                        keep &= ~repeated
                     
-                    # 检查统一社会信用代码是否重复
-                    if code and not pd.isna(code) and code in existing_codes:
-                        is_duplicate = True
-                        duplicate_reason = '统一社会信用代码重复'
+                    # 查询数据库中已存在的统一社会信用代码和企业名称
+                    if not staging:
+                        run_metrics.stage('lookup')
+                        db_duplicates, duplicate_index = database_duplicates(df, db_data, keep, engine, read_engine, existing_keys)
+                        duplicate_records += db_duplicates
+                        keep[duplicate_index] = False
                     
-                    # 检查企业名称是否重复
-                    if company_name and not pd.isna(company_name) and company_name in existing_company_names:
-                        is_duplicate = True
-                        if duplicate_reason:
-                            duplicate_reason += '，企业名称重复'
-                        else:
-                            duplicate_reason = '企业名称重复'
+                    # 按掩码取出一次待导入的行（在此之前只复制过键字段），全部有效时直接使用 db_data
+                    filtered_data = db_data if keep.all() else db_data[keep]
                     
-                    if is_duplicate:
-                        duplicate_records.append({
-                            'index': index,
-                            'row': index + 2,  # Excel行号从1开始，且有标题行
-                            'companyName': company_name if not pd.isna(company_name) else '',
-                            'unifiedSocialCreditCode': code if code and not pd.isna(code) else '',
-                            'reason': duplicate_reason
-                        })
-                    else:
-                        non_duplicate_records.append(row)
-            
-            # 转换非重复记录为DataFrame
-            filtered_data = pd.DataFrame(non_duplicate_records) if non_duplicate_records else pd.DataFrame()
-            
-            # 输出重复记录信息
-            if duplicate_records:
-                debug_print(f"发现 {len(duplicate_records)} 条重复的统一社会信用代码记录:")
-                for record in duplicate_records:
-                    debug_print(f"  行 {record['row']}: {record['companyName']} - {record['unifiedSocialCreditCode']}")
+                    # 输出重复记录信息
+                    if duplicate_records:
+                        debug_print(f"发现 {len(duplicate_records)} 条重复的统一社会信用代码记录:")
+                        for record in duplicate_records:
+                            debug_print(f"  行 {record['row']}: {record['companyName']} - {record['unifiedSocialCreditCode']}")
+                    
+                    counts['validation'] += len(validation_errors)
+                    counts['duplicates'] += len(duplicate_records)
+                    counts['inserts'] += len(filtered_data)
+                    failures.add(df, validation_errors + duplicate_records)
+                    print(f"数据块 {number + 1}: 读取 {len(df)} 行，准备导入 {len(filtered_data)} 条非重复记录，"
+                          f"无效 {len(validation_errors) + len(duplicate_records)} 条")
+                    if not preview:
+                        run_metrics.stage('write')
+                    yield df, filtered_data
             
-            # 合并所有错误记录
-            failed_records = validation_errors + duplicate_records
+            success = True
+            error_message = ""
+            imported_count = 0
             
-            # 输出准备导入的数据
-            print(f"准备导入 {len(filtered_data)} 条非重复记录到数据库")
-            print(f"发现 {len(failed_records)} 条无效记录")
+            # 预览模式：返回预计的变更数量，不写入数据库
+            if preview:
+                for _ in prepared_chunks():
+                    pass
+                run_metrics.stage('report')
+                report_path = failures.close()
+                result = {
+                    'success': True,
+                    'preview': True,
+                    'imported_count': 0,
+                    'projected': reports.projected_counts(
+                        inserts=counts['inserts'],
+                        duplicates=counts['duplicates'],
+                        validation_failures=counts['validation']
+                    ),
+                    **failures.summary(report_path),
+                    'duplicate_count': counts['duplicates'],
+                    'error_message': ''
+                }
+                run_metrics.rows_failed = result['failed_count']
+                print(f"成功读取文件，包含 {run_metrics.rows_read} 行数据")
+                print(f"预览完成: 预计新增 {counts['inserts']} 条，重复 {counts['duplicates']} 条，验证失败 {counts['validation']} 条")
+                print(f"IMPORT_RESULT_JSON: {json.dumps(result, ensure_ascii=False)}")
+                return result
             
             # 导入过滤后的数据
-            success = True
-            error_message = ""
-            if filtered_data.empty:
-                print("没有可导入的非重复记录")
+            if staging:
+                try:
+                    imported_count, staged_duplicates = import_via_staging(engine, prepared_chunks(), current_time)
+                    counts['duplicates'] += len(staged_duplicates)
+                    failures.add(None, staged_duplicates)
+                    print(f"数据库查重发现 {len(staged_duplicates)} 条重复记录")
+                except Exception as e:
+                    success = False
+                    error_message = str(e)
+                    imported_count = 0
+                    print(f"通过临时表导入失败，已回滚: {error_message}")
+                    traceback.print_exc()
+                    error_info = {
+                        "success": False,
+                        "error_type": "database_insert_error",
+                        "error_message": error_message,
+                        "stack_trace": traceback.format_exc()
+                    }
+                    print(f"ERROR_INFO_JSON: {json.dumps(error_info)}")
             else:
                 try:
-                    # 将数据导入到数据库表名为sys_customer
+                    # 将数据逐块导入到数据库表sys_customer，每个数据块单独提交
                     print("开始导入数据到数据库...")
-                    print(f"数据字段列表: {', '.join(filtered_data.columns.tolist())}")
-                    
-                    # 检查数据类型和空值
-                    print("数据类型检查:")
-                    dtypes = filtered_data.dtypes
-                    for col, dtype in dtypes.items():
-                        null_count = filtered_data[col].isna().sum()
-                        print(f"  - {col}: {dtype}, 空值数量: {null_count}")
-                    
-                    try:
-                        # 尝试导入数据
-                        filtered_data.to_sql('sys_customer', engine, if_exists='append', index=False)
-                        print("数据导入成功!")
-                    except Exception as db_error:
-                        success = False
-                        error_message = str(db_error)
-                        print(f"导入数据到数据库失败: {error_message}")
-                        print(f"错误类型: {type(db_error).__name__}")
-                        
-                        # 详细分析错误原因
-                        if "Duplicate entry" in error_message:
-                            print("检测到重复键错误，可能有未过滤的重复记录")
-                        elif "Data too long" in error_message:
-                            print("检测到数据过长错误，某些字段值超出数据库列长度限制")
-                        elif "cannot be null" in error_message.lower() or "not-null" in error_message.lower():
-                            print("检测到空值错误，某些必填字段为空")
-                        
-                        # 提供更详细的堆栈跟踪
-                        print("错误堆栈跟踪:")
-                        traceback.print_exc()
-                        
-                        # 构建并输出错误信息JSON
-                        db_error_info = {
-                            "success": False,
-                            "error_type": "database_insert_error",
-                            "error_message": error_message,
-                            "stack_trace": traceback.format_exc()
-                        }
-                        print(f"DATABASE_ERROR_JSON: {json.dumps(db_error_info)}")
-                        raise  # 重新抛出异常，中止流程
-                    
-                    # 为新导入的客户创建服务历程记录
-                    print("开始创建服务历程记录...")
-                    
-                    # 提取服务历程需要的字段
-                    service_history_fields = [
-                        'companyName', 'unifiedSocialCreditCode', 
-                        'consultantAccountant', 'bookkeepingAccountant', 
-                        'invoiceOfficer', 'enterpriseStatus', 'businessStatus'
-                    ]
-                    
-                    # 创建服务历程数据
-                    service_history_data = filtered_data[
-                        [col for col in service_history_fields if col in filtered_data.columns]
-                    ].copy()
-                    
-                    # 添加创建和更新时间
-                    service_history_data['createdAt'] = current_time
-                    service_history_data['updatedAt'] = current_time
-                    
-                    # 导入服务历程记录
-                    try:
-                        service_history_data.to_sql('sys_service_history', engine, if_exists='append', index=False)
-                        print(f"成功创建 {len(service_history_data)} 条服务历程记录!")
-                    except Exception as sh_error:
-                        print(f"创建服务历程记录失败: {str(sh_error)}")
-                        print("错误类型:", type(sh_error).__name__)
-                        print("错误堆栈跟踪:")
-                        traceback.print_exc()
-                        print("此错误不影响主流程，继续执行")
+                    for df, filtered_data in prepared_chunks():
+                        if filtered_data.empty:
+                            continue
+                        chunk_imported, insert_failures = write_chunk(engine, df, filtered_data, current_time, existing_keys)
+                        imported_count += chunk_imported
+                        failures.add(df, insert_failures)
+                        print(f"数据块写入完成: 成功 {chunk_imported} 条，失败 {len(insert_failures)} 条")
+                    if counts['inserts'] == 0:
+                        print("没有可导入的非重复记录")
+                    print(f"数据导入完成: 成功 {imported_count} 条")
+                    print(f"成功创建 {imported_count} 条服务历程记录!")
                 except Exception as e:
                     success = False
                     error_message = str(e)
-                    print(f"导入数据到数据库失败: {error_message}")
+                    print(f"导入数据到数据库失败: {error_message}（此前的数据块已提交 {imported_count} 条）")
                     print(f"错误类型: {type(e).__name__}")
                     print("错误堆栈跟踪:")
                     traceback.print_exc()
@@ -512,16 +914,24 @@ def import_excel_data(file_path):
                         "stack_trace": traceback.format_exc()
                     }
                     print(f"ERROR_INFO_JSON: {json.dumps(error_info)}")
+            print(f"成功读取文件，包含 {run_metrics.rows_read} 行数据")
+            
+            # 失败记录已逐块写入报告文件，结果中只保留数量、示例和报告路径
+            run_metrics.stage('report')
+            report_path = failures.close()
             
-            # 准备结果对象
+            # 准备结果对象；逐块提交时出错前的数据块已写入，imported_count 为实际提交的数量
             result = {
-                'success': success and len(filtered_data) > 0,
-                'imported_count': len(filtered_data) if success else 0,
-                'failed_count': len(failed_records),
-                'failed_records': failed_records,
+                'success': success and imported_count > 0,
+                'imported_count': imported_count,
+                **failures.summary(report_path),
+                'duplicate_count': counts['duplicates'],
                 'error_message': error_message
             }
             
+            run_metrics.rows_written = result['imported_count']
+            run_metrics.rows_failed = result['failed_count']
+            
             # 输出JSON格式结果，便于Node.js解析
             print(f"IMPORT_RESULT_JSON: {json.dumps(result, ensure_ascii=False)}")
             
@@ -560,12 +970,25 @@ def main():
     try:
         # 创建命令行参数解析器
         parser = argparse.ArgumentParser(description='导入客户Excel数据到数据库')
-        parser.add_argument('--file', type=str, help='Excel文件路径')
+        parser.add_argument('--file', type=str, nargs='+', help='Excel文件路径，可传入多个文件、目录或zip压缩包')
+        parser.add_argument('--preview', action='store_true', help='只读预览：返回预计新增、重复和验证失败数量，不写入数据库')
+        parser.add_argument('--staging', action='store_true', help='暂存表模式：写入临时表后在数据库中查重并批量插入（仅MySQL）')
         args = parser.parse_args()
         
+        # 多个文件、目录或zip压缩包：共享数据库引擎和参考数据快照逐个导入
+        if args.file and batch.is_batch_input(args.file):
+            engine = db.create_engine_from_env()
+            if engine is None:
+                sys.exit(1)
+            read_engine = db.create_read_engine_from_env(engine)
+            cache = batch.ReferenceCache()
+            with batch.collect_input_files(args.file) as files:
+                summary = batch.run_batch(files, lambda path: import_excel_data(path, engine=engine, cache=cache, read_engine=read_engine, preview=args.preview, staging=args.staging))
+            sys.exit(0 if summary['success'] else 1)
+        
         # 获取文件路径
         if args.file:
-            file_path = args.file
+            file_path = args.file[0]
         else:
             error_msg = "错误: 未指定Excel文件路径"
             print(error_msg)
@@ -622,10 +1045,13 @@ def main():
         
         # 导入数据
         print(f"开始导入文件: {file_path}")
-        result = import_excel_data(file_path)
+        result = import_excel_data(file_path, preview=args.preview, staging=args.staging)
         
         # 返回结果状态码
         if result and isinstance(result, dict):
+            # 预览模式只输出预计变更
+            if result.get('preview'):
+                sys.exit(0)
             # 打印导入结果摘要
             if result.get('success'):
                 print(f"导入完成: 成功导入 {result.get('imported_count')} 条记录")
@@ -634,13 +1060,12 @@ def main():
                 sys.exit(0)
             else:
                 # 检查是否所有记录都是因为重复导致的失败（包括企业名称重复和统一社会信用代码重复）
-                failed_records = result.get('failed_records', [])
-                all_duplicates = all(record.get('reason') and '重复' in record.get('reason', '') 
-                                    for record in failed_records) if failed_records else False
+                failed_count = result.get('failed_count', 0)
+                all_duplicates = failed_count > 0 and result.get('duplicate_count', 0) == failed_count
                 
-                if all_duplicates and failed_records:
+                if all_duplicates:
                     # 如果所有失败都是因为重复，我们将以成功状态退出
-                    print(f"所有记录({len(failed_records)}条)均为重复数据，无需导入")
+                    print(f"所有记录({failed_count}条)均为重复数据，无需导入")
                     sys.exit(0)
                 else:
                     # 详细打印失败原因
@@ -649,15 +1074,19 @@ def main():
                         print(f"失败记录详情:")
                         for i, record in enumerate(result['failed_records'][:10]):  # 只显示前10条
                             print(f"  {i+1}. 行 {record.get('row', '?')}: {record.get('companyName', '未知')} - {record.get('reason', '未知原因')}")
-                        if len(result['failed_records']) > 10:
-                            print(f"  ... 以及其他 {len(result['failed_records']) - 10} 条错误记录")
+                        if result.get('failed_count', 0) > 10:
+                            print(f"  ... 以及其他 {result.get('failed_count', 0) - 10} 条错误记录")
+                        if result.get('failed_report_path'):
+                            print(f"完整失败记录见报告: {result['failed_report_path']}")
                     
                     # 输出详细错误信息JSON
                     detailed_error = {
                         "success": False,
                         "error_type": "import_failed",
                         "error_message": result.get('error_message', '导入失败'),
-                        "failed_records": result.get('failed_records', [])
+                        "failed_count": result.get('failed_count', 0),
+                        "failed_records": result.get('failed_records', []),
+                        "failed_report_path": result.get('failed_report_path')
                     }
                     print(f"ERROR_DETAILS_JSON: {json.dumps(detailed_error)}")
                     sys.exit(1)
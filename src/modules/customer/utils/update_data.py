@@ -2,86 +2,101 @@
 # -*- coding: utf-8 -*-
 
 import pandas as pd # type: ignore
-from sqlalchemy import create_engine, text # type: ignore
-import numpy as np # type: ignore
+from sqlalchemy import text # type: ignore
 import os
 from datetime import datetime
 import argparse
 import sys
 import traceback
 import json
-import urllib.parse
+
+# 引入公共导入工具包（位于 src/common/importer）
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../common')))
+from importer import readers, db, batch, reports, metrics, validation, dtypes, history, directory # noqa: E402
 
 # 设置调试模式
 DEBUG = True
 
+# 文件列名 -> 数据库字段：更新只用到企业名称（定位客户）和两个会计字段，读取文件时只解析这些列
+UPDATE_COLUMN_MAPPING = {
+    '企业名称': 'companyName',
+    '顾问会计': 'consultantAccountant',
+    '记账会计': 'bookkeepingAccountant'
+}
+
+# 需为在职员工的姓名字段 -> 错误信息中的字段名称
+EMPLOYEE_NAME_FIELDS = {
+    'consultantAccountant': '顾问会计',
+    'bookkeepingAccountant': '记账会计'
+}
+
+# 失败报告中写入的键字段，原始行的其它列不写入报告
+REPORT_KEY_COLUMNS = ('企业名称',)
+
 def debug_print(message):
     """打印调试信息"""
     if DEBUG:
         print(f"DEBUG: {message}")
 
-def update_excel_data(file_path):
+def confirm_company_ids_on_primary(engine, known_company_ids, file_names):
+    """
+    参考数据来自只读副本时的一致性校验
+
+    副本可能存在复制延迟：按主键确认副本查到的ID在主库中仍对应同一企业名称，
+    并在主库上重新查找副本中不存在的企业名称，结果直接修正 known_company_ids
+    """
+    ids = {known_company_ids[name]: name for name in file_names if name in known_company_ids}
+    primary_names = {
+        row[0]: row[1]
+        for row in db.fetch_in_batches(engine, "SELECT id, companyName FROM sys_customer WHERE id IN ({placeholders})", ids)
+    }
+    changed = [name for record_id, name in ids.items() if primary_names.get(record_id) != name]
+    for name in changed:
+        known_company_ids.pop(name, None)
+
+    missing = [name for name in file_names if name not in known_company_ids]
+    query = "SELECT id, companyName FROM sys_customer WHERE companyName IN ({placeholders})"
+    for row in db.fetch_in_batches(engine, query, missing):
+        known_company_ids[row[1]] = row[0]
+
+    if changed or any(name in known_company_ids for name in missing):
+        print(f"一致性校验: 已按主库数据修正 {len(changed)} 个企业名称映射，补充查找 {len(missing)} 个副本中不存在的企业名称")
+
+@metrics.track('customer_update')
+def update_excel_data(file_path, engine=None, cache=None, read_engine=None, preview=False):
+    """
+    批量更新客户数据
+
+    参数:
+        file_path: Excel/CSV文件路径
+        engine: 数据库引擎，批量导入时由调用方传入以复用连接
+        cache: 批量导入共享的参考数据快照（batch.ReferenceCache）
+        read_engine: 参考数据查询使用的只读副本引擎，默认按环境变量 DB_READ_DSN/DB_READ_HOST 创建，未配置时使用主库
+        preview: 只读预览，执行读取、验证和企业查找后返回预计的变更数量，不写入数据库
+    """
     try:
         debug_print("开始批量更新Excel数据函数")
         debug_print(f"Python版本: {sys.version}")
         debug_print(f"当前工作目录: {os.getcwd()}")
         debug_print(f"命令行参数: {sys.argv}")
+        run_metrics = metrics.current()
         
-        # 配置数据库连接
-        # 从环境变量获取数据库连接信息
-        DB_HOST = os.environ.get('DB_HOST', '')
-        DB_PORT = os.environ.get('DB_PORT', '')
-        DB_NAME = os.environ.get('DB_DATABASE', '')
-        DB_USER = os.environ.get('DB_USERNAME', '')
-        # 对密码进行 URL 编码，防止特殊字符（如 @）导致连接失败
-        DB_PASS = urllib.parse.quote_plus(os.environ.get('DB_PASSWORD', ''))
-
-        # 输出数据库连接信息（不包含密码）
-        debug_print(f"数据库连接信息: Host={DB_HOST}, Port={DB_PORT}, Name={DB_NAME}, User={DB_USER}")
-
-        # 检查环境变量
-        for key, value in os.environ.items():
-            if key.startswith('DB_'):
-                debug_print(f"环境变量 {key}={'*****' if 'PASSWORD' in key else value}")
-
-        # 验证数据库配置
-        if not DB_NAME or not DB_USER or not DB_PASS:
-            error_msg = "错误: 缺少数据库连接信息，请检查环境变量配置"
-            print(error_msg)
-            error_info = {
-                "success": False,
-                "error_type": "database_connection",
-                "error_message": error_msg,
-                "failed_records": []
-            }
-            print(f"ERROR_INFO_JSON: {json.dumps(error_info)}")
-            return False
-
-        try:
-            # 创建数据库连接
-            connection_string = f'mysql+pymysql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
-            print(f"尝试连接数据库...")
-            debug_print(f"连接字符串(不含密码): mysql+pymysql://{DB_USER}:***@{DB_HOST}:{DB_PORT}/{DB_NAME}")
-            engine = create_engine(connection_string)
-            
-            # 测试连接
-            with engine.connect() as conn:
-                print(f"数据库连接成功")
-        except Exception as e:
-            error_msg = f"数据库连接失败: {str(e)}"
-            print(error_msg)
-            print(f"连接字符串(不含密码): mysql+pymysql://{DB_USER}:***@{DB_HOST}:{DB_PORT}/{DB_NAME}")
-            traceback.print_exc()
-            error_info = {
-                "success": False,
-                "error_type": "database_connection",
-                "error_message": error_msg,
-                "failed_records": []
-            }
-            print(f"ERROR_INFO_JSON: {json.dumps(error_info)}")
-            return False
+        # 配置数据库连接（批量导入时复用调用方传入的引擎）
+        if engine is None:
+            engine = db.create_engine_from_env()
+            if engine is None:
+                return False
+        if read_engine is None:
+            read_engine = db.create_read_engine_from_env(engine)
+        if preview:
+            # 预览模式只读：查询逐条自动提交，不开启写事务、不持有锁
+            engine, read_engine = db.preview_engines(engine, read_engine)
+        run_metrics.attach_engine(engine)
+        if db.is_replica(read_engine, engine):
+            run_metrics.attach_engine(read_engine)
 
         # 读取输入文件
+        run_metrics.stage('read')
         print(f"开始读取文件: {file_path}")
         debug_print(f"尝试读取文件: {file_path}")
         debug_print(f"文件是否存在: {os.path.exists(file_path)}")
@@ -102,7 +117,7 @@ def update_excel_data(file_path):
 
         try:
             # 根据文件扩展名选择不同的读取方式
-            file_ext = os.path.splitext(file_path)[1].lower()
+            file_ext = readers.data_extension(file_path)  # 压缩文件取内层文件的格式
             print(f"文件扩展名: {file_ext}")
             
             if file_ext == '.csv':
@@ -121,8 +136,9 @@ def update_excel_data(file_path):
                         print(f"尝试使用 {encoding} 编码读取CSV文件")
                         # 添加参数来处理混合数据类型和性能优化
                         df = pd.read_csv(
-                            file_path, 
+                            readers.open_csv(file_path), 
                             encoding=encoding, 
+                            usecols=readers.column_filter(UPDATE_COLUMN_MAPPING),  # 只解析更新用到的列
                             dtype=str,  # 将所有列都读取为字符串类型，避免混合类型警告
                             low_memory=False,  # 解决 low_memory 警告
                             na_values=['', 'NULL', 'null', 'None', 'none', 'NaN', 'nan'],  # 统一空值处理
@@ -148,12 +164,22 @@ def update_excel_data(file_path):
                     }
                     print(f"ERROR_INFO_JSON: {json.dumps(error_info)}")
                     return False
+            elif file_ext in readers.COLUMNAR_EXTENSIONS:
+                # 读取Parquet/Arrow列式文件，保留原始列类型
+                print(f"检测到列式文件，使用pyarrow读取")
+                df = readers.read_columnar(file_path, extension=file_ext, columns=list(UPDATE_COLUMN_MAPPING))
             else:
                 # 读取Excel文件
-                print(f"检测到Excel文件，使用pandas.read_excel读取")
-                df = pd.read_excel(file_path, engine='openpyxl')
+                print(f"检测到Excel文件，读取全部工作表")
+                if file_ext == '.xlsx':
+                    # 单工作表分块流式读取，不构建整张工作表的原始值列表；多工作表并行解析
+                    df = readers.read_xlsx(file_path, key_column='企业名称', columns=UPDATE_COLUMN_MAPPING)
+                else:
+                    df = readers.read_excel_sheets(file_path, key_column='企业名称', columns=UPDATE_COLUMN_MAPPING)
             
             print(f"成功读取文件，包含 {len(df)} 行数据，{len(df.columns)} 列")
+            run_metrics.rows_read = len(df)
+            run_metrics.stage('validate')
             
             # 检查是否有数据
             if len(df) == 0:
@@ -212,359 +238,222 @@ def update_excel_data(file_path):
                 
             print(f"发现可更新字段: {', '.join(available_update_fields)}")
             
-            # 根据实体定义创建完整的映射关系
-            column_mapping = {
-                '企业名称': 'companyName',
-                '归属地': 'location',
-                '顾问会计': 'consultantAccountant',
-                '记账会计': 'bookkeepingAccountant',
-                '开票员': 'invoiceOfficer',
-                '企业类型': 'enterpriseType',
-                '统一社会信用代码': 'unifiedSocialCreditCode',
-                '税号': 'taxNumber',
-                '注册地址': 'registeredAddress',
-                '实际经营地址': 'businessAddress',
-                '所属分局': 'taxBureau',
-                '实际负责人(备注)': 'actualResponsibleRemark',
-                '宗族ID': 'clanId',
-                '老板画像': 'bossProfile',
-                '企业画像': 'enterpriseProfile',
-                '行业大类': 'industryCategory',
-                '行业细分': 'industrySubcategory',
-                '是否有税收优惠': 'hasTaxBenefits',
-                '工商公示密码': 'businessPublicationPassword',
-                '成立日期': 'establishmentDate',
-                '营业执照期限': 'licenseExpiryDate',
-                '注册资金': 'registeredCapital',
-                '认缴到期日期': 'capitalContributionDeadline',
-                '认缴到期日期2': 'capitalContributionDeadline2',
-                '对公开户行': 'publicBank',
-                '开户行账号': 'bankAccountNumber',
-                '基本存款账户编号': 'basicDepositAccountNumber',
-                '一般户开户行': 'generalAccountBank',
-                '一般户账号': 'generalAccountNumber',
-                '一般户开户时间': 'generalAccountOpeningDate',
-                '对公开户时间': 'publicBankOpeningDate',
-                '网银托管档案号': 'onlineBankingArchiveNumber',
-                '报税登录方式': 'taxReportLoginMethod',
-                '法人姓名': 'legalRepresentativeName',
-                '法人电话': 'legalRepresentativePhone',
-                '法人电话2': 'legalRepresentativePhone2',
-                '法人身份证号': 'legalRepresentativeId',
-                '法人税务密码': 'legalRepresentativeTaxPassword',
-                '办税员': 'taxOfficerName',
-                '办税员电话': 'taxOfficerPhone',
-                '办税员身份证号': 'taxOfficerId',
-                '办税员税务密码': 'taxOfficerTaxPassword',
-                '开票软件': 'invoicingSoftware',
-                '开票注意事项': 'invoicingNotes',
-                '开票员姓名': 'invoiceOfficerName',
-                '开票员电话': 'invoiceOfficerPhone',
-                '开票员身份证号': 'invoiceOfficerId',
-                '开票员税务密码': 'invoiceOfficerTaxPassword',
-                '财务负责人': 'financialContactName',
-                '财务负责人电话': 'financialContactPhone',
-                '财务负责人身份证号': 'financialContactId',
-                '财务负责人税务密码': 'financialContactTaxPassword',
-                '税种': 'taxCategories',
-                '社保险种': 'socialInsuranceTypes',
-                '参保人员': 'insuredPersonnel',
-                '三方协议扣款账户': 'tripartiteAgreementAccount',
-                '实名密码': 'realNamePassword',
-                '网报密码': 'netReportPassword',
-                '个税申报人员': 'personalIncomeTaxStaff',
-                '纸质资料档案编号': 'paperArchiveNumber',
-                '网银托管存放编号': 'onlineBankingStorageNumber',
-                '档案存放备注': 'archiveStorageRemarks',
-                '章存放编号': 'sealStorageNumber',
-                '企业状态': 'enterpriseStatus',
-                '客户分级': 'customerLevel',
-                '业务状态': 'businessStatus',
-                '客户群': 'customerGroup',
-                '客户群备注': 'customerGroupRemark',
-                '维护代理端': 'maintenanceAgent',
-                '维护代理端备注': 'maintenanceAgentRemark',
-                '记账软件': 'accountingSoftware',
-                '记账软件备注': 'accountingSoftwareRemark',
-                '备注信息': 'remarks'
-            }
-            
             # 创建一个新的DataFrame用于更新数据库
             db_data = pd.DataFrame()
             
-            # 遍历映射关系，将Excel数据映射到数据库字段
-            for excel_col, db_col in column_mapping.items():
+            # 遍历映射关系，将文件数据映射到数据库字段（只有更新用到的列）
+            for excel_col, db_col in UPDATE_COLUMN_MAPPING.items():
                 if excel_col in df.columns:
-                    # 复制列数据并清理空值
-                    column_data = df[excel_col].copy()
-                    # 将空字符串和常见的空值表示转换为 None
-                    column_data = column_data.replace(['', 'NULL', 'null', 'None', 'none', 'NaN', 'nan'], None)
+                    # 将空字符串和常见的空值表示转换为 None（replace 返回新列，不修改 df）
+                    column_data = df[excel_col].replace(['', 'NULL', 'null', 'None', 'none', 'NaN', 'nan'], None)
                     # 去除字符串两端的空白
-                    column_data = column_data.apply(lambda x: x.strip() if isinstance(x, str) and x is not None else x)
+                    strings = validation.is_str(column_data)
+                    column_data = column_data.where(~strings, column_data[strings].str.strip())
                     db_data[db_col] = column_data
                     debug_print(f"映射列: {excel_col} -> {db_col}")
                 else:
                     debug_print(f"警告: 文件中未找到列 '{excel_col}'")
-                    db_data[db_col] = None
+                    db_data[db_col] = pd.Series(index=df.index, dtype='category')
             
-            # 验证企业名称是否存在
-            validation_errors = []
-            valid_records = []
+            # 按实测基数把会计列转换为 category（取值种类少时），保留到数据库写入
+            chosen = dtypes.compact_strings(db_data, [col for col in db_data.columns if col != 'companyName'])
+            debug_print(f"category 列: {', '.join(chosen) or '无'}")
             
-            # 定义日期字段列表
-            date_fields = [
-                'establishmentDate', 'licenseExpiryDate', 
-                'capitalContributionDeadline', 'capitalContributionDeadline2',
-                'generalAccountOpeningDate', 'publicBankOpeningDate'
-            ]
+            # 检查企业名称是否为空（更新必须有此字段），用一个掩码拆分出有效记录
+            errors = validation.RowErrors(db_data.index)
+            errors.add(validation.normalize_key(db_data['companyName']).isna(), 'companyName', "企业名称不能为空")
             
-            # 检查每条记录
-            for index, row in db_data.iterrows():
-                row_errors = []
-                
-                # 检查企业名称是否为空（更新必须有此字段）
-                company_name = row.get('companyName')
-                if pd.isna(company_name) or not company_name or str(company_name).strip() == '':
-                    row_errors.append("企业名称不能为空")
-                else:
-                    # 清理企业名称
-                    company_name = str(company_name).strip()
-                
-                # 收集此行的所有错误
-                if row_errors:
-                    validation_errors.append({
-                        'index': index,
-                        'row': index + 2,  # 文件行号从1开始，且有标题行
-                        'companyName': row.get('companyName', '未知企业'),
-                        'unifiedSocialCreditCode': row.get('unifiedSocialCreditCode', ''),
-                        'errors': row_errors,
-                        'reason': '数据验证失败: ' + '; '.join(row_errors)
-                    })
-                else:
-                    # 只添加没有错误的记录
-                    valid_records.append(row)
+            # 会计姓名需为在职员工：名录规范化后缓存（批量导入共享，每次运行最多查询一次），每列一次 isin
+            name_errors, directory_version = directory.employee_name_errors(
+                db_data, EMPLOYEE_NAME_FIELDS, read_engine, cache=cache, log=debug_print
+            )
+            for field, (unknown, name_reasons) in name_errors.items():
+                errors.add(unknown, field, name_reasons)
+            if directory_version:
+                debug_print(f"会计姓名已按员工名录（版本 {directory_version}）校验")
             
-            # 将有效记录转换为DataFrame
-            if valid_records:
-                db_data = pd.DataFrame(valid_records)
-            else:
-                db_data = pd.DataFrame()
-            
-            # 处理日期字段 - 只对有效记录进行处理
-            if not db_data.empty:
-                # 处理日期字段
-                for field in date_fields:
-                    if field in db_data:
-                        # 由于所有数据都是字符串类型，需要更谨慎地处理日期转换
-                        try:
-                            # 先过滤掉空值和无效值
-                            date_series = db_data[field].copy()
-                            # 将空字符串和None值设为pd.NaT
-                            date_series = date_series.replace(['', 'NULL', 'null', 'None', 'none'], None)
-                            # 尝试转换为日期时间
-                            db_data[field] = pd.to_datetime(date_series, errors='coerce', dayfirst=False)
-                            debug_print(f"成功处理日期字段: {field}")
-                        except Exception as e:
-                            debug_print(f"警告: 无法将 {field} 转换为日期格式，设置为NULL: {str(e)}")
-                            db_data[field] = None
-            
-            # 替换NaN为None(NULL)
-            if not db_data.empty:
-                db_data = db_data.replace({np.nan: None})
+            # 有效行只用掩码标记，不复制 db_data；NaN 在绑定参数时由 db.sql_value 转为 NULL
+            validation_errors = errors.records(df, db_data, columns=('companyName', 'unifiedSocialCreditCode'))
+            keep = ~errors.invalid
+            company_names = validation.normalize_key(db_data['companyName']).where(keep)
             
             # 查询数据库中存在的企业名称
+            run_metrics.stage('lookup')
             existing_companies_map = {}
-            not_found_records = []
             
-            if not db_data.empty:
+            # 批量导入时共享已查询到的企业名称与ID映射，只查询尚未查过的企业名称
+            if cache is None:
+                cache = batch.ReferenceCache()
+            known_company_ids = cache.get('customer_ids_by_name', dict)
+            
+            if keep.any():
                 # 获取所有企业名称
-                names_to_check = [
-                    name for name in db_data['companyName'].tolist() 
-                    if name is not None and str(name).strip() != ''
-                ]
+                file_names = set(company_names.dropna())
+                names_to_check = [name for name in file_names if name not in known_company_ids]
                 
-                # 检查这些企业名称是否存在于数据库中
+                # 检查这些企业名称是否存在于数据库中（配置了只读副本时查询副本，参数化查询防止SQL注入）
                 if names_to_check:
-                    # 使用参数化查询防止SQL注入
-                    placeholders = ', '.join([f':name_{i}' for i in range(len(names_to_check))])
-                    query = f"SELECT id, companyName FROM sys_customer WHERE companyName IN ({placeholders})"
-                    
-                    # 构建参数字典
-                    params = {f'name_{i}': name for i, name in enumerate(names_to_check)}
-                    
-                    with engine.connect() as conn:
-                        result = conn.execute(text(query), params)
-                        for row in result:
-                            existing_companies_map[row[1]] = row[0]  # 存储企业名称和对应的ID
+                    query = "SELECT id, companyName FROM sys_customer WHERE companyName IN ({placeholders})"
+                    for row in db.fetch_in_batches(read_engine, query, names_to_check):
+                        known_company_ids[row[1]] = row[0]  # 存储企业名称和对应的ID
+                
+                # 映射来自只读副本时，写入前在主库上校验
+                if db.is_replica(read_engine, engine):
+                    confirm_company_ids_on_primary(engine, known_company_ids, file_names)
+                
+                existing_companies_map = {
+                    name: known_company_ids[name] for name in file_names if name in known_company_ids
+                }
             
             debug_print(f"数据库中找到 {len(existing_companies_map)} 个匹配的企业名称记录")
             
-            # 筛选出存在和不存在的记录
-            records_to_update = []
-            
-            if not db_data.empty:
-                for index, row in db_data.iterrows():
-                    company_name = row.get('companyName')
-                    if company_name and str(company_name).strip() != '':
-                        company_name = str(company_name).strip()
-                        # 检查企业名称是否存在于数据库中
-                        if company_name in existing_companies_map:
-                            # 添加数据库记录ID到行数据中
-                            row_dict = row.to_dict()
-                            row_dict['id'] = existing_companies_map[company_name]
-                            records_to_update.append(row_dict)
-                        else:
-                            not_found_records.append({
-                                'index': index,
-                                'row': index + 2,  # 文件行号从1开始，且有标题行
-                                'companyName': company_name,
-                                'reason': '企业名称在数据库中不存在'
-                            })
-                    else:
-                        not_found_records.append({
-                            'index': index,
-                            'row': index + 2,
-                            'companyName': '企业名称为空',
-                            'reason': '企业名称不能为空'
-                        })
+            # 筛选出存在和不存在的记录：按企业名称整列映射到客户ID，只为未找到的行生成记录
+            customer_ids = company_names.map(existing_companies_map)
+            to_update = keep & customer_ids.notna()
+            not_found_records = [
+                {
+                    'index': index,
+                    **readers.row_location(df, index),  # 来源工作表及行号
+                    'companyName': company_name,
+                    'field': 'companyName',
+                    'reason': '企业名称在数据库中不存在'
+                }
+                for index, company_name in company_names[keep & customer_ids.isna()].items()
+            ]
+            update_index = db_data.index[to_update.to_numpy()]
+            update_count = len(update_index)
             
             # 输出待更新和未找到的记录信息
-            print(f"找到 {len(records_to_update)} 条可更新记录")
+            print(f"找到 {update_count} 条可更新记录")
             print(f"有 {len(not_found_records)} 条记录在数据库中未找到")
             
             # 所有错误记录
             failed_records = validation_errors + not_found_records
             
+            # 预览模式：返回预计的变更数量，不写入数据库
+            if preview:
+                run_metrics.stage('report')
+                report_path = reports.write_failure_report('customer_update', df, failed_records, REPORT_KEY_COLUMNS)
+                result = {
+                    'success': True,
+                    'preview': True,
+                    'updated_count': 0,
+                    'projected': reports.projected_counts(
+                        updates=update_count,
+                        validation_failures=len(validation_errors)
+                    ),
+                    'not_found_count': len(not_found_records),
+                    **reports.summarize_failures(failed_records, report_path),
+                    'error_message': ''
+                }
+                run_metrics.rows_failed = result['failed_count']
+                print(f"预览完成: 预计更新 {update_count} 条，未找到企业 {len(not_found_records)} 条，验证失败 {len(validation_errors)} 条")
+                print(f"UPDATE_RESULT_JSON: {json.dumps(result)}")
+                return result
+            
             # 更新数据库
+            run_metrics.stage('write')
             success = True
             error_message = ""
             updated_count = 0
             
-            if not records_to_update:
+            if not update_count:
                 print("没有可更新的记录")
             else:
                 try:
                     # 添加更新时间
                     current_time = datetime.now()
                     
-                    # 逐条更新记录
+                    # 按更新的字段组合分组（同组的SET子句相同），每组一次 executemany；
+                    # 服务历程在同一事务中批量写入，任一步失败时整体回滚
+                    updated_index = []
                     with engine.connect() as conn:
-                        for record in records_to_update:
-                            record_id = record.pop('id')  # 提取ID并从字典中移除
-                            
-                            # 只更新CSV文件中实际包含的字段
+                        # 只取待更新行的会计列，按列读取值，不逐行生成字典
+                        accountant_fields = [field for field in EMPLOYEE_NAME_FIELDS if field in db_data.columns]
+                        accountants = db_data.loc[update_index, accountant_fields]
+                        groups = {}
+                        for index, record_id, values in zip(
+                            update_index, customer_ids[update_index].astype(int).tolist(),
+                            accountants.itertuples(index=False, name=None)
+                        ):
+                            # 只更新CSV文件中实际包含的字段：顾问会计、记账会计非空时更新
                             update_fields = {}
-                            
-                            # 检查顾问会计字段
-                            if 'consultantAccountant' in record and record['consultantAccountant'] is not None:
-                                consultant = str(record['consultantAccountant']).strip()
-                                if consultant:  # 不为空字符串
-                                    update_fields['consultantAccountant'] = consultant
-                            
-                            # 检查记账会计字段  
-                            if 'bookkeepingAccountant' in record and record['bookkeepingAccountant'] is not None:
-                                bookkeeper = str(record['bookkeepingAccountant']).strip()
-                                if bookkeeper:  # 不为空字符串
-                                    update_fields['bookkeepingAccountant'] = bookkeeper
+                            for field, value in zip(accountant_fields, values):
+                                value = db.sql_value(value)
+                                if value is not None and str(value).strip():
+                                    update_fields[field] = str(value).strip()
                             
                             # 添加更新时间
                             update_fields['updateTime'] = current_time
                             
-                            if not update_fields:  # 如果没有需要更新的字段，跳过此记录
-                                continue
-                                
-                            # 构建SET子句
-                            set_clause = ", ".join([f"{key} = :{key}" for key in update_fields.keys()])
-                            
+                            # 添加ID到参数中，按SET字段组合分组
+                            groups.setdefault(tuple(update_fields), []).append((index, {**update_fields, 'id': record_id}))
+                        
+                        for fields, rows in groups.items():
                             # 构建更新SQL
-                            update_sql = f"UPDATE sys_customer SET {set_clause} WHERE id = :id"
-                            
-                            # 添加ID到参数中
-                            params = {**update_fields, 'id': record_id}
+                            set_clause = ", ".join([f"{key} = :{key}" for key in fields])
+                            update_sql = text(f"UPDATE sys_customer SET {set_clause} WHERE id = :id")
                             
-                            # 执行更新
+                            # 整组在保存点中执行；失败时回滚该组并逐条重试，定位失败的记录，其余记录照常更新
                             try:
-                                conn.execute(text(update_sql), params)
-                                updated_count += 1
+                                with conn.begin_nested():
+                                    conn.execute(update_sql, [params for _, params in rows])
+                                updated_index.extend(index for index, _ in rows)
+                                continue
                             except Exception as e:
-                                print(f"更新记录ID={record_id}时出错: {str(e)}")
-                                failed_records.append({
-                                    'id': record_id,
-                                    'companyName': record.get('companyName', ''),
-                                    'reason': f"更新失败: {str(e)}"
-                                })
+                                print(f"批量更新 {len(rows)} 条记录失败，逐条重试: {db.error_message(e)}")
+                            for index, params in rows:
+                                try:
+                                    with conn.begin_nested():
+                                        conn.execute(update_sql, params)
+                                    updated_index.append(index)
+                                except Exception as e:
+                                    print(f"更新记录ID={params['id']}时出错: {str(e)}")
+                                    failed_records.append({
+                                        'id': params['id'],
+                                        'index': index,
+                                        **readers.row_location(df, index),
+                                        'companyName': company_names.at[index],
+                                        'reason': f"更新失败: {str(e)}"
+                                    })
+                        updated_index.sort()
+                        
+                        # 为更新成功的客户创建服务历程记录（只记录文件中有值的会计字段）
+                        if updated_index:
+                            print("开始创建服务历程记录...")
+                            service_history_data = history.history_frame(
+                                db_data.loc[updated_index], current_time, require_change=True
+                            )
+                            history_count = history.write_history(conn, service_history_data)
+                            print(f"服务历程记录创建完成: {history_count} 条")
                         
                         # 提交事务
                         conn.commit()
                     
+                    updated_count = len(updated_index)
                     print(f"成功更新 {updated_count} 条记录!")
                     
-                    # 为更新的客户创建服务历程记录
-                    if updated_count > 0:
-                        print("开始创建服务历程记录...")
-                        
-                        try:
-                            with engine.connect() as conn:
-                                # 逐一处理每条更新记录
-                                for record in records_to_update:
-                                    # 提取需要的字段（只记录实际更新的字段）
-                                    service_history_fields = {
-                                        'companyName': record.get('companyName'),
-                                        'createdAt': current_time,
-                                        'updatedAt': current_time
-                                    }
-                                    
-                                    # 只添加实际更新的字段到服务历程
-                                    if record.get('consultantAccountant'):
-                                        service_history_fields['consultantAccountant'] = record.get('consultantAccountant')
-                                    if record.get('bookkeepingAccountant'):
-                                        service_history_fields['bookkeepingAccountant'] = record.get('bookkeepingAccountant')
-                                    
-                                    # 移除None值
-                                    service_history_fields = {k: v for k, v in service_history_fields.items() if v is not None}
-                                    
-                                    # 检查是否有关键字段发生变化
-                                    has_key_field = any(key in service_history_fields for key in [
-                                        'consultantAccountant', 'bookkeepingAccountant', 
-                                        'invoiceOfficer', 'enterpriseStatus', 'businessStatus'
-                                    ])
-                                    
-                                    # 只有在包含必要字段且有关键字段更新时才创建记录
-                                    if ('companyName' in service_history_fields or 'unifiedSocialCreditCode' in service_history_fields) and has_key_field:
-                                        # 构建INSERT SQL
-                                        fields = ', '.join(service_history_fields.keys())
-                                        placeholders = ', '.join([f":{key}" for key in service_history_fields.keys()])
-                                        insert_sql = f"INSERT INTO sys_service_history ({fields}) VALUES ({placeholders})"
-                                        
-                                        # 执行插入
-                                        try:
-                                            conn.execute(text(insert_sql), service_history_fields)
-                                        except Exception as e:
-                                            print(f"插入服务历程记录时出错: {str(e)}")
-                                
-                                # 提交事务
-                                conn.commit()
-                                
-                            print("服务历程记录创建完成")
-                        except Exception as sh_error:
-                            print(f"创建服务历程记录失败: {str(sh_error)}")
-                            # 不影响主流程，继续执行
-                    
                 except Exception as e:
                     success = False
                     error_message = str(e)
                     print(f"批量更新数据失败: {error_message}")
                     traceback.print_exc()
             
+            # 失败记录写入报告文件，结果中只保留数量、示例和报告路径
+            run_metrics.stage('report')
+            report_path = reports.write_failure_report('customer_update', df, failed_records, REPORT_KEY_COLUMNS)
+            
             # 准备结果对象
             result = {
                 'success': success and updated_count > 0,
                 'updated_count': updated_count,
-                'failed_count': len(failed_records),
-                'failed_records': failed_records,
+                **reports.summarize_failures(failed_records, report_path),
                 'error_message': error_message
             }
             
+            run_metrics.rows_written = updated_count
+            run_metrics.rows_failed = result['failed_count']
+            
             # 输出JSON格式结果，便于Node.js解析
             print(f"UPDATE_RESULT_JSON: {json.dumps(result)}")
             
@@ -602,27 +491,44 @@ def main():
     try:
         # 创建命令行参数解析器
         parser = argparse.ArgumentParser(description='批量更新客户数据')
-        parser.add_argument('--file', type=str, help='Excel或CSV文件路径')
+        parser.add_argument('--file', type=str, nargs='+', help='Excel或CSV文件路径，可传入多个文件、目录或zip压缩包')
+        parser.add_argument('--preview', action='store_true', help='只读预览：返回预计更新和失败数量，不写入数据库')
         args = parser.parse_args()
         
+        # 多个文件、目录或zip压缩包：共享数据库引擎和参考数据快照逐个更新
+        if args.file and batch.is_batch_input(args.file):
+            engine = db.create_engine_from_env()
+            if engine is None:
+                sys.exit(1)
+            read_engine = db.create_read_engine_from_env(engine)
+            cache = batch.ReferenceCache()
+            with batch.collect_input_files(args.file) as files:
+                summary = batch.run_batch(files, lambda path: update_excel_data(path, engine=engine, cache=cache, read_engine=read_engine, preview=args.preview))
+            sys.exit(0 if summary['success'] else 1)
+        
         # 获取文件路径
         if args.file:
-            file_path = args.file
+            file_path = args.file[0]
         else:
             print("错误: 未指定文件路径")
             sys.exit(1)
         
         # 更新数据
         print(f"开始批量更新文件: {file_path}")
-        result = update_excel_data(file_path)
+        result = update_excel_data(file_path, preview=args.preview)
         
         # 返回结果状态码
         if result and isinstance(result, dict):
+            # 预览模式只输出预计变更
+            if result.get('preview'):
+                sys.exit(0)
             # 打印更新结果摘要
             if result.get('success'):
                 print(f"更新完成: 成功更新 {result.get('updated_count')} 条记录")
                 if result.get('failed_count', 0) > 0:
                     print(f"有 {result.get('failed_count')} 条记录更新失败")
+                    if result.get('failed_report_path'):
+                        print(f"完整失败记录见报告: {result['failed_report_path']}")
                 sys.exit(0)
             else:
                 sys.exit(1)
@@ -104,9 +104,9 @@ export class ExpenseService {
           );
           console.log(`业务查询 - 费用类型: ${trimmedValue} -> ${fieldName}`);
         } else {
-          // 2. 不在费用类型中，查询 business_options 表
+          // 2. 不在费用类型中，查询 business_options 表（只查业务类别，不匹配归属地等客户字段选项）
           const businessOption = await this.businessOptionRepository.findOne({
-            where: { optionValue: trimmedValue },
+            where: { optionValue: trimmedValue, category: In(Object.keys(categoryFieldMapping)) },
           });
 
           if (businessOption) {
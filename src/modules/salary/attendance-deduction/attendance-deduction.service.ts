@@ -203,6 +203,7 @@ export class AttendanceDeductionService {
                 importedCount: resultJson.imported_count,
                 failedCount: resultJson.failed_count,
                 failedRecords: resultJson.failed_records,
+                failedReportPath: resultJson.failed_report_path,
                 warning: resultJson.warning,
                 name_mismatch_details: resultJson.name_mismatch_details,
               });
@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import pandas as pd # type: ignore
-from sqlalchemy import create_engine, text # type: ignore
+from sqlalchemy import text # type: ignore
 import numpy as np # type: ignore
 import os
 from datetime import datetime
@@ -11,11 +11,17 @@ import argparse
 import sys
 import traceback
 import json
-import urllib.parse
+
+# 引入公共导入工具包（位于 src/common/importer）
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../../common')))
+from importer import readers, db, batch, reports, metrics, indexes # noqa: E402
 
 # 设置调试模式
 DEBUG = True
 
+# 失败报告中写入的键字段，原始行的其它列不写入报告
+REPORT_KEY_COLUMNS = ('姓名', '年月')
+
 def debug_print(message):
     """打印调试信息"""
     if DEBUG:
@@ -60,14 +66,14 @@ def validate_date_range(df, date_column):
                     # 检查是否为上个月
                     if year_month != expected_year_month:
                         invalid_records.append({
-                            "row": idx + 2,  # 考虑表头行
+                            **readers.row_location(df, idx),  # 来源工作表及行号
                             "date": year_month,
                             "expected": expected_year_month
                         })
                 except Exception as e:
                     # 日期格式错误也记录
                     invalid_records.append({
-                        "row": idx + 2,
+                        **readers.row_location(df, idx),
                         "date": str(date_value),
                         "expected": expected_year_month,
                         "error": f"日期格式错误: {str(e)}"
@@ -103,6 +109,26 @@ def get_employee_names(engine):
         debug_print(f"查询员工姓名失败: {str(e)}")
         return set()
 
+def confirm_employee_names_on_primary(engine, employee_names, import_names):
+    """
+    参考数据来自只读副本时的一致性校验
+
+    副本可能存在复制延迟，在主库上确认导入文件中副本认为未录入的姓名，
+    主库中已录入的补充到员工姓名快照中
+
+    返回:
+        在主库中补充发现的姓名数量
+    """
+    query = """
+        SELECT DISTINCT name 
+        FROM sys_employees 
+        WHERE (isResigned IS NULL OR isResigned = 0) 
+        AND name IN ({placeholders})
+    """
+    found = {row[0] for row in db.fetch_in_batches(engine, query, import_names - employee_names)}
+    employee_names.update(found)
+    return len(found)
+
 def compare_employee_names(employee_names, import_names):
     """
     对比员工表姓名和导入文件中的姓名
@@ -116,64 +142,43 @@ def compare_employee_names(employee_names, import_names):
     
     return not_in_employee_table, not_in_import_file
 
-def import_attendance_deduction_data(file_path, overwrite_mode=False):
+@metrics.track('attendance_deduction')
+def import_attendance_deduction_data(file_path, overwrite_mode=False, engine=None, cache=None, read_engine=None, preview=False):
+    """
+    导入考勤扣款数据
+
+    参数:
+        file_path: Excel/CSV文件路径
+        overwrite_mode: 是否覆盖相同姓名和年月的现有记录
+        engine: 数据库引擎，批量导入时由调用方传入以复用连接
+        cache: 批量导入共享的参考数据快照（batch.ReferenceCache）
+        read_engine: 参考数据查询使用的只读副本引擎，默认按环境变量 DB_READ_DSN/DB_READ_HOST 创建，未配置时使用主库
+        preview: 只读预览，执行读取和验证后返回预计的变更数量，不写入数据库
+    """
     try:
         debug_print("开始导入考勤扣款数据函数")
         debug_print(f"Python版本: {sys.version}")
         debug_print(f"当前工作目录: {os.getcwd()}")
         debug_print(f"命令行参数: {sys.argv}")
         debug_print(f"覆盖模式: {overwrite_mode}")
+        run_metrics = metrics.current()
         
-        # 配置数据库连接
-        # 从环境变量获取数据库连接信息
-        DB_HOST = os.environ.get('DB_HOST', '')
-        DB_PORT = os.environ.get('DB_PORT', '')
-        DB_NAME = os.environ.get('DB_DATABASE', '')
-        DB_USER = os.environ.get('DB_USERNAME', '')
-        # 对密码进行 URL 编码，防止特殊字符（如 @）导致连接失败
-        DB_PASS = urllib.parse.quote_plus(os.environ.get('DB_PASSWORD', ''))
-
-        # 输出数据库连接信息（不包含密码）
-        debug_print(f"数据库连接信息: Host={DB_HOST}, Port={DB_PORT}, Name={DB_NAME}, User={DB_USER}")
-
-        # 验证数据库配置
-        if not DB_NAME or not DB_USER or not DB_PASS:
-            error_msg = "错误: 缺少数据库连接信息，请检查环境变量配置"
-            print(error_msg)
-            error_info = {
-                "success": False,
-                "error_type": "database_connection",
-                "error_message": error_msg,
-                "failed_records": []
-            }
-            print(f"ERROR_INFO_JSON: {json.dumps(error_info)}")
-            return False
-
-        try:
-            # 创建数据库连接
-            connection_string = f'mysql+pymysql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
-            print(f"尝试连接数据库...")
-            debug_print(f"连接字符串(不含密码): mysql+pymysql://{DB_USER}:***@{DB_HOST}:{DB_PORT}/{DB_NAME}")
-            engine = create_engine(connection_string)
-            
-            # 测试连接
-            with engine.connect() as conn:
-                print(f"数据库连接成功")
-        except Exception as e:
-            error_msg = f"数据库连接失败: {str(e)}"
-            print(error_msg)
-            print(f"连接字符串(不含密码): mysql+pymysql://{DB_USER}:***@{DB_HOST}:{DB_PORT}/{DB_NAME}")
-            traceback.print_exc()
-            error_info = {
-                "success": False,
-                "error_type": "database_connection",
-                "error_message": error_msg,
-                "failed_records": []
-            }
-            print(f"ERROR_INFO_JSON: {json.dumps(error_info)}")
-            return False
+        # 配置数据库连接（批量导入时复用调用方传入的引擎）
+        if engine is None:
+            engine = db.create_engine_from_env()
+            if engine is None:
+                return False
+        if read_engine is None:
+            read_engine = db.create_read_engine_from_env(engine)
+        if preview:
+            # 预览模式只读：查询逐条自动提交，不开启写事务、不持有锁
+            engine, read_engine = db.preview_engines(engine, read_engine)
+        run_metrics.attach_engine(engine)
+        if db.is_replica(read_engine, engine):
+            run_metrics.attach_engine(read_engine)
 
         # 读取Excel文件
+        run_metrics.stage('read')
         print(f"开始读取文件: {file_path}")
         debug_print(f"尝试读取文件: {file_path}")
         debug_print(f"文件是否存在: {os.path.exists(file_path)}")
@@ -194,23 +199,29 @@ def import_attendance_deduction_data(file_path, overwrite_mode=False):
 
         try:
             # 根据文件扩展名选择不同的读取方式
-            file_ext = os.path.splitext(file_path)[1].lower()
+            file_ext = readers.data_extension(file_path)  # 压缩文件取内层文件的格式
             print(f"文件扩展名: {file_ext}")
             
             if file_ext == '.csv':
                 # 读取CSV文件
                 print(f"检测到CSV文件，使用pandas.read_csv读取")
-                df = pd.read_csv(file_path, encoding='utf-8')
+                df = pd.read_csv(readers.open_csv(file_path), encoding='utf-8')
                 # 尝试不同的编码方式（如果UTF-8失败）
                 if df.empty or len(df.columns) == 0:
                     print("尝试使用GBK编码读取CSV文件")
-                    df = pd.read_csv(file_path, encoding='gbk')
+                    df = pd.read_csv(readers.open_csv(file_path), encoding='gbk')
+            elif file_ext in readers.COLUMNAR_EXTENSIONS:
+                # 读取Parquet/Arrow列式文件，保留原始列类型
+                print(f"检测到列式文件，使用pyarrow读取")
+                df = readers.read_columnar(file_path, extension=file_ext)
             else:
                 # 读取Excel文件
-                print(f"检测到Excel文件，使用pandas.read_excel读取")
-                df = pd.read_excel(file_path, engine='openpyxl')
+                print(f"检测到Excel文件，读取全部工作表")
+                df = readers.read_excel_sheets(file_path, key_column='姓名')
             
             print(f"成功读取文件，包含 {len(df)} 行数据")
+            run_metrics.rows_read = len(df)
+            run_metrics.stage('validate')
             
             # 显示前几行数据以检查
             print("数据预览:")
@@ -272,8 +283,17 @@ def import_attendance_deduction_data(file_path, overwrite_mode=False):
             
             debug_print(f"导入文件中包含 {len(import_names)} 个不同的姓名")
             
-            # 查询员工表中的所有在职员工姓名
-            employee_names = get_employee_names(engine)
+            # 查询员工表中的所有在职员工姓名（批量导入时共享快照）
+            run_metrics.stage('lookup')
+            if cache is None:
+                cache = batch.ReferenceCache()
+            employee_names = cache.get('employee_names', lambda: get_employee_names(read_engine))
+            
+            # 姓名快照来自只读副本时，在主库上确认副本中未录入的姓名，避免复制延迟导致新员工被跳过
+            if db.is_replica(read_engine, engine) and import_names:
+                lagging = confirm_employee_names_on_primary(engine, employee_names, import_names)
+                if lagging:
+                    print(f"一致性校验: 主库中另有 {lagging} 个员工已录入（副本延迟）")
             
             # 对比姓名
             not_in_employee_table, not_in_import_file = compare_employee_names(employee_names, import_names)
@@ -326,6 +346,7 @@ def import_attendance_deduction_data(file_path, overwrite_mode=False):
                 debug_print(f"姓名对比详情: 员工表中缺失 {len(not_in_import_file)} 个员工的考勤信息")
             
             # 检查和收集数据验证错误
+            run_metrics.stage('validate')
             validation_errors = []
             valid_records = []
             
@@ -337,10 +358,12 @@ def import_attendance_deduction_data(file_path, overwrite_mode=False):
             # 检查每条记录
             for index, row in db_data.iterrows():
                 row_errors = []
+                row_fields = []  # 出错的列，用于失败报告
                 
                 # 检查姓名是否为空（必填字段）
                 if pd.isna(row.get('name')) or not row.get('name'):
                     row_errors.append("姓名不能为空")
+                    row_fields.append('name')
                 
                 # 检查数值字段
                 for field in numeric_fields:
@@ -350,6 +373,7 @@ def import_attendance_deduction_data(file_path, overwrite_mode=False):
                             row[field] = float(row[field])
                         except:
                             row_errors.append(f"{field}必须是数值类型")
+                            row_fields.append(field)
                 
                 # 处理年月字段
                 if 'yearMonth' in row and not pd.isna(row['yearMonth']):
@@ -359,14 +383,16 @@ def import_attendance_deduction_data(file_path, overwrite_mode=False):
                             row['yearMonth'] = pd.to_datetime(row['yearMonth'])
                     except:
                         row_errors.append(f"年月格式错误：'{row['yearMonth']}'不是有效的日期格式")
+                        row_fields.append('yearMonth')
                 
                 # 收集此行的所有错误
                 if row_errors:
                     validation_errors.append({
                         'index': index,
-                        'row': index + 2,  # Excel行号从1开始，且有标题行
+                        **readers.row_location(df, index),  # 来源工作表及行号
                         'name': row.get('name', '未知姓名'),
                         'errors': row_errors,
+                        'field': ', '.join(row_fields),
                         'reason': '数据验证失败: ' + '; '.join(row_errors)
                     })
                 else:
@@ -387,7 +413,36 @@ def import_attendance_deduction_data(file_path, overwrite_mode=False):
             print(f"准备导入 {len(db_data)} 条记录到数据库")
             print(f"发现 {len(validation_errors)} 条无效记录")
             
+            # 预览模式：返回预计的变更数量，不写入数据库
+            if preview:
+                overwrite_count = 0
+                if overwrite_mode and not db_data.empty:
+                    with engine.connect() as conn:
+                        overwrite_count = indexes.count_existing_months(conn, 'sys_attendance_deduction', 'yearMonth', [
+                            (row['name'], str(row['yearMonth'])[:7])
+                            for _, row in db_data.iterrows() if row['name'] and row['yearMonth']
+                        ])
+                run_metrics.stage('report')
+                report_path = reports.write_failure_report('attendance_deduction', df, validation_errors, REPORT_KEY_COLUMNS)
+                result = {
+                    'success': True,
+                    'preview': True,
+                    'imported_count': 0,
+                    'projected': reports.projected_counts(
+                        inserts=len(db_data),
+                        overwrites=overwrite_count,
+                        validation_failures=len(validation_errors)
+                    ),
+                    **reports.summarize_failures(validation_errors, report_path),
+                    'error_message': ''
+                }
+                run_metrics.rows_failed = result['failed_count']
+                print(f"预览完成: 预计新增 {len(db_data)} 条，覆盖现有 {overwrite_count} 条，验证失败 {len(validation_errors)} 条")
+                print(f"IMPORT_RESULT_JSON: {json.dumps(result)}")
+                return result
+            
             # 导入过滤后的数据
+            run_metrics.stage('write')
             success = True
             error_message = ""
             imported_count = 0
@@ -401,51 +456,49 @@ def import_attendance_deduction_data(file_path, overwrite_mode=False):
                     # 将数据导入到数据库表
                     print("开始导入数据到数据库...")
                     
+                    # 开启 LOAD DATA 时先尝试用 LOAD DATA LOCAL INFILE 整体导入，不可用时分批多行插入
+                    load_data = db.load_data_enabled(engine)
+                    
+                    # 覆盖模式：(name, yearMonth) 有索引时按 (姓名, 年月) 逐对范围删除；
+                    # 没有索引时逐对删除每次都会扫描全表，改为按年月一次性批量删除（LOAD DATA 同样批量删除）
+                    bulk_overwrite = overwrite_mode and (load_data or not indexes.has_index(engine, 'sys_attendance_deduction', ('name', 'yearMonth')))
+                    
                     with engine.begin() as conn:
-                        for index, row in db_data.iterrows():
-                            try:
-                                # 如果是覆盖模式，先删除相同姓名和年月的现有记录
-                                if overwrite_mode and row['name'] and row['yearMonth']:
-                                    # 提取年月信息（YYYY-MM格式）
-                                    year_month_str = str(row['yearMonth'])[:7]  # 提取YYYY-MM部分
-                                    
-                                    delete_sql = text("""
-                                        DELETE FROM sys_attendance_deduction 
-                                        WHERE name = :name 
-                                        AND DATE_FORMAT(yearMonth, '%Y-%m') = :year_month
-                                    """)
-                                    delete_params = {
-                                        'name': row['name'],
-                                        'year_month': year_month_str
-                                    }
-                                    
-                                    result = conn.execute(delete_sql, delete_params)
-                                    deleted_count = result.rowcount
-                                    if deleted_count > 0:
-                                        debug_print(f"删除了 {deleted_count} 条现有记录 (姓名: {row['name']}, 年月: {year_month_str})")
-                                
-                                # 构建插入SQL
-                                insert_sql = text("""
-                                    INSERT INTO sys_attendance_deduction 
-                                    (name, attendanceDeduction, fullAttendanceBonus, yearMonth, remark, createdAt, updatedAt) 
-                                    VALUES (:name, :attendanceDeduction, :fullAttendanceBonus, :yearMonth, :remark, NOW(), NOW())
-                                """)
-                                
-                                # 执行插入
-                                params = {
-                                    'name': row['name'],
-                                    'attendanceDeduction': row.get('attendanceDeduction', 0) or 0,
-                                    'fullAttendanceBonus': row.get('fullAttendanceBonus', 0) or 0,
-                                    'yearMonth': row['yearMonth'],
-                                    'remark': row.get('remark', None)
-                                }
-                                
-                                conn.execute(insert_sql, params)
-                                imported_count += 1
-                                
-                            except Exception as row_error:
-                                print(f"插入第 {index + 1} 行数据失败: {str(row_error)}")
-                                # 继续处理下一行，不中断整个导入过程
+                        # 覆盖删除在插入之前执行，与插入在同一事务中
+                        if overwrite_mode:
+                            name_months = [
+                                (row['name'], str(row['yearMonth'])[:7])
+                                for _, row in db_data.iterrows() if row['name'] and row['yearMonth']
+                            ]
+                            if bulk_overwrite:
+                                deleted_count = indexes.bulk_delete_months(conn, 'sys_attendance_deduction', 'yearMonth', name_months)
+                                debug_print(f"覆盖模式批量删除了 {deleted_count} 条现有记录")
+                            else:
+                                deleted_count = indexes.delete_name_months(conn, 'sys_attendance_deduction', 'yearMonth', name_months)
+                                debug_print(f"覆盖模式按姓名和年月删除了 {deleted_count} 条现有记录")
+                        
+                        insert_frame = db.load_data_frame(db_data, ['name', 'attendanceDeduction', 'fullAttendanceBonus', 'yearMonth', 'remark'], zero_columns=['attendanceDeduction', 'fullAttendanceBonus'])
+                        loaded = None
+                        if load_data:
+                            loaded = db.load_data_local(conn, 'sys_attendance_deduction', insert_frame, now_columns=('createdAt', 'updatedAt'))
+                        if loaded is not None:
+                            imported_count = loaded
+                        else:
+                            # 分批多行插入，每批一个保存点：某批失败时二分定位失败的行并跳过，其余行照常写入
+                            now = datetime.now()
+                            inserted_index, insert_failures = db.insert_bisecting(
+                                engine, 'sys_attendance_deduction', insert_frame.assign(createdAt=now, updatedAt=now), conn=conn
+                            )
+                            imported_count = len(inserted_index)
+                            for index, db_error in insert_failures:
+                                print(f"{readers.row_label(df, index)}写入失败: {db_error}")
+                                validation_errors.append({
+                                    'index': index,
+                                    **readers.row_location(df, index),  # 来源工作表及行号
+                                    'name': db.sql_value(db_data.at[index, 'name']),
+                                    'field': db.error_column(db_error),
+                                    'reason': f"数据库写入失败: {db_error}"
+                                })
                                 
                     print(f"数据导入成功! 共导入 {imported_count} 条记录")
                     
@@ -455,12 +508,15 @@ def import_attendance_deduction_data(file_path, overwrite_mode=False):
                     print(f"导入数据到数据库失败: {error_message}")
                     traceback.print_exc()
             
+            # 失败记录写入报告文件，结果中只保留数量、示例和报告路径
+            run_metrics.stage('report')
+            report_path = reports.write_failure_report('attendance_deduction', df, validation_errors, REPORT_KEY_COLUMNS)
+            
             # 准备结果对象
             result = {
                 'success': success and imported_count > 0,
                 'imported_count': imported_count if success else 0,
-                'failed_count': len(validation_errors),
-                'failed_records': validation_errors,
+                **reports.summarize_failures(validation_errors, report_path),
                 'error_message': error_message
             }
             
@@ -473,10 +529,13 @@ def import_attendance_deduction_data(file_path, overwrite_mode=False):
                         result['error_message'] = "部分员工姓名不匹配，已跳过处理"
                     result['warning'] = f"跳过了 {len(name_mismatch_details['employees_not_recorded'])} 个未录入的员工"
             
+            run_metrics.rows_written = result['imported_count']
+            run_metrics.rows_failed = result['failed_count']
+            
             # 输出JSON格式结果，便于Node.js解析
             print(f"IMPORT_RESULT_JSON: {json.dumps(result)}")
             
-            return success
+            return result if success else False
 
         except Exception as e:
             error_msg = f"处理文件失败: {str(e)}"
@@ -507,12 +566,24 @@ def import_attendance_deduction_data(file_path, overwrite_mode=False):
 def main():
     # 解析命令行参数
     parser = argparse.ArgumentParser(description='导入考勤扣款数据')
-    parser.add_argument('--file', type=str, required=True, help='要导入的CSV或Excel文件路径')
+    parser.add_argument('--file', type=str, nargs='+', required=True, help='要导入的CSV或Excel文件路径，可传入多个文件、目录或zip压缩包')
     parser.add_argument('--overwrite', action='store_true', help='是否覆盖现有数据')
+    parser.add_argument('--preview', action='store_true', help='只读预览：返回预计新增、覆盖和验证失败数量，不写入数据库')
     args = parser.parse_args()
     
+    # 多个文件、目录或zip压缩包：共享数据库引擎和员工姓名快照逐个导入
+    if batch.is_batch_input(args.file):
+        engine = db.create_engine_from_env()
+        if engine is None:
+            sys.exit(1)
+        read_engine = db.create_read_engine_from_env(engine)
+        cache = batch.ReferenceCache()
+        with batch.collect_input_files(args.file) as files:
+            summary = batch.run_batch(files, lambda path: import_attendance_deduction_data(path, args.overwrite, engine=engine, cache=cache, read_engine=read_engine, preview=args.preview))
+        sys.exit(0 if summary['success'] else 1)
+    
     # 执行导入
-    success = import_attendance_deduction_data(args.file, args.overwrite)
+    success = import_attendance_deduction_data(args.file[0], args.overwrite, preview=args.preview)
     
     # 返回结果代码
     sys.exit(0 if success else 1)
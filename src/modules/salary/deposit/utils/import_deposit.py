@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 import numpy as np
 import os
 from datetime import datetime
@@ -10,74 +10,53 @@ import argparse
 import sys
 import traceback
 import json
-import urllib.parse
+
+# 引入公共导入工具包（位于 src/common/importer）
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../../common')))
+from importer import readers, db, batch, reports, metrics, indexes, validation # noqa: E402
 
 # 设置调试模式
 DEBUG = True
 
+# 失败报告中写入的键字段，原始行的其它列不写入报告
+REPORT_KEY_COLUMNS = ('姓名', '扣除日期')
+
 def debug_print(message):
     """打印调试信息"""
     if DEBUG:
         print(f"DEBUG: {message}")
 
-def import_deposit_data(file_path, overwrite_mode=False):
+@metrics.track('deposit')
+def import_deposit_data(file_path, overwrite_mode=False, engine=None, preview=False):
+    """
+    导入保证金数据
+
+    参数:
+        file_path: Excel/CSV文件路径
+        overwrite_mode: 是否覆盖相同姓名和年月的现有记录
+        engine: 数据库引擎，批量导入时由调用方传入以复用连接
+        preview: 只读预览，执行读取和验证后返回预计的变更数量，不写入数据库
+    """
     try:
         debug_print("开始导入保证金数据函数")
         debug_print(f"Python版本: {sys.version}")
         debug_print(f"当前工作目录: {os.getcwd()}")
         debug_print(f"命令行参数: {sys.argv}")
         debug_print(f"覆盖模式: {overwrite_mode}")
+        run_metrics = metrics.current()
         
-        # 配置数据库连接
-        # 从环境变量获取数据库连接信息
-        DB_HOST = os.environ.get('DB_HOST', '')
-        DB_PORT = os.environ.get('DB_PORT', '')
-        DB_NAME = os.environ.get('DB_DATABASE', '')
-        DB_USER = os.environ.get('DB_USERNAME', '')
-        # 对密码进行 URL 编码，防止特殊字符（如 @）导致连接失败
-        DB_PASS = urllib.parse.quote_plus(os.environ.get('DB_PASSWORD', ''))
-
-        # 输出数据库连接信息（不包含密码）
-        debug_print(f"数据库连接信息: Host={DB_HOST}, Port={DB_PORT}, Name={DB_NAME}, User={DB_USER}")
-
-        # 验证数据库配置
-        if not DB_NAME or not DB_USER or not DB_PASS:
-            error_msg = "错误: 缺少数据库连接信息，请检查环境变量配置"
-            print(error_msg)
-            error_info = {
-                "success": False,
-                "error_type": "database_connection",
-                "error_message": error_msg,
-                "failed_records": []
-            }
-            print(f"ERROR_INFO_JSON: {json.dumps(error_info)}")
-            return False
-
-        try:
-            # 创建数据库连接
-            connection_string = f'mysql+pymysql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
-            print(f"尝试连接数据库...")
-            debug_print(f"连接字符串(不含密码): mysql+pymysql://{DB_USER}:***@{DB_HOST}:{DB_PORT}/{DB_NAME}")
-            engine = create_engine(connection_string)
-            
-            # 测试连接
-            with engine.connect() as conn:
-                print(f"数据库连接成功")
-        except Exception as e:
-            error_msg = f"数据库连接失败: {str(e)}"
-            print(error_msg)
-            print(f"连接字符串(不含密码): mysql+pymysql://{DB_USER}:***@{DB_HOST}:{DB_PORT}/{DB_NAME}")
-            traceback.print_exc()
-            error_info = {
-                "success": False,
-                "error_type": "database_connection",
-                "error_message": error_msg,
-                "failed_records": []
-            }
-            print(f"ERROR_INFO_JSON: {json.dumps(error_info)}")
-            return False
+        # 配置数据库连接（批量导入时复用调用方传入的引擎）
+        if engine is None:
+            engine = db.create_engine_from_env()
+            if engine is None:
+                return False
+        if preview:
+            # 预览模式只读：查询逐条自动提交，不开启写事务、不持有锁
+            engine, _ = db.preview_engines(engine)
+        run_metrics.attach_engine(engine)
 
         # 读取Excel文件
+        run_metrics.stage('read')
         print(f"开始读取文件: {file_path}")
         debug_print(f"尝试读取文件: {file_path}")
         debug_print(f"文件是否存在: {os.path.exists(file_path)}")
@@ -98,7 +77,7 @@ def import_deposit_data(file_path, overwrite_mode=False):
 
         try:
             # 根据文件扩展名选择不同的读取方式
-            file_ext = os.path.splitext(file_path)[1].lower()
+            file_ext = readers.data_extension(file_path)  # 压缩文件取内层文件的格式
             if file_ext == '.csv':
                 # 尝试不同的编码方式读取CSV
                 encodings = ['utf-8', 'gbk', 'gb2312', 'gb18030']
@@ -106,7 +85,7 @@ def import_deposit_data(file_path, overwrite_mode=False):
                 
                 for encoding in encodings:
                     try:
-                        df = pd.read_csv(file_path, encoding=encoding)
+                        df = pd.read_csv(readers.open_csv(file_path), encoding=encoding)
                         print(f"成功使用 {encoding} 编码读取CSV文件")
                         break
                     except Exception as e:
@@ -114,10 +93,14 @@ def import_deposit_data(file_path, overwrite_mode=False):
                 
                 if df is None:
                     raise Exception("无法读取CSV文件，尝试了多种编码方式均失败")
+            elif file_ext in readers.COLUMNAR_EXTENSIONS:
+                # 读取Parquet/Arrow列式文件，保留原始列类型
+                df = readers.read_columnar(file_path, extension=file_ext)
             elif file_ext in ['.xlsx', '.xls']:
-                df = pd.read_excel(file_path)
+                # 读取全部工作表，.xls 由 pandas 自动选择引擎
+                df = readers.read_excel_sheets(file_path, key_column='姓名', engine=None)
             else:
-                error_msg = f"不支持的文件格式: {file_ext}，请上传 .csv, .xlsx 或 .xls 文件"
+                error_msg = f"不支持的文件格式: {file_ext}，请上传 .csv, .xlsx, .xls, .parquet 或 .arrow 文件"
                 print(error_msg)
                 error_info = {
                     "success": False,
@@ -142,6 +125,8 @@ def import_deposit_data(file_path, overwrite_mode=False):
 
         # 显示读取到的数据
         print(f"成功读取文件，共 {len(df)} 行数据")
+        run_metrics.rows_read = len(df)
+        run_metrics.stage('validate')
         debug_print(f"数据前5行:\n{df.head()}")
         debug_print(f"列名: {list(df.columns)}")
 
@@ -223,29 +208,28 @@ def import_deposit_data(file_path, overwrite_mode=False):
         
         print(f"时间验证: 当前年月={current_year:04d}-{current_month:02d}, 允许导入的年月={last_month_str}")
         
-        # 验证所有记录的年月
-        invalid_dates = []
-        for index, row in df.iterrows():
-            deduction_date = row.get('扣除日期')
-            if deduction_date:
-                # 提取年月 (YYYY-MM)
-                date_year_month = deduction_date[:7]
-                if date_year_month != last_month_str:
-                    invalid_dates.append({
-                        "row": index + 1,
-                        "name": row.get('姓名', '未知'),
-                        "date": deduction_date,
-                        "year_month": date_year_month
-                    })
+        # 验证所有记录的年月（YYYY-MM），整列一次比较
+        year_months = df['扣除日期'].str[:7]
+        wrong_month = df['扣除日期'].notna() & (year_months != last_month_str)
         
-        # 如果存在不符合要求的日期，返回错误
-        if invalid_dates:
+        # 如果存在不符合要求的日期，返回错误；错误信息中只列出前 SAMPLE_LIMIT 条，另给出总数
+        if wrong_month.any():
             error_msg = f"只能导入上个月数据"
             print(error_msg)
             
+            wrong_index = df.index[wrong_month.to_numpy()]
+            invalid_dates = [
+                {
+                    **readers.row_location(df, index),
+                    "name": df.at[index, '姓名'],
+                    "date": df.at[index, '扣除日期'],
+                    "year_month": year_months.at[index]
+                }
+                for index in wrong_index[:reports.SAMPLE_LIMIT]
+            ]
+            
             # 显示前几条无效记录的详细信息
-            sample_invalid = invalid_dates[:5]
-            print(f"无效日期示例: {sample_invalid}")
+            print(f"无效日期 {len(wrong_index)} 条，示例: {invalid_dates[:5]}")
             
             error_info = {
                 "success": False,
@@ -253,6 +237,8 @@ def import_deposit_data(file_path, overwrite_mode=False):
                 "error_message": error_msg,
                 "allowed_month": last_month_str,
                 "invalid_dates": invalid_dates,
+                "invalid_dates_count": len(wrong_index),
+                "invalid_dates_truncated": len(wrong_index) > len(invalid_dates),
                 "failed_records": []
             }
             print(f"ERROR_INFO_JSON: {json.dumps(error_info, ensure_ascii=False)}")
@@ -261,60 +247,100 @@ def import_deposit_data(file_path, overwrite_mode=False):
         print(f"时间验证通过: 所有记录的日期都是上个月({last_month_str})")
         # ========== 时间验证结束 ==========
         
+        # 按列验证：姓名、扣除日期不能为空，保证金扣除需为数字（空行不再检查金额）；
+        # 预览、覆盖模式的批量删除和写入共用同一个有效行掩码
+        errors = validation.RowErrors(df.index)
+        blank_name = validation.is_blank(df['姓名'])
+        blank_date = df['扣除日期'].isna()
+        errors.add(blank_name, '姓名', "姓名或扣除日期为空")
+        errors.add(blank_date & ~blank_name, '扣除日期', "姓名或扣除日期为空")
+        amounts = pd.to_numeric(df['保证金扣除'], errors='coerce')
+        errors.add(amounts.isna() & ~(blank_name | blank_date), '保证金扣除', "保证金扣除金额格式错误")
+        valid = ~errors.invalid
+        
         # 定义失败记录和成功计数
-        failed_records = []
+        failed_records = [
+            {
+                **readers.row_location(df, record['index']),
+                "index": record['index'],
+                "field": record['field'],
+                "error": record['reason']
+            }
+            for record in errors.records(df, reason_prefix='')
+        ]
         success_count = 0
+        valid_index = df.index[valid.to_numpy()]
+        name_months = list(zip(df.loc[valid_index, '姓名'], year_months[valid_index]))
+        
+        # 预览模式：按写入时的检查统计预计新增和验证失败的记录，不写入数据库
+        if preview:
+            overwrite_count = 0
+            if overwrite_mode and name_months:
+                with engine.connect() as conn:
+                    overwrite_count = indexes.count_existing_months(conn, 'sys_deposit', 'deductionDate', name_months)
+            
+            run_metrics.stage('report')
+            report_path = reports.write_failure_report('deposit', df, failed_records, REPORT_KEY_COLUMNS)
+            result = {
+                "success": True,
+                "preview": True,
+                "total": len(df),
+                "imported": 0,
+                "failed": len(failed_records),
+                "projected": reports.projected_counts(
+                    inserts=len(name_months),
+                    overwrites=overwrite_count,
+                    validation_failures=len(failed_records)
+                ),
+                **reports.summarize_failures(failed_records, report_path)
+            }
+            run_metrics.rows_failed = len(failed_records)
+            print(f"预览完成: 预计新增 {len(name_months)} 条，覆盖现有 {overwrite_count} 条，验证失败 {len(failed_records)} 条")
+            print(f"IMPORT_RESULT_JSON: {json.dumps(result)}")
+            return result
         
         # 开始插入数据
+        run_metrics.stage('write')
         print("开始导入数据到数据库...")
         
+        # 覆盖模式：(name, deductionDate) 有索引时逐行按月份范围删除；
+        # 没有索引时逐行删除每行都会扫描全表，改为插入前按月份一次性批量删除
+        bulk_overwrite = overwrite_mode and not indexes.has_index(engine, 'sys_deposit', ('name', 'deductionDate'))
+        
+        # 只写入验证通过的行；备注列可以不存在
+        remarks = df['备注'] if '备注' in df.columns else pd.Series(None, index=df.index, dtype=object)
+        rows = zip(
+            valid_index, df.loc[valid_index, '姓名'], amounts[valid_index],
+            df.loc[valid_index, '扣除日期'], year_months[valid_index], remarks[valid_index]
+        )
+        
         with engine.begin() as conn:
-            for index, row in df.iterrows():
+            if bulk_overwrite:
+                deleted_count = indexes.bulk_delete_months(conn, 'sys_deposit', 'deductionDate', name_months)
+                debug_print(f"覆盖模式批量删除了 {deleted_count} 条现有记录")
+            
+            for index, name, amount, deduction_date, year_month, remark in rows:
                 try:
-                    # 检查姓名和日期是否为空
-                    if not row['姓名'] or not row['扣除日期']:
-                        failed_records.append({
-                            "row": index + 1,
-                            "data": row.to_dict(),
-                            "error": "姓名或扣除日期为空"
-                        })
-                        continue
-                    
-                    # 格式化保证金金额
-                    amount = 0
-                    try:
-                        amount = float(row['保证金扣除'])
-                    except (ValueError, TypeError):
-                        failed_records.append({
-                            "row": index + 1,
-                            "data": row.to_dict(),
-                            "error": "保证金扣除金额格式错误"
-                        })
-                        continue
-                    
-                    # 处理备注字段
-                    remark = row.get('备注', None)
-                    
-                    # 提取年月信息（YYYY-MM格式）
-                    deduction_date = row['扣除日期']
-                    year_month = deduction_date[:7]  # 提取YYYY-MM部分
-                    
                     # 如果是覆盖模式，先删除相同姓名和年月的现有记录
-                    if overwrite_mode:
+                    if overwrite_mode and not bulk_overwrite:
+                        month_start, month_end = indexes.month_bounds(year_month)
+                        
+                        # 使用范围条件，deductionDate 上的索引可以生效
                         delete_sql = text("""
                             DELETE FROM sys_deposit 
                             WHERE name = :name 
-                            AND DATE_FORMAT(deductionDate, '%Y-%m') = :year_month
+                            AND deductionDate >= :month_start AND deductionDate < :month_end
                         """)
                         delete_params = {
-                            'name': row['姓名'],
-                            'year_month': year_month
+                            'name': name,
+                            'month_start': month_start,
+                            'month_end': month_end
                         }
                         
                         result = conn.execute(delete_sql, delete_params)
                         deleted_count = result.rowcount
                         if deleted_count > 0:
-                            debug_print(f"删除了 {deleted_count} 条现有记录 (姓名: {row['姓名']}, 年月: {year_month})")
+                            debug_print(f"删除了 {deleted_count} 条现有记录 (姓名: {name}, 年月: {year_month})")
                     
                     # 构建插入SQL
                     insert_sql = text("""
@@ -325,10 +351,10 @@ def import_deposit_data(file_path, overwrite_mode=False):
                     
                     # 执行插入
                     params = {
-                        'name': row['姓名'],
-                        'amount': amount,
-                        'deductionDate': row['扣除日期'],
-                        'remark': remark
+                        'name': name,
+                        'amount': float(amount),
+                        'deductionDate': deduction_date,
+                        'remark': db.sql_value(remark)
                     }
                     
                     # 执行插入
@@ -336,27 +362,33 @@ def import_deposit_data(file_path, overwrite_mode=False):
                     success_count += 1
                     
                 except Exception as e:
-                    print(f"插入第 {index+1} 行数据失败: {str(e)}")
+                    print(f"插入{readers.row_label(df, index)}数据失败: {str(e)}")
                     traceback.print_exc()
                     failed_records.append({
-                        "row": index + 1,
-                        "data": row.to_dict(),
+                        **readers.row_location(df, index),
+                        "index": index,
                         "error": str(e)
                     })
         
+        # 失败记录写入报告文件，结果中只保留数量、示例和报告路径
+        run_metrics.stage('report')
+        report_path = reports.write_failure_report('deposit', df, failed_records, REPORT_KEY_COLUMNS)
+        
         # 生成导入结果
         result = {
             "success": True,
             "total": len(df),
             "imported": success_count,
             "failed": len(failed_records),
-            "failed_records": failed_records
+            **reports.summarize_failures(failed_records, report_path)
         }
         
         print(f"导入完成: 总共 {len(df)} 条记录，成功导入 {success_count} 条，失败 {len(failed_records)} 条")
+        run_metrics.rows_written = success_count
+        run_metrics.rows_failed = len(failed_records)
         print(f"IMPORT_RESULT_JSON: {json.dumps(result)}")
         
-        return True
+        return result
         
     except Exception as e:
         error_msg = f"导入过程发生未预期的错误: {str(e)}"
@@ -374,12 +406,22 @@ def import_deposit_data(file_path, overwrite_mode=False):
 def main():
     # 解析命令行参数
     parser = argparse.ArgumentParser(description='导入保证金数据')
-    parser.add_argument('--file', required=True, help='CSV或Excel文件路径')
+    parser.add_argument('--file', nargs='+', required=True, help='CSV或Excel文件路径，可传入多个文件、目录或zip压缩包')
     parser.add_argument('--overwrite', action='store_true', help='如果存在相同姓名和年月的记录，则覆盖')
+    parser.add_argument('--preview', action='store_true', help='只读预览：返回预计新增、覆盖和验证失败数量，不写入数据库')
     args = parser.parse_args()
     
+    # 多个文件、目录或zip压缩包：共享数据库引擎逐个导入
+    if batch.is_batch_input(args.file):
+        engine = db.create_engine_from_env()
+        if engine is None:
+            sys.exit(1)
+        with batch.collect_input_files(args.file) as files:
+            summary = batch.run_batch(files, lambda path: import_deposit_data(path, args.overwrite, engine=engine, preview=args.preview))
+        sys.exit(0 if summary['success'] else 1)
+    
     # 执行导入并根据结果设置退出码
-    success = import_deposit_data(args.file, args.overwrite)
+    success = import_deposit_data(args.file[0], args.overwrite, preview=args.preview)
     if not success:
         sys.exit(1)  # 导入失败，返回非零退出码
     sys.exit(0)  # 导入成功
@@ -289,7 +289,7 @@ export class FriendCirclePaymentService {
 
             // 插入有效数据
             const importedCount = result.data.length;
-            const failedCount = result.failedRecords.length;
+            const failedCount = result.failedCount ?? result.failedRecords.length;
 
             if (importedCount > 0) {
               // 检查是否是覆盖模式 - 从Python脚本结果中获取
@@ -330,6 +330,7 @@ export class FriendCirclePaymentService {
               importedCount,
               failedCount,
               failedRecords: result.failedRecords,
+              failedReportPath: result.failedReportPath,
             });
           } catch (error) {
             // JSON解析失败，可能是Python脚本出错
@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+import os
 import sys
 import json
 import pandas as pd # type: ignore
@@ -7,6 +8,13 @@ from io import BytesIO
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 
+# 引入公共导入工具包（位于 src/common/importer）
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../../common')))
+from importer import readers, reports, metrics # noqa: E402
+
+# 失败报告中写入的键字段，原始行的其它列不写入报告
+REPORT_KEY_COLUMNS = ('姓名', '年月')
+
 def validate_date_range(df, date_column):
     """
     验证数据中的日期是否为上个月
@@ -46,14 +54,14 @@ def validate_date_range(df, date_column):
                     # 检查是否为上个月
                     if year_month != expected_year_month:
                         invalid_records.append({
-                            "row": idx + 2,  # 考虑表头行
+                            **readers.row_location(df, idx),  # 来源工作表及行号
                             "date": year_month,
                             "expected": expected_year_month
                         })
                 except Exception as e:
                     # 日期格式错误也记录
                     invalid_records.append({
-                        "row": idx + 2,
+                        **readers.row_location(df, idx),
                         "date": str(date_value),
                         "expected": expected_year_month,
                         "error": f"日期格式错误: {str(e)}"
@@ -65,20 +73,36 @@ def validate_date_range(df, date_column):
     
     return True, None, []
 
+@metrics.track('friend_circle', log=None)  # 标准输出需保持纯JSON
 def main():
+    run_metrics = metrics.current()
+    run_metrics.stage('read')
+    
     # 从标准输入读取文件内容
     file_content = sys.stdin.buffer.read()
     filename = sys.argv[1] if len(sys.argv) > 1 else ''
     overwrite_mode = '--overwrite' in sys.argv
+    # 只读预览：只返回预计变更数量，不返回有效记录，调用方没有可写入的数据
+    preview = '--preview' in sys.argv
     
     try:
+        # 压缩上传（.gz/.zip）在内存中解压，按内层文件类型处理
+        file_content, filename = readers.decompress_bytes(file_content, filename)
+        
         # 根据文件类型处理
         if filename.lower().endswith('.csv'):
             df = pd.read_csv(BytesIO(file_content))
         elif filename.lower().endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(BytesIO(file_content))
+            # 读取全部工作表，.xls 由 pandas 自动选择引擎
+            df = readers.read_excel_sheets(file_content, key_column="姓名", engine=None, log=None)
+        elif filename.lower().endswith(readers.COLUMNAR_EXTENSIONS):
+            # Parquet/Arrow列式文件，保留原始列类型
+            df = readers.read_columnar(file_content, extension=os.path.splitext(filename)[1].lower())
         else:
-            raise ValueError("不支持的文件格式，仅支持CSV或Excel文件")
+            raise ValueError("不支持的文件格式，仅支持CSV、Excel、Parquet或Arrow文件")
+        
+        run_metrics.rows_read = len(df)
+        run_metrics.stage('validate')
         
         # 替换NaN值为None，这样JSON序列化时会转为null
         df = df.replace({np.nan: None})
@@ -122,6 +146,7 @@ def main():
         for idx, row in df.iterrows():
             record = {}
             errors = []
+            error_fields = []  # 出错的列，用于失败报告
             
             # 处理必填字段
             for original_col, mapped_col in column_mapping.items():
@@ -137,10 +162,12 @@ def main():
                                 record[mapped_col] = False
                             else:
                                 errors.append(f"是否完成格式错误: '{val}'")
+                                error_fields.append(original_col)
                         elif isinstance(val, (int, float)):
                             record[mapped_col] = bool(val)
                         else:
                             errors.append(f"是否完成格式错误: '{val}'")
+                            error_fields.append(original_col)
                     
                     # 处理数值型字段
                     elif mapped_col in ["weekOne", "weekTwo", "weekThree", "weekFour", "totalCount", "payment"]:
@@ -158,6 +185,7 @@ def main():
                                 record[mapped_col] = None
                         except ValueError:
                             errors.append(f"{original_col}格式错误: '{val}'")
+                            error_fields.append(original_col)
                     
                     # 其他字符串字段
                     else:
@@ -181,21 +209,48 @@ def main():
             for field in required_fields:
                 if field not in record or record[field] is None:
                     errors.append(f"缺少必填字段: {field}")
+                    error_fields.append(field)
             
             # 根据验证结果添加到相应列表
             if errors:
                 failed_record = {
-                    "row": idx + 2,  # 考虑表头行，行号从2开始
+                    "index": idx,
+                    **readers.row_location(df, idx),  # 来源工作表及行号
                     "name": record.get("name", "未知"),
                     "errors": errors,
+                    "field": ', '.join(dict.fromkeys(error_fields)),
                     "reason": f"数据验证失败: {', '.join(errors)}"
                 }
                 result["failedRecords"].append(failed_record)
             else:
                 result["data"].append(record)
         
+        # 失败记录写入报告文件，结果中只保留数量、示例和报告路径（标准输出需保持纯JSON）
+        run_metrics.stage('report')
+        failed_records = result.pop("failedRecords")
+        report_path = reports.write_failure_report('friend_circle', df, failed_records, REPORT_KEY_COLUMNS, log=None)
+        summary = reports.summarize_failures(failed_records, report_path)
+        result["failedCount"] = summary["failed_count"]
+        result["failedRecords"] = summary["failed_records"]
+        result["failedRecordsTruncated"] = summary["failed_records_truncated"]
+        result["failedReportPath"] = summary["failed_report_path"]
+        if preview:
+            # 本脚本不连接数据库，覆盖数量由写入数据库的调用方统计
+            result["preview"] = True
+            result["projected"] = reports.projected_counts(
+                inserts=len(result["data"]),
+                validation_failures=len(failed_records)
+            )
+            # 不把有效记录交给调用方，即使调用方未识别 preview 标记也不会写入
+            result["data"] = []
+        
+        # 有效记录交由Node.js写入数据库
+        run_metrics.rows_written = 0 if preview else len(result["data"])
+        run_metrics.rows_failed = len(failed_records)
+        run_metrics.success = True
+        
         # 输出JSON结果
-        print(json.dumps(result, ensure_ascii=False))
+        print(json.dumps(result, ensure_ascii=False, default=str))
         
     except Exception as e:
         error_result = {
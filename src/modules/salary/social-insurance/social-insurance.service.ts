@@ -192,6 +192,7 @@ export class SocialInsuranceService {
             importedCount: resultJson.imported_count || 0,
             failedCount: resultJson.failed_count || 0,
             failedRecords: resultJson.failed_records || [],
+            failedReportPath: resultJson.failed_report_path,
           });
         });
 
@@ -182,6 +182,7 @@ export class SubsidySummaryService {
             importedCount: resultJson.imported_count || 0,
             failedCount: resultJson.failed_count || 0,
             failedRecords: resultJson.failed_records || [],
+            failedReportPath: resultJson.failed_report_path,
           });
         });
 